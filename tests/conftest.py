@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+#------------------------------------------------------------------------------
+# 测试的公共设置。
+#
+# 因子目录在部署时作为 portmgr_Q.factor 包使用。没有安装 portmgr_Q 时，
+# 这里注册一个指向 因子/ 的包：
+#     1) 没有安装 datafeeds 时使用 tests/stubs 下的替身，数据来自 SyntheticDataFeeds，
+#        数据库为sqlite；missingvalue、outliers、standardization 不在 因子/ 中时也用替身；
+#     2) Python 3 下补上因子代码用到的 types.StringType 等名称；
+#     3) 导入完整的 portmgr_Q.factor。导入失败时只注册空包，各模块可以单独导入
+#        （不执行 因子/__init__.py），需要完整包的测试用 requireFactorPackage() 跳过。
+# 设置环境变量 FACTOR_TEST_STUBS=0 时不使用替身。
+#------------------------------------------------------------------------------
+"""
+import os
+import sys
+import types
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FACTOR_PATH = os.path.join(ROOT, u'因子')
+STUBS_PATH = os.path.join(ROOT, 'tests', 'stubs')
+
+#Python 2 的types中因子代码用到的名称
+PY2_TYPE_NAMES = {'StringType': str, 'UnicodeType': type(u''), 'ListType': list, 'TupleType': tuple,
+                  'DictType': dict, 'IntType': int, 'LongType': int, 'FloatType': float,
+                  'BooleanType': bool, 'NoneType': type(None)}
+
+
+def _registerPackage(paths):
+    for name in list(sys.modules):
+        if name == 'portmgr_Q' or name.startswith('portmgr_Q.'):
+            sys.modules.pop(name)
+    package = types.ModuleType('portmgr_Q')
+    package.__path__ = []
+    factor = types.ModuleType('portmgr_Q.factor')
+    factor.__path__ = paths
+    package.factor = factor
+    sys.modules['portmgr_Q'] = package
+    sys.modules['portmgr_Q.factor'] = factor
+
+
+def _importWithStubs():
+    #用 tests/stubs 补齐依赖后导入 因子/__init__.py
+    try:
+        import datafeeds
+    except ImportError:
+        sys.path.insert(0, STUBS_PATH)
+    for name, value in PY2_TYPE_NAMES.items():
+        if not hasattr(types, name):
+            setattr(types, name, value)
+    _registerPackage([FACTOR_PATH, os.path.join(STUBS_PATH, 'factor')])
+    factor = sys.modules['portmgr_Q.factor']
+    factor.__file__ = os.path.join(FACTOR_PATH, '__init__.py')
+    with open(factor.__file__, 'rb') as f:
+        code = compile(f.read(), factor.__file__, 'exec')
+    exec(code, factor.__dict__)
+
+
+try:
+    import portmgr_Q.factor
+    FULL_PACKAGE = True
+except ImportError:
+    FULL_PACKAGE = False
+    if os.environ.get('FACTOR_TEST_STUBS', '1') != '0':
+        try:
+            _importWithStubs()
+            FULL_PACKAGE = True
+        except ImportError:
+            pass
+    if not FULL_PACKAGE:
+        _registerPackage([FACTOR_PATH])
+
+
+def requireFactorPackage():
+    #需要完整的 portmgr_Q.factor（datafeeds 等依赖齐全，或使用 tests/stubs 的替身）时才运行
+    if not FULL_PACKAGE:
+        pytest.skip('portmgr_Q.factor is not available')
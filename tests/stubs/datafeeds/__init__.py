@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+#测试用的 datafeeds 替身：没有安装 datafeeds 时由 conftest 加入 sys.path。
+#DataFeeds 的数据来自 SyntheticDataFeeds，与因子用到的接口相同。
+
+
+class DataFeeds(object):
+    def __init__(self, *args, **kwargs):
+        from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
+        self.feeds = SyntheticDataFeeds(securityCount=20)
+
+    def getDataFeed(self, name):
+        return self.feeds.getDataFeed(name)
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+#datafeeds.utils 的常量，取值只在测试中使用
+
+
+class DateTimeForm(object):
+    strDate, strDateTime, intDate, strIntDate = 1, 2, 3, 4
+    strdate, strdatetime, intdate, strintdate = strDate, strDateTime, intDate, strIntDate
+
+
+class DBType(object):
+    sqlServer, oracle, postGreSql, mongoDB, sqlite = 'sqlserver', 'oracle', 'postgresql', 'mongodb', 'sqlite'
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+
+class SecurityIdForm(object):
+    defaultId = 0
+    securityIdFormScope = [0]
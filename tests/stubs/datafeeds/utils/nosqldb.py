@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+
+class ConnectNoSQLDB(object):
+    pass
+
+
+class ConnectMongoDB(ConnectNoSQLDB):
+    pass
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#datafeeds 的 ConnectDB：只执行拼好的SQL，没有绑定参数和事务接口，每条语句单独提交
+import pandas as pd
+import sqlalchemy
+
+from datafeeds.utils import DBType
+
+
+class ConnectDB(object):
+    def __init__(self, engine=None, dbType=DBType.sqlite):
+        self.engine = engine if engine is not None else sqlalchemy.create_engine('sqlite://')
+        self.dbType = dbType
+
+    def getDBType(self):
+        return self.dbType
+
+    def getDataWithSqlClause(self, sql):
+        with self.engine.connect() as conn:
+            return pd.read_sql(sqlalchemy.text(sql), conn)
+
+    def deleteDataWithSqlClause(self, sql):
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(sql))
+
+    def updateTableToDB(self, tableName, tableNameInDB, dtype=None):
+        tableName.to_sql(tableNameInDB, self.engine, if_exists='append', index=False, dtype=dtype)
+
+    def hasTable(self, tableName):
+        return sqlalchemy.inspect(self.engine).has_table(tableName)
+
+
+class ConnectSqlServer(ConnectDB):
+    pass
+
+
+class ConnectOracle(ConnectDB):
+    pass
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+#测试用的缺失值处理，接口与 portmgr_Q.factor.missingvalue 相同：process({证券: 值}) -> {证券: 值}
+
+
+class BaseMissingValue(object):
+    pass
+
+
+class DeleteMissingValue(BaseMissingValue):
+    def process(self, data):
+        return dict((k, v) for k, v in data.items() if v is not None and v == v)
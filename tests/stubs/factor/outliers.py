@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+#测试用的极值处理，接口与 portmgr_Q.factor.outliers 相同：process({证券: 值}) -> {证券: 值}
+import numpy as np
+
+
+class BaseOutliers(object):
+    pass
+
+
+class KeepOutliers(BaseOutliers):
+    def process(self, data):
+        return data
+
+
+class SigmaMethod(BaseOutliers):
+    #均值±n倍样本标准差之外的值截断到边界
+    def __init__(self, n=3):
+        self.n = n
+
+    def process(self, data):
+        values = np.array(list(data.values()), dtype=np.float64)
+        mean, std = values.mean(), values.std(ddof=1)
+        return dict((k, min(max(v, mean - self.n * std), mean + self.n * std)) for k, v in data.items())
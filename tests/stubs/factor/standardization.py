@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+#测试用的标准化，接口与 portmgr_Q.factor.standardization 相同：process({证券: 值}, direction) -> {证券: 值}
+import numpy as np
+
+
+class BaseStandardization(object):
+    pass
+
+
+class ZScore(BaseStandardization):
+    def process(self, data, direction=1):
+        values = np.array(list(data.values()), dtype=np.float64)
+        mean, std = values.mean(), values.std(ddof=1)
+        return dict((k, direction * (v - mean) / std) for k, v in data.items())
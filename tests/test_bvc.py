@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#bvc 与原来 H_RVdir3.getFactor 中逐行 _getcdf、groupby 求和与标准差的结果一致
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('scipy')
+from scipy.stats import norm
+from portmgr_Q.factor.bvc import bvcProbability, bulkVolumeClassify, bulkVolumeClassifyPanel
+
+
+def _getcdf(x):
+    #原H_RVdir3._getcdf
+    if x > 4:
+        return 1
+    if x < -4:
+        return 0
+    return norm.cdf(round(x, 2))
+
+
+def _minuteData(seed=0):
+    rng = np.random.RandomState(seed)
+    n = 3000
+    data = pd.DataFrame({'securityId': rng.choice(['%06d.SZ' % i for i in range(30)], n),
+                         'date': rng.choice(pd.date_range('2020-01-01', periods=4).date, n),
+                         'ret_standard': rng.standard_t(2, n) * 2,
+                         'volume': np.round(rng.lognormal(8, 1, n), -2)})
+    data.loc[rng.rand(n) < 0.05, 'ret_standard'] = np.nan
+    return data
+
+
+def test_probability_matches_getcdf():
+    x = np.concatenate([np.linspace(-6, 6, 2401), [4.0, -4.0, 4.004, -4.004, 0.005, -0.005]])
+    expected = np.array([_getcdf(v) for v in x])
+    np.testing.assert_allclose(bvcProbability(x), expected, rtol=0, atol=1e-15)
+
+
+def test_classify_matches_groupby():
+    data = _minuteData()
+    data['upvol'] = data['ret_standard'].apply(_getcdf) * data['volume']
+    data['downvol'] = data['volume'] - data['upvol']
+    grouped = data.groupby(['securityId', 'date'])
+    result = bulkVolumeClassify(data)
+    np.testing.assert_allclose(result['buy_sum'].values, grouped['upvol'].sum().values)
+    np.testing.assert_allclose(result['sale_sum'].values, grouped['downvol'].sum().values)
+    np.testing.assert_allclose(result['buy_std'].values, grouped['upvol'].std().values)
+    np.testing.assert_allclose(result['sale_std'].values, grouped['downvol'].std().values)
+
+
+def test_panel_matches_groupby():
+    data = _minuteData(1).drop_duplicates(['securityId', 'date'])
+    data = data.groupby('securityId').head(3)
+    data['slot'] = data.groupby('securityId').cumcount()
+    ret = data.pivot(index='securityId', columns='slot', values='ret_standard')
+    volume = data.pivot(index='securityId', columns='slot', values='volume')
+    result = bulkVolumeClassifyPanel(ret.values, volume.values)
+    data['upvol'] = data['ret_standard'].apply(_getcdf) * data['volume']
+    grouped = data.groupby('securityId')['upvol']
+    np.testing.assert_allclose(result['buy_sum'].values, grouped.sum().reindex(ret.index).values)
+    np.testing.assert_allclose(result['buy_std'].values, grouped.std().reindex(ret.index).values)
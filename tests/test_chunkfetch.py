@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#ChunkedFetcher 分块请求拼接后的结果与一次请求的一致
+import numpy as np
+import pandas as pd
+import pytest
+
+import threading
+
+from portmgr_Q.factor.chunkfetch import ChunkedFetcher, FeedPool
+
+DATES = list(pd.date_range('2020-01-01', periods=23))
+CODES = ['%06d.SZ' % i for i in range(37)]
+
+
+def _load(securityIds, dates):
+    #按dateTime、请求中securityId的顺序，与数据源一次请求的返回相同
+    rows = [(date + pd.Timedelta(hours=h), code) for date in dates for h in [10, 14] for code in securityIds]
+    data = pd.DataFrame(rows, columns=['dateTime', 'securityId'])
+    data['close'] = [(t.value // 10 ** 9 + 7 * int(c[:6])) % 1000 / 10.0 for t, c in rows]
+    return data
+
+
+@pytest.mark.parametrize('securityChunk,dateChunk,maxWorkers', [(10, 5, 1), (7, 4, 3), (None, 6, 2), (50, None, 2)])
+def test_chunks_match_single_request(securityChunk, dateChunk, maxWorkers):
+    securityIds = CODES[::-1]
+    fetcher = ChunkedFetcher(securityChunk, dateChunk, maxWorkers)
+    single = _load(securityIds, DATES)
+    pd.testing.assert_frame_equal(fetcher.fetch(_load, securityIds, DATES), single)
+    received = []
+    assert fetcher.fetch(_load, securityIds, DATES, received.append) is None
+    combined = fetcher.combine(received, securityIds)
+    pd.testing.assert_frame_equal(combined, single)
+
+
+def test_retry_then_fail():
+    calls = []
+    def flaky(securityIds, dates):
+        calls.append(1)
+        if len(calls) < 3:
+            raise IOError('timeout')
+        return _load(securityIds, dates)
+    fetcher = ChunkedFetcher(None, None, retries=2, retryWait=0)
+    pd.testing.assert_frame_equal(fetcher.fetch(flaky, CODES, DATES), _load(CODES, DATES))
+    assert fetcher.getMetrics()['retries'] == 2
+    def broken(securityIds, dates):
+        raise IOError('down')
+    with pytest.raises(IOError):
+        fetcher.fetch(broken, CODES, DATES)
+    assert fetcher.getMetrics()['failures'] == 1
+
+
+def test_feed_pool_is_bounded_and_reused():
+    made = []
+    def factory():
+        made.append(object())
+        return made[-1]
+    pool = FeedPool(factory, 2)
+    fetcher = ChunkedFetcher(5, 3, maxWorkers=4)
+    busy = [0, 0]
+    lock = threading.Lock()
+    def load(securityIds, dates):
+        with pool.use():
+            with lock:
+                busy[0] += 1
+                busy[1] = max(busy)
+            data = _load(securityIds, dates)
+            with lock:
+                busy[0] -= 1
+            return data
+    for _ in range(3):
+        pd.testing.assert_frame_equal(fetcher.fetch(load, CODES, DATES), _load(CODES, DATES))
+    #工作线程多于池的上限时等待归还，同时借出的不超过size，多次fetch共用
+    assert len(made) <= 2 and busy[1] <= 2
+    pool.resize(1)
+    assert pool.created == 1
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#截面处理：CrossSectionPipeline 与按日期逐个处理的结果一致
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import requireFactorPackage
+
+DAYS = [d.to_pydatetime() for d in pd.bdate_range('2015-01-01', periods=20)]
+CODES = ['%06d.SZ' % i for i in range(50)]
+
+
+@pytest.fixture
+def factor():
+    requireFactorPackage()
+    from portmgr_Q.factor import BaseFactorWithDB
+    rng = np.random.RandomState(0)
+    values = dict((dt, rng.standard_t(3, len(CODES))) for dt in DAYS)
+    for dt in DAYS:
+        values[dt][rng.rand(len(CODES)) < 0.1] = np.nan
+
+    class Random(BaseFactorWithDB):
+        def calculateFactorValue(self, dateTime):
+            return pd.DataFrame({'securityId': CODES, 'factorValue': values[dateTime]})
+    return Random(factorSymbol='R', factorDirection=-1)
+
+
+def _assertMatchesPerDate(factor, panel):
+    for dt in DAYS:
+        expected = factor.getStandardizedFactorValue(dt).set_index('securityId')['factorValue']
+        np.testing.assert_allclose(panel.loc[dt, expected.index].values, expected.values)
+
+
+def test_panel_follows_default_processors(factor):
+    _assertMatchesPerDate(factor, factor.getStandardizedFactorPanel(DAYS))
+
+
+def test_panel_follows_configured_outliers(factor):
+    from portmgr_Q.factor import outliers
+    factor.setProcessOutliers(outliers.KeepOutliers())
+    assert factor.getCrossSectionPipeline().outliers is None
+    _assertMatchesPerDate(factor, factor.getStandardizedFactorPanel(DAYS))
+
+
+def test_pipeline_reads_ddof_from_instances(factor):
+    from portmgr_Q.factor import outliers, standardization
+    assert factor.getCrossSectionPipeline().ddof == 1
+
+    class PopulationZScore(standardization.ZScore):
+        def process(self, data, direction=1):
+            values = np.array(list(data.values()), dtype=np.float64)
+            return dict((k, direction * (v - values.mean()) / values.std()) for k, v in data.items())
+    #ZScore的行为与实例不一致时不能用ddof=1的pipeline
+    processStandardization = standardization.ZScore()
+    processStandardization.process = PopulationZScore().process
+    factor.setProcessOutliers(outliers.KeepOutliers())
+    factor.setStandardization(processStandardization)
+    assert factor.getCrossSectionPipeline().ddof == 0
+    _assertMatchesPerDate(factor, factor.getStandardizedFactorPanel(DAYS))
+
+
+def test_unmapped_processor_falls_back_to_dates(factor):
+    from portmgr_Q.factor import outliers
+
+    class Custom(outliers.KeepOutliers):
+        def process(self, data):
+            return dict((k, min(v, 1.0)) for k, v in data.items())
+    factor.setProcessOutliers(Custom())
+    assert factor.getCrossSectionPipeline() is None
+    _assertMatchesPerDate(factor, factor.getStandardizedFactorPanel(DAYS))
+    #显式给出pipeline时不需要对应
+    from portmgr_Q.factor import CrossSectionPipeline
+    assert factor.getStandardizedFactorPanel(DAYS, CrossSectionPipeline(outliers=None)).shape == (len(DAYS), len(CODES))
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import datetime
+
+from portmgr_Q.factor import dailystore
+from portmgr_Q.factor.dailystore import PickleDailyFactorStore, ColumnarDailyFactorStore
+
+
+def _dailyFactor(day, n=5, seed=0):
+    rng = np.random.RandomState(seed)
+    index = pd.MultiIndex.from_arrays([['%06d.SZ' % i for i in range(n)], [day.date()] * n],
+                                      names=['securityId', 'date'])
+    return pd.Series(rng.randn(n), index=index)
+
+
+@pytest.fixture
+def picklePath(tmpdir):
+    return str(tmpdir.join('pickle'))
+
+
+def test_pickle_write_read(picklePath):
+    store = PickleDailyFactorStore(picklePath)
+    day = datetime.datetime(2020, 3, 2)
+    dailyfactor = _dailyFactor(day)
+    assert not store.exists(day)
+    store.write(day, dailyfactor)
+    assert store.exists(day)
+    pd.testing.assert_series_equal(store.read(day), dailyfactor)
+
+
+def test_pickle_write_concurrent_writer(picklePath, monkeypatch):
+    #检查之后其他进程写入了同一天：改名失败时保留已有文件，不抛出异常，不留临时文件
+    store = PickleDailyFactorStore(picklePath)
+    day = datetime.datetime(2020, 3, 2)
+    other = _dailyFactor(day, seed=1)
+    rename = os.rename
+
+    def racingRename(src, dst):
+        other.to_pickle(dst)
+        raise OSError('target exists')
+    monkeypatch.setattr(dailystore.os, 'rename', racingRename)
+    store.write(day, _dailyFactor(day))
+    monkeypatch.setattr(dailystore.os, 'rename', rename)
+    pd.testing.assert_series_equal(store.read(day), other)
+    folder = os.path.dirname(store.getFile(day)) or '.'
+    assert not [name for name in os.listdir(folder) if name.endswith('.tmp')]
+
+
+def test_pickle_write_rename_error(picklePath, monkeypatch):
+    #目标仍不存在时是真正的错误
+    store = PickleDailyFactorStore(picklePath)
+    day = datetime.datetime(2020, 3, 2)
+
+    def failingRename(src, dst):
+        raise OSError('disk error')
+    monkeypatch.setattr(dailystore.os, 'rename', failingRename)
+    with pytest.raises(OSError):
+        store.write(day, _dailyFactor(day))
+
+
+def _frameFactor(day, n=4):
+    index = pd.MultiIndex.from_arrays([['%06d.SZ' % i for i in range(n)], [day.date()] * n],
+                                      names=['securityId', 'date'])
+    return pd.DataFrame({'a': np.arange(n, dtype=np.float64) + day.day, 'b': -np.arange(n, dtype=np.float64)},
+                        index=index, columns=['a', 'b'])
+
+
+def test_columnar_round_trip_keeps_date_type(tmpdir):
+    store = ColumnarDailyFactorStore(str(tmpdir.join('columnar')))
+    day = datetime.datetime(2020, 3, 2)
+    dailyfactor = _frameFactor(day)
+    store.write(day, dailyfactor)
+    pd.testing.assert_frame_equal(store.read(day), dailyfactor)
+    store.flush()
+    restored = store.read(day)
+    pd.testing.assert_frame_equal(restored, dailyfactor)
+    assert type(restored.index.get_level_values('date')[0]) is datetime.date
+
+
+def test_columnar_read_range_matches_daily_reads(tmpdir):
+    legacy = PickleDailyFactorStore(str(tmpdir.join('pickle')))
+    store = ColumnarDailyFactorStore(str(tmpdir.join('columnar')), legacy=legacy)
+    days = [datetime.datetime(2020, 3, 30), datetime.datetime(2020, 3, 31), datetime.datetime(2020, 4, 1)]
+    old = datetime.datetime(2020, 3, 27)
+    legacy.write(old, _frameFactor(old))
+    for day in days:
+        store.write(day, _frameFactor(day))
+    store.flush()
+    dateTimeList = [old] + days
+    expected = pd.concat([store.read(dt) for dt in dateTimeList]).sort_index()
+    pd.testing.assert_frame_equal(store.readRange(old, days[-1], dateTimeList).sort_index(), expected)
+
+
+def test_columnar_flush_only_compacts_written_partitions(tmpdir):
+    path = str(tmpdir.join('columnar'))
+    march, april = datetime.datetime(2020, 3, 2), datetime.datetime(2020, 4, 1)
+    other = ColumnarDailyFactorStore(path)
+    other.write(march, _frameFactor(march))
+    store = ColumnarDailyFactorStore(path)
+    store.write(april, _frameFactor(april))
+    store.flush()
+    #三月的增量是其他实例写入的，不合并
+    assert len(store._listDeltas(store._getPartitionPath(march))) == 1
+    assert len(store._listDeltas(store._getPartitionPath(april))) == 0
+    assert store.exists(march) and store.exists(april)
+    #指定日期时合并其他实例写入的分区
+    store.flush([march])
+    assert len(store._listDeltas(store._getPartitionPath(march))) == 0
+    pd.testing.assert_frame_equal(store.read(march), _frameFactor(march))
+
+
+def test_columnar_compact_replaces_main(tmpdir):
+    store = ColumnarDailyFactorStore(str(tmpdir.join('columnar')))
+    days = [datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 3)]
+    store.write(days[0], _frameFactor(days[0]))
+    store.flush()
+    store.read(days[0])
+    store.write(days[1], _frameFactor(days[1]))
+    store.flush()
+    partition = store._getPartitionPath(days[0])
+    assert sorted(os.listdir(partition)) == ['main']
+    for day in days:
+        pd.testing.assert_frame_equal(store.read(day), _frameFactor(day))
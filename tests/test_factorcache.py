@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#FactorValueCache：经过缓存（内存、磁盘）取得的因子值与直接计算的一致
+import datetime
+import numpy as np
+import pandas as pd
+
+from conftest import requireFactorPackage
+
+DAYS = [datetime.datetime(2020, 3, d) for d in [2, 3, 4]]
+
+
+def _makeFactor(calls):
+    from portmgr_Q.factor import BaseFactorWithDB
+
+    class Counting(BaseFactorWithDB):
+        def calculateFactorValue(self, dateTime):
+            calls.append(dateTime)
+            rng = np.random.RandomState(dateTime.day)
+            return pd.DataFrame({'securityId': ['%06d.SZ' % i for i in range(8)], 'factorValue': rng.randn(8)})
+    return Counting(factorSymbol='Counting')
+
+
+def test_cached_values_match_calculation(tmpdir):
+    requireFactorPackage()
+    from portmgr_Q.factor.factorcache import FactorValueCache
+    calls = []
+    plain = _makeFactor([])
+    factor = _makeFactor(calls)
+    factor.setFactorValueCache(FactorValueCache(str(tmpdir.join('cache')), maxItems=2))
+    for _ in range(2):
+        for dt in DAYS:
+            pd.testing.assert_frame_equal(factor.getOrCalculateFactorValue(dt).reset_index(drop=True),
+                                          plain.getOrCalculateFactorValue(dt).reset_index(drop=True), check_dtype=False)
+    #内存只保留2个，其余从磁盘读出，不再计算
+    assert calls == DAYS
+    #新的缓存实例从磁盘读出
+    other = _makeFactor(calls)
+    other.setFactorValueCache(FactorValueCache(str(tmpdir.join('cache'))))
+    pd.testing.assert_frame_equal(other.getOrCalculateFactorValue(DAYS[0]).reset_index(drop=True),
+                                  plain.getOrCalculateFactorValue(DAYS[0]).reset_index(drop=True), check_dtype=False)
+    assert calls == DAYS
+    other.getFactorValueCache().invalidate(other, [DAYS[0]])
+    other.getOrCalculateFactorValue(DAYS[0])
+    assert calls == DAYS + [DAYS[0]]
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#BaseFactorWithDB 在关系型数据库上的读写，需要完整的 portmgr_Q.factor，用sqlite文件库的连接池
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import requireFactorPackage
+
+DAYS = [d.to_pydatetime() for d in pd.bdate_range('2015-01-01', periods=30)]
+CODES = ['%06d.SZ' % i for i in range(10)]
+
+
+@pytest.fixture
+def factorStore(tmpdir):
+    requireFactorPackage()
+    from portmgr_Q.factor import BaseFactorWithDB
+    from portmgr_Q.factor.storepool import disposeFactorStores
+    import sqlalchemy
+
+    class Constant(BaseFactorWithDB):
+        def calculateFactorValue(self, dateTime):
+            return pd.DataFrame({'securityId': CODES, 'factorValue': np.arange(len(CODES), dtype=np.float64)})
+
+    dsn = 'sqlite:///' + str(tmpdir.join('factor.db'))
+    statements = []
+
+    def make(factorSymbol, dateTimeForm):
+        factor = Constant(factorSymbol=factorSymbol)
+        factor.setFactorStoreDSN(dsn)
+        factor.setDateTimeFormInDB(dateTimeForm)
+        factor.setManifestTableNameInDB('factor_manifest')
+        return factor
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    from portmgr_Q.factor.storepool import getFactorStore
+    sqlalchemy.event.listen(getFactorStore(dsn).engine, 'before_cursor_execute', record)
+    yield make, statements
+    disposeFactorStores(dsn)
+
+
+def _panel():
+    return pd.DataFrame({'dateTime': np.repeat(DAYS, len(CODES)), 'securityId': np.tile(CODES, len(DAYS)),
+                         'factorValue': np.tile(np.arange(len(CODES), dtype=np.float64), len(DAYS))})
+
+
+def _roundTrip(factor):
+    logs = factor.updateFactorRangeToDB(_panel())
+    assert all(l['update_status'][-1] == 'Updated' for l in logs)
+    data = factor.getFactorValueFromSQLDB(DAYS)
+    assert len(data) == len(DAYS) * len(CODES)
+    assert set(pd.to_datetime(data['dateTime']).dt.to_pydatetime()) == set(DAYS)
+    assert factor.getFactorValueCountFromDB(DAYS[:3]) == dict((dt, len(CODES)) for dt in DAYS[:3])
+    factor.deleteFactorValueListInDB(DAYS[:5])
+    assert len(factor.getFactorValueFromSQLDB(DAYS)) == (len(DAYS) - 5) * len(CODES)
+    assert factor.getFactorValueCountFromDB(DAYS[:6]) == {DAYS[5]: len(CODES)}
+
+
+@pytest.mark.parametrize('form', [1, 2, 3, 4])
+def test_sql_round_trip_binds_parameters(factorStore, form):
+    make, statements = factorStore
+    factor = make('F%d' % form, form)
+    _roundTrip(factor)
+    #查询、删除的取值都是绑定参数；CHAR字段上的字符串按CHAR比较
+    checked = 0
+    for statement, parameters in statements:
+        head = statement.lstrip().lower()
+        if (head.startswith('select') and 'sqlite_master' not in head or head.startswith('delete')) and ' in (' in head:
+            assert parameters, statement
+            assert "'" not in statement, statement
+            if form != 3 and 'factor_manifest' not in head:
+                assert 'CAST(? AS CHAR(20))' in statement, statement
+            checked += 1
+    assert checked > 0
+
+
+@pytest.mark.parametrize('form', [1, 3])
+def test_sql_round_trip_on_connect_db_uses_literals(tmpdir, form):
+    #原有的ConnectDB不能绑定参数，取值为字面量
+    requireFactorPackage()
+    from portmgr_Q.factor import BaseFactorWithDB
+    from datafeeds.utils.relationaldb import ConnectDB
+    import sqlalchemy
+    engine = sqlalchemy.create_engine('sqlite:///' + str(tmpdir.join('plain.db')))
+    statements = []
+    sqlalchemy.event.listen(engine, 'before_cursor_execute',
+                            lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters)))
+    factor = BaseFactorWithDB(factorSymbol='P%d' % form)
+    factor.setFactorStoreDB(ConnectDB(engine))
+    factor.setDateTimeFormInDB(form)
+    factor.setManifestTableNameInDB('factor_manifest')
+    _roundTrip(factor)
+    for statement, parameters in statements:
+        head = statement.lstrip().lower()
+        if (head.startswith('select') and 'sqlite_master' not in head or head.startswith('delete')) and ' in (' in head:
+            assert not parameters, statement
+
+
+@pytest.mark.parametrize('manifest', [True, False])
+def test_range_update_matches_days_with_time(factorStore, manifest):
+    #日期型的dateTimeForm下，带时刻的dateTime与已写入的同一天是同一个日期，不能重复写入
+    make, statements = factorStore
+    factor = make('R', 1)
+    if not manifest:
+        factor.setManifestTableNameInDB(None)
+    factor.updateFactorRangeToDB(_panel())
+    later = _panel()
+    later['dateTime'] = later['dateTime'] + pd.Timedelta(hours=15)
+    logs = factor.updateFactorRangeToDB(later)
+    assert all(l['update_status'][-1] == 'Updated' and 'has been updated.' in l['update_log'][1] for l in logs)
+    assert len(factor.getFactorValueFromSQLDB(DAYS)) == len(DAYS) * len(CODES)
+
+
+@pytest.mark.parametrize('manifest', [True, False])
+def test_single_update_matches_days_with_time(factorStore, manifest):
+    make, statements = factorStore
+    factor = make('S', 3)
+    if not manifest:
+        factor.setManifestTableNameInDB(None)
+    day = DAYS[0]
+    assert factor.updateFactorTableToDB(day)['update_status'][-1] == 'Updated'
+    logs = factor.updateFactorTableToDB(day.replace(hour=15))
+    assert logs['update_log'][-1] == 'The data of 20150101 has been updated.'
+    assert factor.getFactorValueCountFromDB([day.replace(hour=15)]) == {day.replace(hour=15): len(CODES)}
+    assert len(factor.getFactorValueFromSQLDB([day])) == len(CODES)
+
+
+def test_manifest_keys_follow_database_values(factorStore):
+    #updateFactorTableToDB写入和rebuildManifestInDB重建的清单是同一条记录
+    make, statements = factorStore
+    factor = make('M', 1)
+    factor.updateFactorTableToDB(DAYS[0].replace(hour=15))
+    manifest = factor.getManifestFromDB(DAYS[0], DAYS[0].replace(hour=23))
+    assert list(manifest['dateTime']) == [pd.Timestamp(DAYS[0])]
+    factor.rebuildManifestInDB([DAYS[0]])
+    manifest = factor.getManifestFromDB(DAYS[0], DAYS[0].replace(hour=23))
+    assert list(manifest['dataNumber']) == [len(CODES)]
+
+
+class _UpdateOne(object):
+    def __init__(self, filter, update, upsert=False):
+        self.filter, self.update, self.upsert = filter, update, upsert
+
+
+class _BulkWriteResult(object):
+    def __init__(self, matched, upserted):
+        self.matched_count, self.upserted_count = matched, upserted
+
+
+class _Collection(object):
+    #只实现因子表用到的几个方法的内存collection
+    def __init__(self):
+        self.docs = []
+        self.indexes = []
+        self.writes = 0
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+
+    def _match(self, doc, query):
+        for key, value in query.items():
+            if isinstance(value, dict) and '$in' in value:
+                if doc.get(key) not in value['$in']:
+                    return False
+            elif isinstance(value, dict):
+                if doc.get(key) in value['$nin']:
+                    return False
+            elif doc.get(key) != value:
+                return False
+        return True
+
+    def bulk_write(self, requests, ordered=True):
+        self.writes += 1
+        matched, upserted = 0, 0
+        for request in requests:
+            docs = [doc for doc in self.docs if self._match(doc, request.filter)]
+            if len(docs) > 0:
+                docs[0].update(request.update['$set'])
+                matched += 1
+            else:
+                self.docs.append(dict(request.update['$set']))
+                upserted += 1
+        return _BulkWriteResult(matched, upserted)
+
+    def delete_many(self, query):
+        self.docs = [doc for doc in self.docs if not self._match(doc, query)]
+
+    def aggregate(self, pipeline):
+        match, group = pipeline[0]['$match'], pipeline[1]['$group']
+        key = group['_id'][1:]
+        counts = {}
+        for doc in self.docs:
+            if self._match(doc, match):
+                counts[doc[key]] = counts.get(doc[key], 0) + 1
+        return [{'_id': k, 'datanumber': v, 'nullnumber': 0} for k, v in counts.items()]
+
+
+def test_mongo_range_update_upserts(monkeypatch):
+    requireFactorPackage()
+    import pymongo
+    from portmgr_Q.factor import BaseFactorWithDB
+    from datafeeds.utils import DBType
+    from datafeeds.utils.nosqldb import ConnectNoSQLDB
+    monkeypatch.setattr(pymongo, 'UpdateOne', _UpdateOne)
+    collection = _Collection()
+
+    class Store(ConnectNoSQLDB):
+        def __init__(self):
+            pass
+
+        def getDBType(self):
+            return DBType.mongoDB
+
+        def connectDB(self):
+            return {'factor_value': collection}
+
+    factor = BaseFactorWithDB(factorSymbol='M')
+    factor.setFactorStoreDB(Store())
+    factor.setTableNameInDB('factor_value')
+    factor.setManifestTableNameInDB(None)
+    factor.updateFactorRangeToDB(_panel())
+    assert len(collection.docs) == len(DAYS) * len(CODES)
+    #重写时按三个字段upsert，不会重复；新数据中没有的股票被删除
+    panel = _panel()
+    panel = panel[panel['securityId'] != CODES[0]]
+    panel['factorValue'] = panel['factorValue'] + 1
+    logs = factor.updateFactorRangeToDB(panel, reUpdate=True)
+    assert all(l['update_status'][-1] == 'Updated' for l in logs)
+    assert len(collection.docs) == len(DAYS) * (len(CODES) - 1)
+    assert sorted(doc['factor_value'] for doc in collection.docs if doc['tdate'] == '2015-01-01') == list(range(2, len(CODES) + 1))
+    assert [k for k, _ in collection.indexes[0][0]] == ['factor_symbol', 'tdate', 'security_code']
+    assert collection.indexes[0][1] == {'unique': True}
+    #写入的记录数不对时不算写入成功
+    monkeypatch.setattr(collection, 'bulk_write', lambda requests, ordered=True: _BulkWriteResult(0, 1))
+    logs = factor.updateFactorRangeToDB(_panel(), reUpdate=True)
+    assert all(l['update_status'][-1] == 'Not Updated' for l in logs)
+
+
+def test_range_reupdate_needs_transaction(tmpdir):
+    #原有的ConnectDB没有事务，重写已有的日期时不能先删除再插入
+    requireFactorPackage()
+    from portmgr_Q.factor import BaseFactorWithDB
+    from datafeeds.utils.relationaldb import ConnectDB
+    import sqlalchemy
+    factor = BaseFactorWithDB(factorSymbol='T')
+    factor.setFactorStoreDB(ConnectDB(sqlalchemy.create_engine('sqlite:///' + str(tmpdir.join('plain.db')))))
+    #新的日期可以写入
+    logs = factor.updateFactorRangeToDB(_panel())
+    assert all(l['update_status'][-1] == 'Updated' for l in logs)
+    with pytest.raises(BaseException) as error:
+        factor.updateFactorRangeToDB(_panel(), reUpdate=True)
+    assert 'setFactorStoreDSN' in str(error.value)
+    assert len(factor.getFactorValueFromSQLDB(DAYS)) == len(DAYS) * len(CODES)
+
+
+def test_manifest_falls_back_to_factor_table(factorStore):
+    #设置清单表之前写入的日期仍能读到，并补入清单表
+    make, statements = factorStore
+    factor = make('B', 1)
+    factor.setManifestTableNameInDB(None)
+    factor.updateFactorRangeToDB(_panel())
+    factor.setManifestTableNameInDB('factor_manifest')
+    assert len(factor.getManifestFromDB(DAYS[0], DAYS[-1])) == 0
+    assert len(factor.getFactorValueFromDB(DAYS[:5])) == 5 * len(CODES)
+    manifest = factor.getManifestFromDB(DAYS[0], DAYS[-1])
+    assert list(manifest['dateTime']) == [pd.Timestamp(dt) for dt in DAYS[:5]]
+    assert list(manifest['dataNumber']) == [len(CODES)] * 5
+    #清单表中有的和没有的日期一起读取
+    assert len(factor.getFactorValueFromDB(DAYS[3:8])) == 5 * len(CODES)
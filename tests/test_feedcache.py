@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#CachedDataFeeds：回放的结果与直接访问数据源的一致
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from portmgr_Q.factor.feedcache import CachedDataFeeds, writeFrame, readFrame
+from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
+
+
+def _values(series):
+    #缺失的字符串在新版pandas中为nan，统一为None
+    return [None if pd.isnull(v) else v for v in series]
+
+
+def _roundTrip(tmpdir, data):
+    file = str(tmpdir.join('frame.npz'))
+    writeFrame(file, data)
+    return readFrame(file)
+
+
+def test_frame_round_trip(tmpdir):
+    data = pd.DataFrame({'dateTime': pd.date_range('2020-01-01', periods=4).astype('datetime64[ns]'),
+                         'securityId': ['a', 'b', 'c', 'd'],
+                         'close': [1.0, np.nan, 3.0, 4.0], 'volume': np.arange(4, dtype=np.int64)})
+    pd.testing.assert_frame_equal(_roundTrip(tmpdir, data), data, check_dtype=False)
+    #非默认的索引（包括从1开始的整数索引和MultiIndex）
+    shifted = data.set_index(pd.Index([1, 2, 3, 4], name='n'))
+    pd.testing.assert_frame_equal(_roundTrip(tmpdir, shifted), shifted, check_dtype=False, check_index_type=False)
+    indexed = data.set_index(['dateTime', 'securityId'])
+    pd.testing.assert_frame_equal(_roundTrip(tmpdir, indexed), indexed, check_dtype=False, check_index_type=False)
+    series = data.set_index('dateTime')['close']
+    pd.testing.assert_series_equal(_roundTrip(tmpdir, series), series, check_index_type=False)
+
+
+def test_object_columns_keep_types(tmpdir):
+    data = pd.DataFrame({'ints': pd.Series([1, None, 3], dtype=object),
+                         'floats': pd.Series([1.5, 2.5, None], dtype=object),
+                         'flags': pd.Series([True, False, None], dtype=object),
+                         'times': pd.Series([datetime.datetime(2020, 1, 2), None, datetime.datetime(2020, 1, 3, 15)], dtype=object),
+                         'mixed': pd.Series([1, 'b', None], dtype=object)})
+    replay = _roundTrip(tmpdir, data)
+    assert list(replay['ints']) == [1, None, 3]
+    assert list(replay['floats']) == [1.5, 2.5, None]
+    assert list(replay['flags']) == [True, False, None]
+    assert list(replay['times']) == [pd.Timestamp('2020-01-02'), None, pd.Timestamp('2020-01-03 15:00')]
+    #混合类型回放为字符串
+    assert _values(replay['mixed']) == ['1', 'b', None]
+    assert _values(_roundTrip(tmpdir, pd.DataFrame({'s': ['a', None]}))['s']) == ['a', None]
+
+
+@pytest.mark.parametrize('frequency', [86400, 1800])
+def test_replay_matches_source(tmpdir, frequency):
+    source = SyntheticDataFeeds(securityCount=10)
+    path = str(tmpdir.join('cache'))
+    args = (['000001.SZ', '000002.SZ'], ['close', 'volume'], frequency,
+            datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 6, 15))
+    direct = source.getDataFeed('AShareQuotation').getAShareQuotation(*args)
+    recorded = CachedDataFeeds(source, path).getDataFeed('AShareQuotation').getAShareQuotation(*args)
+    replayCache = CachedDataFeeds(None, path, mode='replay')
+    replayed = replayCache.getDataFeed('AShareQuotation').getAShareQuotation(*args)
+    assert replayCache.getStats()['replays'] == 1
+    for data in [recorded, replayed]:
+        pd.testing.assert_frame_equal(data, direct, check_dtype=False)
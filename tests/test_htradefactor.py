@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+#HTradeFactorDemo 的测试，需要完整的 portmgr_Q.factor，数据来自 SyntheticDataFeeds
+import os
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import requireFactorPackage
+
+
+@pytest.fixture
+def factorClass(tmpdir, monkeypatch):
+    requireFactorPackage()
+    from portmgr_Q.factor import TradeFactorDemo, HTradeFactorDemo
+    from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
+    monkeypatch.chdir(str(tmpdir))
+    feeds = SyntheticDataFeeds(securityCount=20)
+    monkeypatch.setattr(TradeFactorDemo, '_dataFeedsFactory', staticmethod(lambda: feeds))
+
+    class MeanClose(HTradeFactorDemo):
+        def __init__(self, how='mean', factorSymbol='MeanClose', **kwargs):
+            HTradeFactorDemo.__init__(self, path='P', standard=False, how=how, lagTradeDays=5, frequency=1800,
+                                      items=['close'], factorSymbol=factorSymbol, dailyFactorSymbol='MeanClose', **kwargs)
+
+        def getFactor(self):
+            panel = self.getDailyPanel()
+            rows = []
+            for date, cols in panel.getDateSlices():
+                with np.errstate(invalid='ignore'):
+                    value = np.nanmean(panel.get('close')[:, cols], axis=1)
+                rows.append(pd.Series(value, index=pd.MultiIndex.from_arrays(
+                    [panel.securityIds, [date] * len(panel.securityIds)], names=['securityId', 'date'])))
+            self.dailyfactor = pd.concat(rows).dropna()
+    return MeanClose
+
+
+def test_daily_panel_follows_dailydata(factorClass):
+    factor = factorClass()
+    factor.stocklist = factor._getStockCode(datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 3))
+    factor.getDailyData(datetime.datetime(2020, 3, 2))
+    first = factor.getDailyPanel()
+    assert factor.getDailyPanel() is first
+    factor.getDailyData(datetime.datetime(2020, 3, 3))
+    assert factor.getDailyPanel() is not first
+    #直接给dailydata赋值时也要重建
+    data = factor.dailydata.copy()
+    data['close'] = data['close'] * 2
+    panel = factor.getDailyPanel()
+    factor.dailydata = data
+    rebuilt = factor.getDailyPanel()
+    assert rebuilt is not panel
+    np.testing.assert_allclose(np.nan_to_num(rebuilt.get('close')), np.nan_to_num(panel.get('close')) * 2, rtol=1e-6)
+
+
+def test_batch_matches_single_factor_on_non_trading_day(factorClass):
+    from portmgr_Q.factor import FactorBatch
+    weekend = datetime.datetime(2020, 5, 31)
+    #共用日度因子，聚合方式不同
+    factors = [factorClass(how, factorSymbol='MeanClose_' + how) for how in ['mean', 'std']]
+    batch = FactorBatch(factors)
+    reads = []
+    for factor in factors:
+        readRange = factor.dailyFactorStore.readRange
+        def countingReadRange(*args, **kwargs):
+            reads.append(args)
+            return readRange(*args, **kwargs)
+        factor.dailyFactorStore.readRange = countingReadRange
+    result = batch.calculateFactorValue(weekend)
+    #共用dailyFactor路径的因子只读取一次
+    assert len(reads) == 1
+    for factor in factors:
+        expected = factor.calculateFactorValue(weekend)
+        value = result[factor.getFactorSymbol()]
+        assert len(value) > 0
+        np.testing.assert_allclose(value['factorValue'].values, expected['factorValue'].values)
+
+
+def test_factor_value_panel_matches_single_dates(factorClass):
+    factor = factorClass()
+    #含非交易日，与前一交易日的窗口相同
+    dates = [datetime.datetime(2020, 5, 27), datetime.datetime(2020, 5, 29), datetime.datetime(2020, 5, 30),
+             datetime.datetime(2020, 5, 31), datetime.datetime(2020, 6, 3)]
+    calls = []
+    single = factor.calculateFactorValue
+    factor.calculateFactorValue = lambda dateTime: calls.append(dateTime) or single(dateTime)
+    panel = factor.getFactorValuePanel(dates)
+    #一起计算，不逐日调用calculateFactorValue
+    assert calls == []
+    assert list(panel.index) == dates
+    for dateTime in dates:
+        expected = single(dateTime).set_index('securityId')['factorValue'].dropna()
+        np.testing.assert_allclose(panel.loc[dateTime, expected.index].values, expected.values)
+
+
+def test_range_calendar_starts_at_first_window(factorClass):
+    factor = factorClass()
+    begin, end = datetime.datetime(2020, 2, 3), datetime.datetime(2020, 3, 31)
+    bars, days = factor._getRangeCalendar(begin, end)
+    first = factor._getLastTradeDate(begin, factor.maxoffset).iloc[0, 0]
+    assert pd.Timestamp(days[0]) == pd.Timestamp(first).normalize()
+    #第一个调仓日的窗口在取得的日历之内
+    assert len(factor._getRangeWindows(bars, days, begin, 'D')) == len(days[days >= np.datetime64(begin)])
+    result = factor.calculateFactorValueRange(begin, end, rebalance='M')
+    for dateTime, group in result.groupby('dateTime'):
+        expected = factor.calculateFactorValue(pd.Timestamp(dateTime).to_pydatetime())
+        np.testing.assert_allclose(group['factorValue'].values, expected['factorValue'].values)
+
+
+def test_stock_code_single_day_keeps_feed_columns(factorClass):
+    factor = factorClass()
+    day = datetime.datetime(2020, 3, 2)
+    feed = factor._TradeFactorDemo__stockcode
+    getAShareCodes = feed.getAShareCodes
+    def withName(beginDateTime=None, endDateTime=None):
+        data = getAShareCodes(beginDateTime, endDateTime)
+        data['name'] = 'N' + data['securityId']
+        return data
+    feed.getAShareCodes = withName
+    single = factor._getStockCode(day, day)
+    assert list(single.columns) == list(factor._getStockCode(day, day + datetime.timedelta(days=1)).columns)
+    pd.testing.assert_frame_equal(single, withName(day, day).sort_values('securityId').reset_index(drop=True))
+
+
+def test_load_suspended_from_quotation(factorClass):
+    factor = factorClass()
+    day = datetime.datetime(2020, 3, 3)
+    feed = factor._TradeFactorDemo__stockdata
+    getAShareQuotation = feed.getAShareQuotation
+    universe = factor.getUniverseStore()
+    halted = universe.getUniverse(day)['securityId'].iloc[3]
+    def withHalt(*args):
+        data = getAShareQuotation(*args)
+        halt = (data['securityId'] == halted) & (pd.DatetimeIndex(data['dateTime']).normalize() == day)
+        data.loc[halt, 'volume'] = 0
+        return data
+    feed.getAShareQuotation = withHalt
+    factor.buildUniverse(datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 6), suspended=True)
+    assert universe.isSuspended(day, halted)
+    assert not universe.isSuspended(datetime.datetime(2020, 3, 2), halted)
+    assert halted not in list(universe.getUniverse(day, excludeSuspended=True)['securityId'])
+    assert len(universe.getUniverse(day, excludeSuspended=True)) == len(universe.getUniverse(day)) - 1
+
+
+def test_prefetcher_created_for_missing_days(factorClass, monkeypatch):
+    import portmgr_Q.factor as factorModule
+    created = []
+    Prefetcher = factorModule.Prefetcher
+    def countingPrefetcher(*args, **kwargs):
+        created.append(args[1])
+        return Prefetcher(*args, **kwargs)
+    monkeypatch.setattr(factorModule, 'Prefetcher', countingPrefetcher)
+    dates = [datetime.datetime(2020, 3, d) for d in [2, 3, 4, 5, 6]]
+    factor = factorClass()
+    factor.stocklist = factor._getStockCode(dates[0], dates[-1])
+    assert factor._prefetchDailyData(dates) is not None
+    #重写了getDailyData的子类不预取
+    class Custom(factorClass):
+        def getDailyData(self, dateTime, items=None):
+            return factorClass.getDailyData(self, dateTime, items)
+    custom = Custom(factorSymbol='Custom')
+    assert custom._prefetchDailyData(dates) is None
+    del created[:]
+    prefetched = factor.getDailyFactors(dates)
+    assert len(created) == 1
+    #不预取时（另一个目录，重新计算）结果相同
+    os.mkdir('plain')
+    monkeypatch.chdir('plain')
+    plain = factorClass(prefetchDepth=0)
+    plain.stocklist = factor.stocklist
+    pd.testing.assert_frame_equal(prefetched.reset_index(drop=True), plain.getDailyFactors(dates).reset_index(drop=True))
+
+
+def test_chunked_fetch_matches_single_request_on_minute_bars(factorClass):
+    from portmgr_Q.factor import ChunkedFetcher
+    factor = factorClass()
+    factor.setDataFetcher(ChunkedFetcher(securityChunk=5, dateChunk=5))
+    begin, end = datetime.datetime(2020, 3, 2, 10, 30), datetime.datetime(2020, 4, 10)
+    securityIds = factor._getStockCode(begin, end)['securityId'].tolist()
+    single = factor._getStockData(securityIds, ['close', 'volume'], begin, end)
+    chunked = factor._fetchStockData(securityIds, ['close', 'volume'], begin, end)
+    assert factor.getDataFetcher().getMetrics()['chunks'] > 1
+    assert len(single) > 0
+    pd.testing.assert_frame_equal(chunked, single)
+
+
+def test_fetch_workers_use_own_feeds(factorClass, monkeypatch):
+    from portmgr_Q.factor import TradeFactorDemo, ChunkedFetcher
+    from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
+    made = []
+    def factory():
+        feeds = SyntheticDataFeeds(securityCount=20)
+        made.append(feeds)
+        return feeds
+    monkeypatch.setattr(TradeFactorDemo, '_dataFeedsFactory', staticmethod(factory))
+    factor = factorClass()
+    factor.setDataFetcher(ChunkedFetcher(securityChunk=5, dateChunk=5, maxWorkers=3))
+    begin, end = datetime.datetime(2020, 3, 2), datetime.datetime(2020, 4, 10)
+    securityIds = factor._getStockCode(begin, end)['securityId'].tolist()
+    chunked = factor._fetchStockData(securityIds, ['close'], begin, end)
+    #工作线程从数据源池借用数据源，不与因子共用，最多maxWorkers个
+    assert 1 < len(made) <= 4
+    pd.testing.assert_frame_equal(chunked, factor._getStockData(securityIds, ['close'], begin, end))
+    #之后的fetch重用池中的数据源
+    count = len(made)
+    for _ in range(3):
+        factor._fetchStockData(securityIds, ['close'], begin, end)
+    assert len(made) == count
+    closed = []
+    for feeds in made[1:]:
+        feeds.close = lambda feeds=feeds: closed.append(feeds)
+    factor.close()
+    assert sorted(map(id, closed)) == sorted(map(id, made[1:]))
+
+
+def test_rvdir3_float32_panel_matches_float64(factorClass):
+    pytest.importorskip('scipy')
+    from portmgr_Q.factor.factorZoo import H_RVdir3
+    factor = H_RVdir3(path='P', frequency=1800, lagTradeDays=5)
+    day = datetime.datetime(2020, 3, 3)
+    factor.stocklist = factor._getStockCode(day, day)
+    factor.getDailyData(day)
+    factor.getFactor()
+    assert factor.getDailyPanel().dtype == np.float32
+    result = factor.dailyfactor
+    getDailyPanel = factor.getDailyPanel
+    factor.getDailyPanel = lambda dtype=np.float64: getDailyPanel(np.float64)
+    factor.getFactor()
+    expected = factor.dailyfactor
+    pd.testing.assert_index_equal(result.index, expected.index)
+    #只有价格的float32舍入使个别收益率落到相邻的两位小数一档
+    np.testing.assert_allclose(result.values, expected.values, rtol=1e-3)
+
+
+def test_ring_frame_built_on_demand(factorClass, monkeypatch):
+    from portmgr_Q.factor.ringpanel import RingPanel
+    built = []
+    toFrame = RingPanel.toFrame
+    monkeypatch.setattr(RingPanel, 'toFrame', lambda self: built.append(1) or toFrame(self))
+    factor = factorClass(fetchDataOnOld=True)
+    plain = factorClass(factorSymbol='Plain')
+    assert plain.getStockDataPanel() is None
+    for day in [2, 3, 4]:
+        factor.getData(datetime.datetime(2020, 3, day))
+    #不访问stockdata时不生成长表
+    assert built == []
+    ring = factor.getStockDataPanel()
+    dates, securityIds, close = ring.getPanel('close')
+    plain.getData(datetime.datetime(2020, 3, 4))
+    expected = plain.stockdata['close'].unstack('securityId')
+    np.testing.assert_allclose(close, expected.reindex(index=dates, columns=securityIds).values)
+    frame = factor.stockdata
+    assert factor.stockdata is frame and len(built) == 1
+    pd.testing.assert_frame_equal(frame, plain.stockdata, check_index_type=False)
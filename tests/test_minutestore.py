@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+#MinuteDataStore 列式格式读出的数据与原来整个pickle读出再选取的一致
+import os
+import datetime
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.minutestore import MinuteDataStore
+
+
+def test_columnar_matches_pickle(tmpdir):
+    rng = np.random.RandomState(0)
+    day = datetime.datetime(2020, 3, 2)
+    times = pd.DatetimeIndex([day + datetime.timedelta(minutes=m) for m in range(570, 900, 30)]).astype('datetime64[ns]')
+    index = pd.MultiIndex.from_product([times, ['%06d.SZ' % i for i in range(15, 0, -1)]], names=['dateTime', 'securityId'])
+    data = pd.DataFrame({'close': rng.rand(len(index)), 'volume': rng.rand(len(index)), 'amount': rng.rand(len(index))},
+                        index=index)
+    data = data[rng.rand(len(data)) > 0.2]
+    store = MinuteDataStore(str(tmpdir.join('dailyData')))
+    folder = os.path.dirname(store._getPicklePath('base', day))
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    data.to_pickle(store._getPicklePath('base', day))
+    fromPickle = [store.read('base', day, ['close', 'amount']),
+                  store.read('base', day, ['volume'], ['000003.SZ', '000011.SZ', '000099.SZ'])]
+    store.convertFromPickle('base', day)
+    fromColumnar = [store.read('base', day, ['close', 'amount']),
+                    store.read('base', day, ['volume'], ['000003.SZ', '000011.SZ', '000099.SZ'])]
+    for expected, value in zip(fromPickle, fromColumnar):
+        pd.testing.assert_frame_equal(value.sort_index(), expected.sort_index(), check_index_type=False)
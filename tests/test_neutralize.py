@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+#Neutralizer 与逐日逐因子的最小二乘回归残差一致
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.neutralize import Neutralizer, industryDummies
+
+DATES = pd.date_range('2020-01-01', periods=25, name='dateTime')
+CODES = pd.Index(['%06d.SZ' % i for i in range(60)], name='securityId')
+
+
+def _panel(values):
+    return pd.DataFrame(values, index=DATES, columns=CODES)
+
+
+def _residual(y, x):
+    #逐日回归：只用因子和暴露都有效的股票
+    valid = np.isfinite(y) & np.isfinite(x).all(axis=1)
+    result = np.full(len(y), np.nan)
+    if valid.any():
+        beta = np.linalg.lstsq(x[valid], y[valid], rcond=None)[0]
+        result[valid] = y[valid] - x[valid].dot(beta)
+    return result
+
+
+def test_matches_per_date_lstsq():
+    rng = np.random.RandomState(0)
+    industry = _panel(rng.choice([1, 2, 3, 4], (len(DATES), len(CODES))).astype(object))
+    industry.iloc[3, 5] = np.nan
+    logCap = _panel(rng.randn(len(DATES), len(CODES)) + 20)
+    logCap.iloc[7, 9] = np.nan
+    exposures = industryDummies(industry)
+    exposures['logCap'] = logCap
+    factors = {'a': _panel(rng.randn(len(DATES), len(CODES))), 'b': _panel(rng.randn(len(DATES), len(CODES)))}
+    #因子缺失的股票各不相同
+    factors['a'].iloc[2, [1, 2, 3]] = np.nan
+    factors['b'].iloc[2, [4]] = np.nan
+    factors['b'].iloc[10, :] = np.nan
+    result = Neutralizer(exposures, blockSize=7).neutralize(factors)
+    for name, panel in factors.items():
+        for d, date in enumerate(DATES):
+            x = np.column_stack([exposure.loc[date].values.astype(np.float64) for exposure in exposures.values()]
+                                + [np.ones(len(CODES))])
+            expected = _residual(panel.loc[date].values, x)
+            np.testing.assert_allclose(result[name].loc[date].values, expected, atol=1e-8)
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+#MinutePanel 还原的长表与原来的长表一致
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.panel import MinutePanel
+
+
+def test_round_trip_matches_frame():
+    rng = np.random.RandomState(0)
+    times = pd.DatetimeIndex([d + pd.Timedelta(minutes=m) for d in pd.date_range('2020-01-01', periods=3)
+                              for m in [600, 630, 840, 900]]).astype('datetime64[ns]')
+    index = pd.MultiIndex.from_product([times, ['%06d.SZ' % i for i in range(6)]], names=['dateTime', 'securityId'])
+    data = pd.DataFrame({'close': rng.rand(len(index)), 'volume': rng.rand(len(index))}, index=index)
+    #缺少部分(时间点,股票)
+    data = data[rng.rand(len(data)) > 0.3].sort_index()
+    panel = MinutePanel.fromFrame(data, dtype=np.float64)
+    pd.testing.assert_frame_equal(panel.toFrame()[['close', 'volume']], data, check_index_type=False)
+    slices = panel.getDateSlices()
+    assert [date for date, _ in slices] == list(pd.date_range('2020-01-01', periods=3).date)
+    for date, cols in slices:
+        day = data[data.index.get_level_values('dateTime').normalize() == pd.Timestamp(date)]
+        expected = day['close'].groupby(level='securityId').mean()
+        with np.errstate(invalid='ignore'):
+            value = np.nanmean(panel.get('close')[:, cols], axis=1)
+        np.testing.assert_allclose(pd.Series(value, index=panel.securityIds).reindex(expected.index).values, expected.values)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+#Prefetcher 的结果与按顺序直接导入的一致，后台线程的异常在取用时抛出
+import threading
+import pytest
+
+from portmgr_Q.factor.prefetch import Prefetcher
+
+
+def test_results_match_sequential_load():
+    keys = list(range(20))
+    threads = set()
+    def load(key):
+        threads.add(threading.current_thread().name)
+        return key * key
+    with Prefetcher(load, keys, depth=3) as prefetcher:
+        assert [value for key, value in prefetcher] == [load(key) for key in keys]
+    assert len(threads) == 2
+    with Prefetcher(load, keys) as prefetcher:
+        #跳过的键被丢弃
+        assert prefetcher.get(0) == 0
+        assert prefetcher.get(5) == 25
+        with pytest.raises(BaseException):
+            prefetcher.get(3)
+
+
+def test_error_raised_on_get():
+    def load(key):
+        if key == 2:
+            raise ValueError(key)
+        return key
+    prefetcher = Prefetcher(load, range(5))
+    assert prefetcher.get(1) == 1
+    with pytest.raises(ValueError):
+        prefetcher.get(2)
+    prefetcher.close()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+#RingPanel 与原来 fetchDataOnOld 的长表（drop、append、sort_index）结果一致
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.ringpanel import RingPanel
+
+DATES = pd.date_range('2020-01-01 10:00', periods=12, freq='D').astype('datetime64[ns]')
+CODES = ['%06d.SZ' % i for i in range(8)]
+
+
+def _bars(dates, codes, seed):
+    rng = np.random.RandomState(seed)
+    index = pd.MultiIndex.from_product([dates, codes], names=['dateTime', 'securityId'])
+    data = pd.DataFrame({'close': rng.rand(len(index)), 'volume': rng.randint(1, 100, len(index))}, index=index)
+    return data.reset_index()
+
+
+def _slideLongTable(table, data, dates, codes):
+    #原来的做法：去掉过期的时间点和调出的股票，加入新数据，排序
+    if table is not None:
+        table = table[table.index.get_level_values('dateTime').isin(dates)
+                      & table.index.get_level_values('securityId').isin(codes)]
+        data = pd.concat([table, data.set_index(['dateTime', 'securityId'])])
+    else:
+        data = data.set_index(['dateTime', 'securityId'])
+    return data.sort_index()
+
+
+def test_sliding_matches_long_table():
+    ring = RingPanel(5, columnCapacity=2)
+    table = None
+    universes = [CODES[:5], CODES[1:6], CODES[1:6], CODES[3:8] + [CODES[0]], CODES[:4]]
+    for step, codes in enumerate(universes):
+        dates = DATES[step:step + 5]
+        old = set(ring.getSecurityIds())
+        ring.retainDates(dates)
+        ring.setUniverse(codes)
+        newDates = dates.difference(ring.getDates())
+        staying = [c for c in codes if c in old]
+        entering = [c for c in codes if c not in old]
+        data = pd.concat([_bars(newDates, staying, step), _bars(dates, entering, step + 100)], ignore_index=True)
+        ring.insert(data)
+        table = _slideLongTable(table, data, dates, codes)
+        pd.testing.assert_frame_equal(ring.toFrame(), table, check_index_type=False)
+
+
+def test_dtype_widens_on_later_insert():
+    ring = RingPanel(3)
+    ring.setUniverse(CODES[:3])
+    first = _bars(DATES[:1], CODES[:3], 0)
+    ring.insert(first)
+    assert ring.toFrame()['volume'].dtype == np.int64
+    second = _bars(DATES[1:2], CODES[:3], 1)
+    second['volume'] = second['volume'].astype(np.float64)
+    second.loc[1, 'volume'] = np.nan
+    ring.insert(second)
+    frame = ring.toFrame()
+    assert frame['volume'].dtype == np.float64
+    assert np.isnan(frame['volume'].values[4])
+    #没有写入的指标为缺失
+    ring.insert(_bars(DATES[2:3], CODES[:3], 2).drop('volume', axis=1))
+    frame = ring.toFrame()
+    assert frame['volume'].isnull().sum() == 4
+    assert frame['close'].notnull().all()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+#RollingFactorWindow 的滑动结果与原来 transformToId 在每个窗口上重新分组计算的结果一致
+import numpy as np
+import pandas as pd
+import pytest
+
+from portmgr_Q.factor.rolling import RollingFactorWindow
+
+LAG = 5
+
+
+def _wavg(group, avg_name, weight_name):
+    d = group[avg_name]
+    w = group[weight_name]
+    return (d * w).sum() / w.sum()
+
+
+def _transformToId(data, how, offset1=LAG):
+    #原HTradeFactorDemo.transformToId
+    if how == 'mean':
+        data = data.groupby('securityId')['dailyfactor'].mean()
+    elif how == 'wmean':
+        data = data.sort_values('date', ascending=True)
+        data['weight'] = 1.0
+        data['weight'] = data.groupby('securityId')['weight'].cumsum()
+        data = data.groupby('securityId').apply(lambda g: _wavg(g, 'dailyfactor', 'weight'))
+    elif how == 'ewmean':
+        a = 2.0 / (1 + offset1)
+        data = data.sort_values('date', ascending=False)
+        data['weight'] = 1
+        data['weight'] = data.groupby('securityId')['weight'].cumsum()
+        data['weight'] = data['weight'].apply(lambda x: (1 - a) ** (x - 1))
+        data = data.groupby('securityId').apply(lambda g: _wavg(g, 'dailyfactor', 'weight'))
+    elif how == 'median':
+        data = data.groupby('securityId')['dailyfactor'].median()
+    elif how == 'std':
+        data = data.groupby('securityId')['dailyfactor'].std()
+    elif how == 'cv':
+        data = data.groupby('securityId')['dailyfactor'].mean() / data.groupby('securityId')['dailyfactor'].std()
+        data.replace([np.inf, -np.inf], np.nan, inplace=True)
+    elif how == 'prod':
+        data = data.groupby('securityId')['dailyfactor'].prod()
+    return data
+
+
+@pytest.mark.parametrize('how', ['mean', 'wmean', 'ewmean', 'median', 'std', 'cv', 'prod'])
+def test_sliding_matches_transform(how):
+    rng = np.random.RandomState(0)
+    dates = pd.date_range('2020-01-01', periods=15)
+    codes = ['%06d.SZ' % i for i in range(12)]
+    #部分股票某些天没有日度因子（停牌、上市较晚），值中有0和负数
+    daily = pd.DataFrame([(code, date, rng.choice([0.0, rng.randn() + 1, -rng.rand()]))
+                          for date in dates for code in codes if rng.rand() > 0.2],
+                         columns=['securityId', 'date', 'dailyfactor'])
+    window = RollingFactorWindow(how, LAG)
+    for i, date in enumerate(dates):
+        day = daily[daily['date'] == date]
+        window.push(date, day.set_index('securityId')['dailyfactor'])
+        if len(window) > LAG:
+            window.pop()
+        inWindow = daily[(daily['date'] > dates[max(i - LAG, -1)]) & (daily['date'] <= date)] if i >= LAG else \
+            daily[daily['date'] <= date]
+        expected = _transformToId(inWindow.copy(), how).astype(np.float64)
+        value = window.getValue().reindex(expected.index)
+        np.testing.assert_allclose(value.values, expected.values, rtol=1e-9, atol=1e-12)
+        counts = inWindow.groupby('securityId').size()
+        np.testing.assert_array_equal(window.getCount().reindex(counts.index).values, counts.values)
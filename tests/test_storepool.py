@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+
+pytest.importorskip('datafeeds')
+pytest.importorskip('sqlalchemy')
+from portmgr_Q.factor import storepool
+
+
+@pytest.fixture
+def dsn(tmpdir):
+    dsn = 'sqlite:///' + str(tmpdir.join('pool.db'))
+    yield dsn
+    storepool.disposeFactorStores(dsn)
+
+
+def test_same_store_in_process(dsn):
+    store = storepool.getFactorStore(dsn)
+    assert storepool.getFactorStore(dsn) is store
+    assert storepool.isCurrentProcess(store)
+
+
+def test_new_store_after_fork(dsn, monkeypatch):
+    #fork出的子进程（进程号不同）不使用父进程的连接池
+    parent = storepool.getFactorStore(dsn)
+    pid = os.getpid()
+    monkeypatch.setattr(storepool.os, 'getpid', lambda: pid + 1)
+    assert not storepool.isCurrentProcess(parent)
+    child = storepool.getFactorStore(dsn)
+    assert child is not parent
+    assert storepool.isCurrentProcess(child)
+    assert storepool.getFactorStore(dsn) is child
+    child.dispose()
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_forked_child_gets_own_store(dsn):
+    parent = storepool.getFactorStore(dsn)
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child = storepool.getFactorStore(dsn)
+            ok = child is not parent and child.pid == os.getpid()
+            os.write(write, b'1' if ok else b'0')
+        finally:
+            os._exit(0)
+    os.close(write)
+    result = os.read(read, 1)
+    os.waitpid(pid, 0)
+    assert result == b'1'
+    assert storepool.getFactorStore(dsn) is parent
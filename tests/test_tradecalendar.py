@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#TradingCalendar：缓存的时间点与直接从loader取的一致，多线程下查询与refresh不冲突
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.tradecalendar import TradingCalendar
+
+
+def _loader(frequency, beginDateTime, endDateTime):
+    days = pd.bdate_range(beginDateTime.date(), endDateTime.date())
+    bars = [day + pd.Timedelta(hours=15) for day in days] if frequency == 86400 else \
+        [day + pd.Timedelta(hours=9, minutes=30) + pd.Timedelta(seconds=frequency * (i + 1))
+         for day in days for i in range(14400 // frequency)]
+    return [bar for bar in bars if beginDateTime <= bar <= endDateTime]
+
+
+def test_bars_match_loader():
+    calendar = TradingCalendar(_loader, readAhead=10)
+    for begin, end in [(datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 20)),
+                       (datetime.datetime(2020, 1, 6), datetime.datetime(2020, 3, 3)),
+                       (datetime.datetime(2020, 3, 10), datetime.datetime(2020, 6, 1))]:
+        for frequency in [86400, 1800]:
+            expected = pd.DatetimeIndex(_loader(frequency, begin, end)).values
+            np.testing.assert_array_equal(calendar.getBars(begin, end, frequency), expected)
+    last = calendar.getLastBars(datetime.datetime(2020, 3, 2, 15), 20, 1800)
+    expected = pd.DatetimeIndex(_loader(1800, datetime.datetime(2020, 1, 1), datetime.datetime(2020, 3, 2, 15))).values[-20:]
+    np.testing.assert_array_equal(last, expected)
+
+
+def test_refresh_waits_for_get_bars():
+    #getBars在ensure之后取数组前，其他线程的refresh不能清空缓存
+    calendar = TradingCalendar(_loader)
+    ensure = calendar.ensure
+    def ensureThenRefresh(*args):
+        ensure(*args)
+        thread = threading.Thread(target=calendar.refresh)
+        thread.start()
+        thread.join(0.2)
+        threads.append(thread)
+    threads = []
+    calendar.ensure = ensureThenRefresh
+    bars = calendar.getBars(datetime.datetime(2020, 3, 2), datetime.datetime(2020, 3, 6, 15), 86400)
+    assert len(bars) == 5
+    threads[0].join()
+    assert calendar.bars == {}
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+#UniverseStore：某日的股票池与直接从loader取的一致（含其他列）
+import datetime
+import numpy as np
+import pandas as pd
+
+from portmgr_Q.factor.universe import UniverseStore
+
+DAYS = [d.to_pydatetime() for d in pd.bdate_range('2020-01-01', periods=30)]
+CODES = ['%06d.SZ' % i for i in range(12)]
+
+
+def _loader(dateTime):
+    #第i只股票在第i天上市，第i+20天退市
+    i = DAYS.index(dateTime)
+    ids = [code for k, code in enumerate(CODES) if k <= i < k + 20]
+    return pd.DataFrame({'securityId': ids, 'name': ['N' + code[:6] for code in ids]})
+
+
+def test_universe_matches_loader_with_columns():
+    store = UniverseStore(_loader)
+    store.build(DAYS[:20])
+    for day in DAYS:
+        expected = _loader(day).sort_values('securityId').reset_index(drop=True)
+        pd.testing.assert_frame_equal(store.getUniverse(day), expected)
+    assert store.loads == len(DAYS)
+
+
+def test_suspended_excluded(tmpdir):
+    store = UniverseStore(_loader)
+    store.build(DAYS)
+    store.setSuspended(pd.DataFrame({'dateTime': [DAYS[5]], 'securityId': [CODES[2]]}))
+    assert store.isSuspended(DAYS[5], CODES[2])
+    assert not store.isSuspended(DAYS[6], CODES[2])
+    assert CODES[2] in list(store.getUniverse(DAYS[5])['securityId'])
+    assert CODES[2] not in list(store.getUniverse(DAYS[5], excludeSuspended=True)['securityId'])
+    path = str(tmpdir.join('universe.npz'))
+    store.save(path)
+    loaded = UniverseStore.load(path)
+    np.testing.assert_array_equal(loaded.getUniverse(DAYS[5], True)['securityId'].values,
+                                  store.getUniverse(DAYS[5], True)['securityId'].values)
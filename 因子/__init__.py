@@ -9,18 +9,46 @@
 """
 import abc
 import types
+import collections
 import datetime
 import pandas as pd
 import numpy as np
-from sqlalchemy.types import CHAR
+from sqlalchemy import text
+from sqlalchemy.types import CHAR, VARCHAR
 from datafeeds.utils import DateTimeForm, DBType
 from datafeeds.utils.financeutil import SecurityIdForm
 from datafeeds.utils.relationaldb import ConnectDB
 from datafeeds.utils.nosqldb import ConnectNoSQLDB
 from portmgr_Q.factor import missingvalue, outliers, standardization
+from portmgr_Q.factor.rolling import RollingFactorWindow
+from portmgr_Q.factor.dailystore import BaseDailyFactorStore, PickleDailyFactorStore, ColumnarDailyFactorStore
+from portmgr_Q.factor.minutestore import MinuteDataStore
+from portmgr_Q.factor.panel import MinutePanel
+from portmgr_Q.factor.batch import FactorBatch
+from portmgr_Q.factor.storepool import SQL_DB_TYPES, BasePooledStore, getFactorStore, isCurrentProcess
+from portmgr_Q.factor.factorcache import FactorValueCache
+from portmgr_Q.factor.crosssection import CrossSectionPipeline
+from portmgr_Q.factor.neutralize import Neutralizer, industryDummies
+from portmgr_Q.factor.tradecalendar import TradingCalendar
+from portmgr_Q.factor.universe import UniverseStore
+from portmgr_Q.factor.ringpanel import RingPanel
+from portmgr_Q.factor.prefetch import Prefetcher
+from portmgr_Q.factor.chunkfetch import ChunkedFetcher, FeedPool
+from portmgr_Q.factor.feedcache import CachedDataFeeds
+from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
 from datafeeds import DataFeeds
 import time
 import os
+import threading
+import contextlib
+import multiprocessing
+
+#清单表（manifest）的字段名，所有因子共用
+MANIFEST_VARIABLE_NAME = {'dateTime':'tdate',
+                          'factorSymbol':'factor_symbol',
+                          'dataNumber':'data_number',
+                          'nullNumber':'null_number',
+                          'updataDateTime':'operation_date'}
 
 class BaseFactor(object):    
     """
@@ -168,6 +196,8 @@ class BaseFactorWithDB(BaseFactor):
         """
         # Set factorStoreDB, __factorStoreDB is an instance
         self.__factorStoreDB = None
+        # Set factorStoreDSN: (dsn, options) when factorStoreDB is a shared pool from storepool.getFactorStore
+        self.__factorStoreDSN = None
         # Set tableNameInDB
         self.__tableNameInDB = self.getFactorSymbol().lower()
         # Set tableVariableName
@@ -179,6 +209,12 @@ class BaseFactorWithDB(BaseFactor):
         self.__dateTimeFormInDB = DateTimeForm.strDate
         self.__securityIdFormInDB = SecurityIdForm.defaultId
         self.__securityIdLengthInDB = 20
+        # Set manifestTableNameInDB: the table recording the number of data of each (factor_symbol, tdate), None means no manifest
+        self.__manifestTableNameInDB = None
+        self.__manifestReady = False
+        self.__mongoIndexReady = False
+        # Set factorValueCache: FactorValueCache in front of getOrCalculateFactorValue, None means no cache
+        self.__factorValueCache = None
         """
         #----------------------------------------------------------------------
         #----Attibutes related to missing value, outliers and standardization--
@@ -207,8 +243,94 @@ class BaseFactorWithDB(BaseFactor):
     # note: This Dictionary type is easy to be transformed to DataFrame 
     # If there is no data, then return 'None'.
     """     
-    def getFactorValueFromSQLDB(self, dateTimeList):
-        
+    def _formatDateTimeForDB(self, dateTimeList):
+        #把dateTimeList转为数据库中dateTime字段的取值（按getDateTimeFormInDB）
+        dateTimeForm = self.getDateTimeFormInDB()
+        if dateTimeForm == DateTimeForm.strDate:
+            return [dateTime.strftime('%Y-%m-%d') for dateTime in dateTimeList]
+        elif dateTimeForm == DateTimeForm.strDateTime:
+            return [dateTime.strftime('%Y-%m-%d %H:%M:%S') for dateTime in dateTimeList]
+        elif dateTimeForm == DateTimeForm.intDate:
+            return [int(dateTime.strftime('%Y%m%d')) for dateTime in dateTimeList]
+        elif dateTimeForm == DateTimeForm.strIntDate:
+            return [dateTime.strftime('%Y%m%d') for dateTime in dateTimeList]
+        else:
+            raise BaseException("[BaseFactorWithDB] Not support dateTimeForm in database:%s" % dateTimeForm)
+
+    def _getSQLParams(self):
+        #绑定参数的dict：连接池（PooledSQLStore）可以绑定参数，返回{}；
+        #原有的ConnectDB只能执行拼好的语句，返回None，取值用字面量
+        if isinstance(self.getFactorStoreDB(), BasePooledStore):
+            return {}
+        return None
+
+    def _toSQLValues(self, values, params, fixedChar=True):
+        #sql语句中的取值列表。params为dict时用绑定参数，取值加入params：
+        #因子表的字段多为CHAR，Oracle上VARCHAR类型的绑定参数与CHAR字段比较时不补空格，匹配不到，
+        #所以CHAR字段（fixedChar）上的字符串写为CAST(:p AS CHAR(n))，与字面量一样按CHAR比较；
+        #params为None时为字面量
+        if params is None:
+            return self._toSQLLiteral(values)
+        binds = []
+        for value in values:
+            name = 'p%d' % len(params)
+            if isinstance(value, (types.IntType, types.LongType, np.integer)):
+                params[name] = int(value)
+                binds.append(':' + name)
+            elif fixedChar:
+                params[name] = value
+                binds.append('CAST(:' + name + ' AS CHAR(%d))' % max(20, len(value)))
+            else:
+                params[name] = value
+                binds.append(':' + name)
+        return ", ".join(binds)
+
+    def _toSQLLiteral(self, values):
+        #sql语句中的取值列表：数字原样，字符串加单引号（其中的单引号写两次），用于不能绑定参数的ConnectDB
+        literals = []
+        for value in values:
+            if isinstance(value, (types.IntType, types.LongType, np.integer)):
+                literals.append(str(value))
+            else:
+                literals.append("'" + value.replace("'", "''") + "'")
+        return ", ".join(literals)
+
+    def _hasSQLTransaction(self):
+        #连接池（PooledSQLStore）有事务接口，原有的ConnectDB没有
+        return isinstance(self.getFactorStoreDB(), BasePooledStore)
+
+    def _beginSQLTransaction(self):
+        #连接池返回事务的上下文，其中的连接用于_executeSQL和写入；
+        #原有的ConnectDB返回None，各语句单独执行
+        if self._hasSQLTransaction():
+            return self.getFactorStoreDB().begin()
+        return None
+
+    def _parseDateTimeFromDB(self, values):
+        #把数据库中dateTime字段的取值整列转为datetime，不再逐行strptime
+        dateTimeForm = self.getDateTimeFormInDB()
+        values = pd.Series(values)
+        if dateTimeForm == DateTimeForm.intDate:
+            values = values.astype(np.int64).astype(str)
+        else:
+            values = values.astype(str).str.strip()
+        if dateTimeForm == DateTimeForm.strDate:
+            return pd.to_datetime(values, format='%Y-%m-%d')
+        elif dateTimeForm == DateTimeForm.strDateTime:
+            return pd.to_datetime(values, format='%Y-%m-%d %H:%M:%S')
+        elif dateTimeForm in [DateTimeForm.intDate, DateTimeForm.strIntDate]:
+            return pd.to_datetime(values, format='%Y%m%d')
+        else:
+            raise BaseException("[BaseFactorWithDB] Not support dateTimeForm in database:%s" % dateTimeForm)
+
+    def getFactorValueFromSQLDB(self, dateTimeList, chunkSize=1000):
+        """
+        #----------------------------------------------------------------------
+        # 从关系型数据库读取dateTimeList的因子值。
+        # 日期多时按chunkSize分批（Oracle的in列表最多1000项），
+        # 只取dateTime、securityId、factorValue三列，日期整列转换。
+        # @return  DataFrame ['dateTime','securityId','factorValue']
+        """
         # Step1 Check if the type of input parameter(s) is right.
         if type(dateTimeList) != types.ListType:
             raise BaseException(" [BaseFactorWithDB]'dateTimeList' must be list." )
@@ -216,74 +338,67 @@ class BaseFactorWithDB(BaseFactor):
             for dateTime in dateTimeList:
                 if type(dateTime) != datetime.datetime:
                     raise BaseException(" [BaseFactorWithDB] item in 'dateTimeList' must be datetime.datetime." )
-        dateTimeList = list(set(dateTimeList))
+        dateTimeList = sorted(set(dateTimeList))
+        if len(dateTimeList) == 0:
+            return pd.DataFrame()
         # Step2 Get some vaariables about factor value in database.
         securityIdName = self.getTableVariableName('securityId') 
         dateTimeName = self.getTableVariableName('dateTime') 
         factorValueName = self.getTableVariableName('factorValue') 
         factorSymbolName = self.getTableVariableName('factorSymbol') 
         talbeInDB = self.getTableNameInDB() 
-        factorSymbol = "'"+self.getFactorSymbol()+"'" 
+        dbDateTimeList = self._formatDateTimeForDB(dateTimeList)
         
-        # Step3 Generate sql code.
-        dbDateTimeList = ""
-        if self.getDateTimeFormInDB() == DateTimeForm.strDate:
-            for dateTime in dateTimeList:
-                if dateTime == dateTimeList[-1]:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y-%m-%d') + "'"
-                else:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y-%m-%d') + "', "
-        elif self.getDateTimeFormInDB() == DateTimeForm.strDateTime:
-            for dateTime in dateTimeList:
-                if dateTime == dateTimeList[-1]:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y-%m-%d %H:%M:%S') + "'"
-                else:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y-%m-%d %H:%M:%S') + "', "
-        elif self.getDateTimeFormInDB() == DateTimeForm.intDate:
-            for dateTime in dateTimeList:
-                if dateTime == dateTimeList[-1]:
-                    dbDateTimeList += dateTime.strftime('%Y%m%d')
-                else:
-                    dbDateTimeList += dateTime.strftime('%Y%m%d') + ", "
-        elif self.getDateTimeFormInDB() == DateTimeForm.strIntDate:
-            for dateTime in dateTimeList:
-                if dateTime == dateTimeList[-1]:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y%m%d') + "'"
-                else:
-                    dbDateTimeList += "'" + dateTime.strftime('%Y%m%d') + "', "        
-        else:
-            raise BaseException("[BaseFactorWithDB] Not support dateTimeForm in database when getting data from database:%s" % self.getDateTimeFormInDB())
-            
-        sqlCause = ("select " + dateTimeName + " as datetime, " + securityIdName + " as securityid, " + factorValueName + " as factorvalue from "
-                + talbeInDB +" where " + dateTimeName + " in (" + dbDateTimeList +") and " + factorSymbolName + " = "+factorSymbol)
-#        print sqlCause
-        # Step4 Get date from database.
-        data1 = self.getFactorStoreDB().getDataWithSqlClause(sqlCause)
+        # Step3,4 Generate sql code and get data from database chunk by chunk.
+        frames = []
+        for start in range(0, len(dbDateTimeList), chunkSize):
+            chunk = dbDateTimeList[start:start + chunkSize]
+            params = self._getSQLParams()
+            sqlCause = ("select " + dateTimeName + " as datetime, " + securityIdName + " as securityid, " + factorValueName + " as factorvalue from "
+                    + talbeInDB + " where " + dateTimeName + " in (" + self._toSQLValues(chunk, params)
+                    + ") and " + factorSymbolName + " = " + self._toSQLValues([self.getFactorSymbol()], params))
+            frames.append(self._getSQLData(sqlCause, params))
+        data1 = pd.concat(frames, ignore_index=True)
         if len(data1) == 0:
             return pd.DataFrame()
+        data1.columns = [column.lower() for column in data1.columns]
+        data1 = data1.loc[:, ["datetime", "securityid", "factorvalue"]]
         data1.rename(columns={"datetime":"dateTime", "securityid":"securityId", "factorvalue":"factorValue"}, inplace=True)
-        data1['securityId'] = data1['securityId'].str.strip() 
-        if self.getDateTimeFormInDB() in [DateTimeForm.strDate, DateTimeForm.strDateTime, DateTimeForm.strIntDate]:
-            data1['dateTime'] = data1['dateTime'].astype(np.str)
-            data1['dateTime'] = data1['dateTime'].str.strip()
-        if self.getDateTimeFormInDB() == DateTimeForm.strDate:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y-%m-%d"))
-        elif self.getDateTimeFormInDB() == DateTimeForm.strDateTime:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y-%m-%d %H:%M:%S"))
-        elif self.getDateTimeFormInDB() in [DateTimeForm.intDate , DateTimeForm.strIntDate]:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y%m%d"))
+        data1['securityId'] = data1['securityId'].astype(str).str.strip() 
+        data1['dateTime'] = self._parseDateTimeFromDB(data1['dateTime']).values
         
         # Step5 Check if get factor value of all dateTime in dateTimeList
         inputDateTime = set(dateTimeList)
-        outputDateTime = set(data1.loc[:,'dateTime'])
-        noValueDateTime = list(inputDateTime-outputDateTime)
+        outputDateTime = set(pd.to_datetime(data1['dateTime'].unique()).to_pydatetime())
+        noValueDateTime = sorted(inputDateTime-outputDateTime)
         if len(noValueDateTime) != 0 :
             print("[BaseFactorWithDB] Can not get factor value of factor: %s in datetime: %s"%(self.getFactorSymbol(), str(noValueDateTime)))
         data = data1
         return data
         
-    def getFactorValueFromMongoDB(self, dateTimeList):
-        
+    def _getMongoCollection(self):
+        #因子表所在的collection，第一次使用时建立(factor_symbol, tdate, security_code)上的unique复合索引，
+        #写入按这三个字段upsert，索引的前缀也用于按(factor_symbol, tdate)的查询和删除；
+        #旧表中已有重复记录（或已有同名的非unique索引）时不能建立unique索引，改为普通索引
+        collection = self.getFactorStoreDB().connectDB()[self.getTableNameInDB()]
+        if not self.__mongoIndexReady:
+            keys = [(self.getTableVariableName('factorSymbol'), 1), (self.getTableVariableName('dateTime'), 1),
+                    (self.getTableVariableName('securityId'), 1)]
+            try:
+                collection.create_index(keys, unique=True)
+            except Exception as err:
+                print("[BaseFactorWithDB] Can not create unique index on %s, use a non-unique one: %s" % (self.getTableNameInDB(), err))
+                collection.create_index(keys)
+            self.__mongoIndexReady = True
+        return collection
+
+    def getFactorValueFromMongoDB(self, dateTimeList, batchSize=10000):
+        """
+        #----------------------------------------------------------------------
+        # 从MongoDB读取dateTimeList的因子值：一次$in查询，只取三个字段，
+        # 按batchSize分批取回并直接填入各列，日期整列转换。
+        # @return  DataFrame ['dateTime','securityId','factorValue']
+        """
         # Step1 Check if the type of input parameter(s) is right.
         if type(dateTimeList) != types.ListType:
             raise BaseException(" [BaseFactorWithDB]'dateTimeList' must be list." )
@@ -291,60 +406,56 @@ class BaseFactorWithDB(BaseFactor):
             for dateTime in dateTimeList:
                 if type(dateTime) != datetime.datetime:
                     raise BaseException(" [BaseFactorWithDB] item in 'dateTimeList' must be datetime.datetime." )
-        dateTimeList = list(set(dateTimeList))
+        dateTimeList = sorted(set(dateTimeList))
+        if len(dateTimeList) == 0:
+            return pd.DataFrame()
         # Step2 Get some vaariables about factor value in database.
         tableVariableName = self.getTableVariableName()
         securityIdName = tableVariableName['securityId']       
         dateTimeName = tableVariableName['dateTime']
         factorValueName = tableVariableName['factorValue']
         factorSymbolName = tableVariableName['factorSymbol']
-        talbeInDB = self.getTableNameInDB() 
-        factorSymbol = self.getFactorSymbol()  
-        
         # Step3 Generate dbDateTimeList.
-        dbDateTimeList = []
-        if self.getDateTimeFormInDB() == DateTimeForm.strDate:
-            for dateTime in dateTimeList:
-                dbDateTimeList.append(dateTime.strftime('%Y-%m-%d'))
-        elif self.getDateTimeFormInDB() == DateTimeForm.strDateTime:
-            for dateTime in dateTimeList:
-                dbDateTimeList.append(dateTime.strftime('%Y-%m-%d %H:%M:%S'))
-        elif self.getDateTimeFormInDB() == DateTimeForm.intDate:
-            for dateTime in dateTimeList:
-                dbDateTimeList.append(int(dateTime.strftime('%Y%m%d')))
-        elif self.getDateTimeFormInDB() == DateTimeForm.strIntDate:
-            for dateTime in dateTimeList:
-                dbDateTimeList.append(dateTime.strftime('%Y%m%d'))
-        else:
-            raise BaseException("[BaseFactorWithDB] Not support dateTimeForm in database when getting data from database:%s" % self.getDateTimeFormInDB())
+        dbDateTimeList = self._formatDateTimeForDB(dateTimeList)
         # Step4 Get date from database.
-        db = self.getFactorStoreDB().connectDB()
-        collection = db[talbeInDB]
-        data0 = []
-        for doc in collection.find({dateTimeName:{"$in":dbDateTimeList}, factorSymbolName:factorSymbol}):
-            data0.append(doc)
-        if len(data0) == 0:
+        cursor = self._getMongoCollection().find({factorSymbolName:self.getFactorSymbol(), dateTimeName:{"$in":dbDateTimeList}},
+                                                 projection={dateTimeName:1, securityIdName:1, factorValueName:1, '_id':0},
+                                                 batch_size=batchSize)
+        dateTimes, securityIds, factorValues = [], [], []
+        for doc in cursor:
+            dateTimes.append(doc.get(dateTimeName))
+            securityIds.append(doc.get(securityIdName))
+            factorValues.append(doc.get(factorValueName))
+        if len(dateTimes) == 0:
             return pd.DataFrame()
-        data1 = pd.DataFrame(data0).loc[:,[securityIdName, dateTimeName, factorValueName]]  
-        data1.rename(columns={dateTimeName:"dateTime", securityIdName:"securityId", factorValueName:"factorValue"}, inplace=True)
-        data1['securityId'] = data1['securityId'].str.strip() 
-        if self.getDateTimeFormInDB() in [DateTimeForm.strDate, DateTimeForm.strDateTime, DateTimeForm.strIntDate]:
-            data1['dateTime'] = data1['dateTime'].str.strip()
-        if self.getDateTimeFormInDB() == DateTimeForm.strDate:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y-%m-%d"))
-        elif self.getDateTimeFormInDB() == DateTimeForm.strDateTime:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y-%m-%d %H:%M:%S"))
-        elif self.getDateTimeFormInDB() in [DateTimeForm.intDate , DateTimeForm.strIntDate]:
-            data1.loc[:,'dateTime'] = data1.loc[:,'dateTime'].apply(lambda x: datetime.datetime.strptime(str(x).strip(),"%Y%m%d"))
+        data1 = pd.DataFrame({'dateTime':self._parseDateTimeFromDB(dateTimes).values,
+                              'securityId':pd.Series(securityIds, dtype=object).str.strip().values,
+                              'factorValue':np.array(factorValues, dtype=np.float64)},
+                             columns=['dateTime', 'securityId', 'factorValue'])
         
         # Step5 Check if get factor value of all dateTime in dateTimeList
         inputDateTime = set(dateTimeList)
-        outputDateTime = set(data1.loc[:,'dateTime'])
-        noValueDateTime = list(inputDateTime-outputDateTime)
+        outputDateTime = set(pd.to_datetime(data1['dateTime'].unique()).to_pydatetime())
+        noValueDateTime = sorted(inputDateTime-outputDateTime)
         if len(noValueDateTime) != 0 :
             print("[BaseFactorWithDB] Can not get factor value of factor: %s in datetime: %s"%(self.getFactorSymbol(), str(noValueDateTime)))
         data = data1
         return data
+
+    def _bulkWriteToMongoDB(self, data, batchSize=10000):
+        #data为以数据库字段名为列的DataFrame；按(factor_symbol, tdate, security_code)无序批量upsert，
+        #写入中断或与其他进程同时写入时不会留下重复记录。
+        #返回匹配和新插入的记录数之和，与len(data)不等时调用方不更新清单表
+        from pymongo import UpdateOne
+        collection = self._getMongoCollection()
+        keys = [self.getTableVariableName(item) for item in ['factorSymbol', 'dateTime', 'securityId']]
+        records = data.to_dict('records')
+        written = 0
+        for start in range(0, len(records), batchSize):
+            result = collection.bulk_write([UpdateOne(dict((key, record[key]) for key in keys), {'$set':record}, upsert=True)
+                                            for record in records[start:start + batchSize]], ordered=False)
+            written += result.matched_count + result.upserted_count
+        return written
     
     
     def getFactorValueFromDB(self, dateTimeList):
@@ -352,7 +463,34 @@ class BaseFactorWithDB(BaseFactor):
         if self.getFactorStoreDB()== None:
 #            print "__________________________________11111111111111___________"
             return pd.DataFrame()
-        if self.getFactorStoreDB().getDBType() in [DBType.sqlServer, DBType.oracle, DBType.postGreSql]:
+        if self.getManifestTableNameInDB() != None and len(dateTimeList) > 0:
+            #设置了清单表时，清单表中有数据的日期直接读取；清单表中没有的日期（如设置清单表之前写入的）
+            #再查因子表，查到的日期补入清单表
+            counts = self.getFactorValueCountFromDB(dateTimeList)
+            listed = sorted(counts.keys())
+            unlisted = sorted(set(dateTimeList) - set(counts.keys()))
+            frames = []
+            if len(listed) > 0:
+                frames.append(self._readFactorValueFromDB(listed))
+            if len(unlisted) > 0:
+                data = self._readFactorValueFromDB(unlisted)
+                if len(data) > 0:
+                    frames.append(data)
+                    counts = pd.DataFrame({'dateTime':data['dateTime'].values, 'dataNumber':1,
+                                           'nullNumber':data['factorValue'].isnull().astype(int).values})
+                    try:
+                        self._writeManifestToDB(counts.groupby('dateTime', as_index=False).sum())
+                    except Exception as err:
+                        print("[BaseFactorWithDB] Can not add the dates read from factor table to manifest: %s" % err)
+            frames = [data for data in frames if len(data) > 0]
+            if len(frames) == 0:
+                return pd.DataFrame()
+            return pd.concat(frames, ignore_index=True)
+        return self._readFactorValueFromDB(dateTimeList)
+
+    def _readFactorValueFromDB(self, dateTimeList):
+        #从因子表读取，不经过清单表
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
             data = self.getFactorValueFromSQLDB(dateTimeList)
         elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
             data = self.getFactorValueFromMongoDB(dateTimeList)
@@ -373,9 +511,17 @@ class BaseFactorWithDB(BaseFactor):
         # step0 Check if the type of input parameter(s) is right.
         if dateTime == None:
             raise BaseException("Need to set a dateTime." )
+        # 设置了缓存时先查缓存
+        cache = self.getFactorValueCache()
+        if cache != None:
+            data = cache.get(self, dateTime)
+            if data is not None:
+                return data
         # step1 Secondly, get data form database. If has then return, ontherwise run step2
         data1 = self.getFactorValueFromDB(dateTimeList=[dateTime])
         if len(data1) != 0:
+            if cache != None:
+                cache.put(self, dateTime, data1)
             return data1
         # step2 Finally, caculate factor value.
         data2 = self.calculateFactorValue(dateTime)
@@ -383,8 +529,27 @@ class BaseFactorWithDB(BaseFactor):
             return pd.DataFrame()
         else:
             data2.loc[:,"dateTime"] = dateTime
+            if cache != None:
+                cache.put(self, dateTime, data2)
             return data2          
     
+    def calculateFactorValues(self, dateTimeList):
+        """
+        #----------------------------------------------------------------------
+        # 多个日期的因子值，默认逐日调用calculateFactorValue；子类可以一起计算
+        # @param dateTimeList: type: List of python DateTime
+        # @return  DataFrame ['dateTime','securityId','factorValue']，长表
+        """
+        frames = []
+        for dateTime in dateTimeList:
+            data = self.calculateFactorValue(dateTime)
+            if len(data) > 0:
+                data.loc[:, "dateTime"] = dateTime
+                frames.append(data)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
     def getStandardizedFactorValue(self, dateTime):
         # step1 Get and transform factor value to be the correct type.
         data1 =  self.getOrCalculateFactorValue(dateTime)
@@ -404,6 +569,143 @@ class BaseFactorWithDB(BaseFactor):
             data = pd.DataFrame({'dateTime':dateTime,'securityId':data5.keys(), 'factorValue':data5.values()}) 
             return data 
     
+    def getFactorValuePanel(self, dateTimeList):
+        """
+        #----------------------------------------------------------------------
+        # 多个日期的因子值组成的面板：因子库中已有的日期一次读出，缓存中有的日期取缓存，
+        # 其余日期交给calculateFactorValues一起计算
+        # @param dateTimeList: type: List of python DateTime
+        # @return  DataFrame，索引为dateTime，列为securityId，缺失为nan
+        """
+        dateTimeList = sorted(set(dateTimeList))
+        frames = []
+        if self.getFactorStoreDB() != None and len(dateTimeList) > 0:
+            data = self.getFactorValueFromDB(dateTimeList)
+            if len(data) > 0:
+                frames.append(data.loc[:, ['dateTime', 'securityId', 'factorValue']])
+                stored = set(pd.DatetimeIndex(data['dateTime'].unique()).to_pydatetime())
+                dateTimeList = [dt for dt in dateTimeList if dt not in stored]
+        cache = self.getFactorValueCache()
+        if cache != None:
+            missing = []
+            for dateTime in dateTimeList:
+                data = cache.get(self, dateTime)
+                if data is None:
+                    missing.append(dateTime)
+                elif len(data) > 0:
+                    frames.append(data.loc[:, ['dateTime', 'securityId', 'factorValue']])
+            dateTimeList = missing
+        if len(dateTimeList) > 0:
+            data = self.calculateFactorValues(dateTimeList)
+            if len(data) > 0:
+                frames.append(data.loc[:, ['dateTime', 'securityId', 'factorValue']])
+                if cache != None:
+                    for dateTime, group in data.groupby('dateTime'):
+                        cache.put(self, pd.Timestamp(dateTime).to_pydatetime(), group.reset_index(drop=True))
+        if len(frames) == 0:
+            return pd.DataFrame()
+        data = pd.concat(frames, ignore_index=True)
+        data['dateTime'] = pd.to_datetime(data['dateTime'])
+        data['factorValue'] = data['factorValue'].astype(np.float64)
+        return data.pivot_table(index='dateTime', columns='securityId', values='factorValue', aggfunc='last')
+
+    def getStandardizedFactorPanel(self, dateTimeList, pipeline=None):
+        """
+        #----------------------------------------------------------------------
+        # 多个日期的标准化因子值，在 日期×股票 的面板上一次完成缺失值、去极值和标准化
+        # @param pipeline: type: CrossSectionPipeline; None时按setProcessMissingValue、setProcessOutliers、
+        #                  setStandardization的设置，见getCrossSectionPipeline；
+        #                  设置不能对应到CrossSectionPipeline时按日期逐个调用getStandardizedFactorValue
+        # @return  DataFrame，索引为dateTime，列为securityId，已乘以factorDirection
+        """
+        if pipeline == None:
+            pipeline = self.getCrossSectionPipeline()
+            if pipeline == None:
+                return self._getStandardizedFactorPanelByDate(dateTimeList)
+        panel = self.getFactorValuePanel(dateTimeList)
+        if len(panel) == 0:
+            return panel
+        return pipeline.processFrame(panel, self.getFactorDirection())
+
+    def _getStandardizedFactorPanelByDate(self, dateTimeList):
+        #与getStandardizedFactorPanel的结果形式相同，每个日期经过设置的缺失值、去极值、标准化实例
+        frames = []
+        for dateTime in sorted(set(dateTimeList)):
+            data = self.getStandardizedFactorValue(dateTime)
+            if len(data) > 0:
+                frames.append(data)
+        if len(frames) == 0:
+            return pd.DataFrame()
+        data = pd.concat(frames, ignore_index=True)
+        data['dateTime'] = pd.to_datetime(data['dateTime'])
+        data['factorValue'] = data['factorValue'].astype(np.float64)
+        return data.pivot_table(index='dateTime', columns='securityId', values='factorValue', aggfunc='last')
+
+    def getCrossSectionPipeline(self):
+        """
+        #----------------------------------------------------------------------
+        # 与缺失值、去极值、标准化的设置相同的CrossSectionPipeline：
+        #     DeleteMissingValue -> 'delete'；KeepOutliers -> 不去极值；SigmaMethod -> 'sigma'；ZScore -> 'zscore'
+        # 倍数取SigmaMethod实例的n（没有时为3），标准差的自由度取实例的ddof，没有时依次试0和1；
+        # 候选的pipeline要在一个含缺失值和极值的截面上与这些实例的结果一致才使用。
+        # 其他实例（包括这些类的子类）或结果不一致时返回None，getStandardizedFactorPanel按日期逐个处理
+        """
+        processMissingValue = self.getProcessMissingValue()
+        processOutliers = self.getProcessOutliers()
+        processStandardization = self.getStandardization()
+        if type(processMissingValue) is not missingvalue.DeleteMissingValue:
+            return None
+        n = 3
+        if type(processOutliers) is outliers.KeepOutliers:
+            outliersMethod = None
+        elif type(processOutliers) is outliers.SigmaMethod:
+            outliersMethod = 'sigma'
+            n = getattr(processOutliers, 'n', n)
+        else:
+            return None
+        if type(processStandardization) is not standardization.ZScore:
+            return None
+        ddofs = [0, 1]
+        for process in [processOutliers, processStandardization]:
+            if getattr(process, 'ddof', None) is not None:
+                ddofs = [process.ddof]
+        for ddof in ddofs:
+            pipeline = CrossSectionPipeline(missing='delete', outliers=outliersMethod, n=n, standardize='zscore', ddof=ddof)
+            if self._matchCrossSectionPipeline(pipeline):
+                return pipeline
+        return None
+
+    def _matchCrossSectionPipeline(self, pipeline):
+        #在一个含缺失值、极值的截面上比较pipeline与设置的实例的结果
+        count = int((pipeline.n + 2) ** 2) + 2
+        values = list(np.linspace(-1.0, 1.0, count)) + [10.0 * count, np.nan]
+        securityIds = ['%06d' % i for i in range(len(values))]
+        try:
+            data = self.getProcessMissingValue().process(dict(zip(securityIds, values)))
+            data = self.getProcessOutliers().process(data)
+            data = self.getStandardization().process(data, self.getFactorDirection())
+        except Exception:
+            return False
+        expected = pipeline.process([values], self.getFactorDirection())[0]
+        expected = dict((s, v) for s, v in zip(securityIds, expected) if not np.isnan(v))
+        if sorted(data.keys()) != sorted(expected.keys()):
+            return False
+        return np.allclose([data[s] for s in securityIds if s in expected],
+                           [expected[s] for s in securityIds if s in expected], rtol=1e-9, atol=1e-12)
+
+    def getNeutralizedFactorPanel(self, dateTimeList, neutralizer, pipeline=None):
+        """
+        #----------------------------------------------------------------------
+        # 标准化之后对暴露（行业、市值等）中性化的因子值
+        # @param neutralizer: type: Neutralizer; 多个因子用同一个neutralizer时，
+        #                     可以把各自的标准化面板交给neutralizer.neutralize一起处理
+        # @return  DataFrame，索引为dateTime，列为securityId，为回归残差
+        """
+        panel = self.getStandardizedFactorPanel(dateTimeList, pipeline)
+        if len(panel) == 0:
+            return panel
+        return neutralizer.neutralize(panel)
+
     """
     #--------------------------------------------------------------------------
     #----Methods related to update factor table to database--------------------
@@ -441,6 +743,8 @@ class BaseFactorWithDB(BaseFactor):
         # so all variable names in sql clause are low_case, such as 'securityid' not 'securityId'. 
         sqlCause = ("delete from " + talbeInDB +" where " + dateTimeName + " = " + dbDateTime +" and " + factorSymbolName + " = "+factorSymbol)
         self.getFactorStoreDB().deleteDataWithSqlClause(sqlCause)
+        self._deleteManifestInDB([dateTime])
+        self._invalidateFactorValueCache([dateTime])
     
     def deleteFactorValueInMongoDB(self, dateTime):
         # step1 Check if database and table exist. If not return None.
@@ -469,17 +773,56 @@ class BaseFactorWithDB(BaseFactor):
         factorSymbolName = self.getTableVariableName() ['factorSymbol'] 
         talbeInDB = self.getTableNameInDB()
         factorSymbol = self.getFactorSymbol() 
-        db = self.getFactorStoreDB().connectDB()
-        collection = db[talbeInDB]
+        collection = self._getMongoCollection()
         collection.delete_many({dateTimeName:dbDateTime, factorSymbolName:factorSymbol})
+        self._deleteManifestInDB([dateTime])
+        self._invalidateFactorValueCache([dateTime])
         
     def deleteFactorValueInDB(self, dateTime): 
-        if self.getFactorStoreDB().getDBType() in [DBType.sqlServer, DBType.oracle, DBType.postGreSql]:
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
             self.deleteFactorValueInSQLDB(dateTime)
         elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
             self.deleteFactorValueInMongoDB(dateTime)
         else:
             raise BaseException("[BaseFactorWithDB] Not support factorStoreDB in database when deleting data from database:%s" % self.getFactorStoreDB())
+
+    def deleteFactorValueListInDB(self, dateTimeList, chunkSize=1000):
+        #删除dateTimeList中全部日期的因子值：MongoDB为一次$in删除，关系型数据库每chunkSize个日期一条delete
+        if self.getFactorStoreDB() == None:
+            raise BaseException("[BaseFactorWithDB]No database or table." )
+        for dateTime in dateTimeList:
+            if type(dateTime) != datetime.datetime:
+                raise BaseException("[BaseFactorWithDB]Not support dateTime:%s" % dateTime)
+        dateTimeList = sorted(set(dateTimeList))
+        if len(dateTimeList) == 0:
+            return
+        dateTimeName = self.getTableVariableName('dateTime')
+        factorSymbolName = self.getTableVariableName('factorSymbol')
+        dbDateTimeList = self._formatDateTimeForDB(dateTimeList)
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
+            if self.getFactorStoreDB().hasTable(self.getTableNameInDB()) == False:
+                raise BaseException("[BaseFactorWithDB]No database or table." )
+            def delete(connection):
+                for start in range(0, len(dbDateTimeList), chunkSize):
+                    chunk = dbDateTimeList[start:start + chunkSize]
+                    params = self._getSQLParams()
+                    sqlCause = ("delete from " + self.getTableNameInDB() + " where " + dateTimeName + " in ("
+                            + self._toSQLValues(chunk, params) + ") and "
+                            + factorSymbolName + " = " + self._toSQLValues([self.getFactorSymbol()], params))
+                    self._executeSQL(sqlCause, connection, params)
+                self._deleteManifestInDB(dateTimeList, connection)
+            transaction = self._beginSQLTransaction()
+            if transaction is None:
+                delete(None)
+            else:
+                with transaction as connection:
+                    delete(connection)
+        elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+            self._getMongoCollection().delete_many({dateTimeName:{"$in":dbDateTimeList}, factorSymbolName:self.getFactorSymbol()})
+            self._deleteManifestInDB(dateTimeList)
+        else:
+            raise BaseException("[BaseFactorWithDB] Not support factorStoreDB in database when deleting data from database:%s" % self.getFactorStoreDB())
+        self._invalidateFactorValueCache(dateTimeList)
         
         
     def updateFactorTableToDB(self, dateTime, dataNumber=None, maxNullRatio=1.0, reUpdate = False):
@@ -590,7 +933,7 @@ class BaseFactorWithDB(BaseFactor):
             logs['operation_time'].append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
             return logs
         # step4 Check if the database has table '__tableNameInDB'.
-        if self.getFactorStoreDB().getDBType() in [DBType.sqlServer, DBType.oracle, DBType.postGreSql]:
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
             hasTable = self.getFactorStoreDB().hasTable(self.getTableNameInDB())
         elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
             hasTable = True
@@ -598,9 +941,10 @@ class BaseFactorWithDB(BaseFactor):
             raise BaseException("[BaseFactorWithDB] Not support factorStoreDB in database when updating data to database:%s" % self.getFactorStoreDB())
         if hasTable == True:
         # step5 Check if the data in dateTime has been updated, if has, check if delete and reupdate. 
-            data1 = self.getFactorValueFromDB([dateTime])
+            # 只查询已有数据的个数（设置了清单表时查清单表），不再读取全部因子值
+            dataNumberInDB = self.getFactorValueCountFromDB([dateTime]).get(dateTime, 0)
             # case: table has data of dateTime
-            if len(data1) != 0: 
+            if dataNumberInDB != 0: 
                 # case: table has data but reupdating is forced to run.
                 if reUpdate == True:
                     logs['update_log'].append("The data of %s has been updated, but reupdating is forced to run.\
@@ -610,7 +954,7 @@ class BaseFactorWithDB(BaseFactor):
                     self.deleteFactorValueInDB(dateTime)
                 # case: table has data but reupdating is not forced to run, and the dataNumber is not None and
                 #  dataNumber is not the length of data1['factorValue']. 
-                elif reUpdate == False and (dataNumber != None and dataNumber != len(data1['factorValue'])) :
+                elif reUpdate == False and (dataNumber != None and dataNumber != dataNumberInDB) :
                     logs['update_log'].append("The data of %s has been updated, but the number of data is\
                                                not right. Delete the data and reupdate." % dbDateTime)
                     logs['update_status'].append("Reupdating...")
@@ -618,7 +962,7 @@ class BaseFactorWithDB(BaseFactor):
                     self.deleteFactorValueInDB(dateTime)
                 # case: table has data but reupdating is not forced to run, and the dataNumber is None or
                 #  dataNumber is the length of data1['factorValue']
-                elif reUpdate == False and (dataNumber == None or dataNumber == len(data1['factorValue'])) :
+                elif reUpdate == False and (dataNumber == None or dataNumber == dataNumberInDB) :
                     logs['update_log'].append("The data of %s has been updated." % dbDateTime)
                     logs['update_status'].append("Updated")
                     logs['operation_time'].append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
@@ -681,20 +1025,424 @@ class BaseFactorWithDB(BaseFactor):
         # step10 Update factor value to database.
         data = data3
         talbeInDB = self.getTableNameInDB() 
-        if self.getFactorStoreDB().getDBType() in [DBType.sqlServer, DBType.oracle, DBType.postGreSql]:
-            if self.getDateTimeFormInDB() == DateTimeForm.intDate:
-                dtype=({securityIdName:CHAR(self.getSecurityIdLengthInDB()),
-                        factorSymbolName:CHAR(len(self.getFactorSymbol())), updataDateTimeName:CHAR(20)})
-            else:
-                dtype=({dateTimeName:CHAR(20), securityIdName:CHAR(self.getSecurityIdLengthInDB()),
-                        factorSymbolName:CHAR(len(self.getFactorSymbol())), updataDateTimeName:CHAR(20)})
-            self.getFactorStoreDB().updateTableToDB(tableName=data, tableNameInDB=talbeInDB, dtype=dtype)
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
+            self.getFactorStoreDB().updateTableToDB(tableName=data, tableNameInDB=talbeInDB, dtype=self._getSQLTableDtype())
         elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
-            self.getFactorStoreDB().updateTableToDB(tableName=data, tableNameInDB=talbeInDB)        
+            written = self._bulkWriteToMongoDB(data)
+            if written != len(data):
+                self._invalidateFactorValueCache([dateTime])
+                logs['update_log'].append("Only %d of %d factor values are written to MongoDB." % (written, len(data)))
+                logs['update_status'].append("Not Updated")
+                logs['operation_time'].append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                return logs
+        self._writeManifestToDB(pd.DataFrame({'dateTime':[dateTime], 'dataNumber':[len(data)], 'nullNumber':[nullFactorVluae]}))
+        self._invalidateFactorValueCache([dateTime])
         logs['update_log'].append("The data of %s is updated normally."  %dbDateTime )
         logs['update_status'].append("Updated")
         logs['operation_time'].append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         return logs
+
+    def _getSQLTableDtype(self):
+        #写入关系型数据库时各字段的类型
+        tableVariableName = self.getTableVariableName()
+        dtype = {tableVariableName['securityId']:CHAR(self.getSecurityIdLengthInDB()),
+                 tableVariableName['factorSymbol']:CHAR(len(self.getFactorSymbol())),
+                 tableVariableName['updataDateTime']:CHAR(20)}
+        if self.getDateTimeFormInDB() != DateTimeForm.intDate:
+            dtype[tableVariableName['dateTime']] = CHAR(20)
+        return dtype
+
+    def _addLog(self, logs, log, status):
+        logs['update_log'].append(log)
+        logs['update_status'].append(status)
+        logs['operation_time'].append(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def getFactorValueCountFromDB(self, dateTimeList, chunkSize=1000):
+        """
+        #----------------------------------------------------------------------
+        # 一次查询dateTimeList中每个日期在数据库中已有的因子值个数，设置了清单表时只查清单表
+        # 按数据库中dateTime字段的取值匹配，日期型的dateTimeForm下带时刻的dateTime也能查到当天的数据
+        # @return  Dict{datetime: Int}，键为dateTimeList中的datetime，没有数据的日期不在其中
+        """
+        counts = self._getFactorValueCountByDBDateTime(dateTimeList, chunkSize)
+        return dict((dt, counts[key]) for dt, key in zip(dateTimeList, self._formatDateTimeForDB(dateTimeList)) if key in counts)
+
+    def _getFactorValueCountByDBDateTime(self, dateTimeList, chunkSize=1000):
+        #同getFactorValueCountFromDB，但以数据库中dateTime字段的取值（_formatDateTimeForDB）为键：
+        #日期型的dateTimeForm下，同一天不同时刻的dateTime对应同一个取值
+        if self.getFactorStoreDB() == None or len(dateTimeList) == 0:
+            return {}
+        if self.getManifestTableNameInDB() != None:
+            #清单表按整天查询，再按数据库中的取值匹配
+            begin = min(dateTimeList).replace(hour=0, minute=0, second=0, microsecond=0)
+            end = max(dateTimeList).replace(hour=23, minute=59, second=59, microsecond=0)
+            manifest = self.getManifestFromDB(begin, end)
+            keys = self._formatDateTimeForDB(list(pd.DatetimeIndex(manifest['dateTime']).to_pydatetime()))
+            counts = dict(zip(keys, manifest['dataNumber'].astype(int)))
+        else:
+            counts = self._countFactorValueInDB(dateTimeList, chunkSize)
+            keys = self._formatDateTimeForDB(list(pd.DatetimeIndex(counts['dateTime']).to_pydatetime()))
+            counts = dict(zip(keys, counts['dataNumber'].astype(int)))
+        return dict((key, counts[key]) for key in set(self._formatDateTimeForDB(dateTimeList)) if key in counts)
+
+    def _countFactorValueInDB(self, dateTimeList, chunkSize=1000):
+        #由因子表分组统计各日期的数据个数和缺失值个数：DataFrame ['dateTime','dataNumber','nullNumber']
+        columns = ['dateTime', 'dataNumber', 'nullNumber']
+        dateTimeName = self.getTableVariableName('dateTime')
+        factorValueName = self.getTableVariableName('factorValue')
+        factorSymbolName = self.getTableVariableName('factorSymbol')
+        talbeInDB = self.getTableNameInDB()
+        dbDateTimeList = self._formatDateTimeForDB(sorted(set(dateTimeList)))
+        frames = []
+        if self.getFactorStoreDB().getDBType() in SQL_DB_TYPES:
+            if self.getFactorStoreDB().hasTable(talbeInDB) == False:
+                return pd.DataFrame(columns=columns)
+            for start in range(0, len(dbDateTimeList), chunkSize):
+                chunk = dbDateTimeList[start:start + chunkSize]
+                params = self._getSQLParams()
+                sqlCause = ("select " + dateTimeName + " as datetime, count(*) as datanumber, sum(case when " + factorValueName
+                        + " is null then 1 else 0 end) as nullnumber from " + talbeInDB
+                        + " where " + dateTimeName + " in (" + self._toSQLValues(chunk, params)
+                        + ") and " + factorSymbolName + " = " + self._toSQLValues([self.getFactorSymbol()], params)
+                        + " group by " + dateTimeName)
+                frames.append(self._getSQLData(sqlCause, params))
+        elif self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+            collection = self._getMongoCollection()
+            for start in range(0, len(dbDateTimeList), chunkSize):
+                chunk = dbDateTimeList[start:start + chunkSize]
+                docs = list(collection.aggregate([{"$match":{dateTimeName:{"$in":chunk}, factorSymbolName:self.getFactorSymbol()}},
+                                                  {"$group":{"_id":"$" + dateTimeName, "datanumber":{"$sum":1},
+                                                             "nullnumber":{"$sum":{"$cond":[{"$in":["$" + factorValueName, [None, float('nan')]]}, 1, 0]}}}}]))
+                frames.append(pd.DataFrame({'datetime':[doc['_id'] for doc in docs],
+                                            'datanumber':[doc['datanumber'] for doc in docs],
+                                            'nullnumber':[doc['nullnumber'] for doc in docs]}))
+        else:
+            raise BaseException("[BaseFactorWithDB] Not support factorStoreDB in database when counting data in database:%s" % self.getFactorStoreDB())
+        counts = pd.concat(frames, ignore_index=True)
+        if len(counts) == 0:
+            return pd.DataFrame(columns=columns)
+        counts.columns = [column.lower() for column in counts.columns]
+        return pd.DataFrame({'dateTime':self._parseDateTimeFromDB(counts['datetime']).values,
+                             'dataNumber':counts['datanumber'].astype(int).values,
+                             'nullNumber':counts['nullnumber'].fillna(0).astype(int).values}, columns=columns)
+
+    def updateFactorRangeToDB(self, data, dataNumber=None, maxNullRatio=1.0, reUpdate=False, chunkSize=20):
+        """
+        #----------------------------------------------------------------------
+        # 把多个日期的因子值一起写入数据库，判断规则与updateFactorTableToDB相同：
+        # 1) 一次查询各日期已有的数据个数，得到需要写入（没有数据）和需要重写（reUpdate或个数不等于dataNumber）的日期；
+        # 2) 每chunkSize个日期在一个事务中先删除需要重写的日期，再批量插入。
+        # 关系型数据库的事务需要连接池（setFactorStoreDSN）；原有的ConnectDB没有事务，各语句单独提交，
+        # 插入失败时已删除的日期不能恢复，所以有需要重写的日期时抛出异常，不写入任何日期。
+        # MongoDB先按(factor_symbol, tdate, security_code)upsert，再删除重写的日期中不在新数据里的股票。
+        # @param data: type: DataFrame ['dateTime','securityId','factorValue']，如calculateFactorValueRange的结果
+        # @param dataNumber, maxNullRatio, reUpdate: 同updateFactorTableToDB，对每个日期分别判断
+        # @param chunkSize: type: Int; 每个事务写入的日期数
+        # @return  List，每个日期一个logs，结构同updateFactorTableToDB
+        """
+        # step0 Check the input data and initialize the logs.
+        if not isinstance(data, pd.DataFrame) or not set(['dateTime', 'securityId', 'factorValue']).issubset(data.columns):
+            raise BaseException("[BaseFactorWithDB] 'data' must be DataFrame with columns ['dateTime','securityId','factorValue'].")
+        data = data.loc[:, ['dateTime', 'securityId', 'factorValue']].copy()
+        data['dateTime'] = pd.to_datetime(data['dateTime'])
+        data = data.sort_values('dateTime', kind='mergesort').reset_index(drop=True)
+        dateTimes = data['dateTime'].values
+        dateTimeList = list(pd.to_datetime(np.unique(dateTimes)).to_pydatetime())
+        allLogs = collections.OrderedDict()
+        for dateTime in dateTimeList:
+            logs = {'datetime':dateTime.strftime('%Y-%m-%d %H:%M:%S'),
+                    'factor_symbol':self.getFactorSymbol(),
+                    'update_log': [],
+                    'update_status' : [],
+                    'operation_time': []}
+            self._addLog(logs, "Start running updating program.", "Start Updating")
+            allLogs[dateTime] = logs
+        # step1 Check if the type of input parameter(s) is right.
+        error = None
+        if dataNumber != None and (type(dataNumber) != types.IntType or dataNumber <= 0):
+            error = "Not support dataNumber:%s" % dataNumber
+        elif (maxNullRatio != 0 and maxNullRatio != 1 and type(maxNullRatio) != types.FloatType) or maxNullRatio < 0 or maxNullRatio > 1:
+            error = "Not support maxNullRatio:%s" % maxNullRatio
+        elif type(reUpdate) != types.BooleanType:
+            error = "Not support reUpdate:%s" % reUpdate
+        elif self.getFactorStoreDB() == None:
+            error = "There is no database used to store factor value. Please set it with method setFactorStoreDB."
+        if error != None:
+            for logs in allLogs.values():
+                self._addLog(logs, error, "Not Updated")
+            return list(allLogs.values())
+
+        # step2 Get the number of data of all dateTime in database with one query.
+        dbType = self.getFactorStoreDB().getDBType()
+        if dbType in SQL_DB_TYPES:
+            hasTable = self.getFactorStoreDB().hasTable(self.getTableNameInDB())
+        elif dbType == DBType.mongoDB:
+            hasTable = True
+        else:
+            raise BaseException("[BaseFactorWithDB] Not support factorStoreDB in database when updating data to database:%s" % self.getFactorStoreDB())
+        #以数据库中的取值为键，dateTime带时刻时也能查到已有的数据
+        counts = self._getFactorValueCountByDBDateTime(dateTimeList) if hasTable else {}
+        dbDateTimeList = self._formatDateTimeForDB(dateTimeList)
+
+        # step3 Decide which dateTime to update (and delete first) and check the data of each dateTime.
+        toWrite = []
+        for i, dateTime in enumerate(dateTimeList):
+            logs = allLogs[dateTime]
+            dbDateTime = dbDateTimeList[i]
+            count = counts.get(dbDateTime, 0)
+            delete = False
+            if not hasTable:
+                self._addLog(logs, "The data of %s has not been updated(no table), update it now." % dbDateTime, "Updating...")
+            elif count == 0:
+                self._addLog(logs, "The data of %s has not been updated(no data), update it now." % dbDateTime, "Updating...")
+            elif reUpdate == True:
+                self._addLog(logs, "The data of %s has been updated, but reupdating is forced to run. Delete the data and reupdate ." % dbDateTime, "Reupdating...")
+                delete = True
+            elif dataNumber != None and dataNumber != count:
+                self._addLog(logs, "The data of %s has been updated, but the number of data is not right. Delete the data and reupdate." % dbDateTime, "Reupdating...")
+                delete = True
+            else:
+                self._addLog(logs, "The data of %s has been updated." % dbDateTime, "Updated")
+                continue
+            lo = dateTimes.searchsorted(np.datetime64(dateTime), side='left')
+            hi = dateTimes.searchsorted(np.datetime64(dateTime), side='right')
+            data2 = data.iloc[lo:hi]
+            self._addLog(logs, "Factor value is given. Check the factor before update to database.", "Updating...")
+            if dataNumber != None and dataNumber != len(data2):
+                self._addLog(logs, "The number of data is " + str(len(data2)) + ", not the set dataNumber " + str(dataNumber) + ".", "Not Updated")
+                continue
+            nullFactorVluae = int(data2['factorValue'].isnull().sum())
+            if nullFactorVluae >= len(data2)*maxNullRatio:
+                self._addLog(logs, "The null factor value is too much. The number of data is " + str(len(data2))
+                             + ", null factor value is " + str(nullFactorVluae) + ".", "Not Updated")
+                continue
+            self._addLog(logs, "Everything is OK, update factor value to database.", "Updating...")
+            toWrite.append((dateTime, dbDateTime, delete, lo, hi))
+        if dbType in SQL_DB_TYPES and not self._hasSQLTransaction() and len([w for w in toWrite if w[2]]) > 0:
+            raise BaseException("[BaseFactorWithDB] Reupdating dates with updateFactorRangeToDB needs a transaction, "
+                                "which factorStoreDB: %s does not support. Please set the store with setFactorStoreDSN, "
+                                "or reupdate the dates one by one with updateFactorTableToDB." % self.getFactorStoreDB())
+
+        # step4 Delete and insert chunk by chunk, one transaction per chunk.
+        tableVariableName = self.getTableVariableName()
+        securityIdName = tableVariableName['securityId']
+        dateTimeName = tableVariableName['dateTime']
+        factorValueName = tableVariableName['factorValue']
+        factorSymbolName = tableVariableName['factorSymbol']
+        updataDateTimeName = tableVariableName['updataDateTime']
+        talbeInDB = self.getTableNameInDB()
+        self._prepareManifestInDB()
+        for start in range(0, len(toWrite), chunkSize):
+            chunk = toWrite[start:start + chunkSize]
+            frames = []
+            for dateTime, dbDateTime, delete, lo, hi in chunk:
+                data3 = pd.DataFrame({securityIdName:data['securityId'].values[lo:hi],
+                                      factorValueName:data['factorValue'].values[lo:hi]})
+                data3.loc[:, dateTimeName] = dbDateTime
+                frames.append(data3)
+            data3 = pd.concat(frames, ignore_index=True)
+            data3.loc[:, factorSymbolName] = self.getFactorSymbol()
+            data3.loc[:, updataDateTimeName] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            deleteList = [dbDateTime for dateTime, dbDateTime, delete, lo, hi in chunk if delete]
+            manifest = pd.DataFrame({'dateTime':[dateTime for dateTime, dbDateTime, delete, lo, hi in chunk],
+                                     'dataNumber':[hi - lo for dateTime, dbDateTime, delete, lo, hi in chunk],
+                                     'nullNumber':[int(data['factorValue'].iloc[lo:hi].isnull().sum()) for dateTime, dbDateTime, delete, lo, hi in chunk]})
+            try:
+                if dbType in SQL_DB_TYPES:
+                    def write(connection):
+                        if len(deleteList) > 0:
+                            params = self._getSQLParams()
+                            sqlCause = ("delete from " + talbeInDB + " where " + dateTimeName + " in ("
+                                    + self._toSQLValues(deleteList, params) + ") and "
+                                    + factorSymbolName + " = " + self._toSQLValues([self.getFactorSymbol()], params))
+                            self._executeSQL(sqlCause, connection, params)
+                        self._updateSQLTable(data3, talbeInDB, self._getSQLTableDtype(), connection)
+                        self._writeManifestToDB(manifest, connection)
+                    transaction = self._beginSQLTransaction()
+                    if transaction is None:
+                        write(None)
+                    else:
+                        with transaction as connection:
+                            write(connection)
+                else:
+                    #MongoDB没有多文档事务：先upsert新的数据，再删除需要重写的日期中不在新数据里的股票
+                    written = self._bulkWriteToMongoDB(data3)
+                    if written != len(data3):
+                        self._invalidateFactorValueCache([dateTime for dateTime, dbDateTime, delete, lo, hi in chunk])
+                        for dateTime, dbDateTime, delete, lo, hi in chunk:
+                            self._addLog(allLogs[dateTime], "Only %d of %d factor values of the chunk are written to MongoDB."
+                                         % (written, len(data3)), "Not Updated")
+                        continue
+                    collection = self._getMongoCollection()
+                    for dateTime, dbDateTime, delete, lo, hi in chunk:
+                        if delete:
+                            collection.delete_many({factorSymbolName:self.getFactorSymbol(), dateTimeName:dbDateTime,
+                                                    securityIdName:{"$nin":list(data['securityId'].values[lo:hi])}})
+                    self._writeManifestToDB(manifest)
+            except Exception as err:
+                for dateTime, dbDateTime, delete, lo, hi in chunk:
+                    self._addLog(allLogs[dateTime], "Updating the data of %s fails: %s" % (dbDateTime, err), "Not Updated")
+                continue
+            self._invalidateFactorValueCache([dateTime for dateTime, dbDateTime, delete, lo, hi in chunk])
+            for dateTime, dbDateTime, delete, lo, hi in chunk:
+                self._addLog(allLogs[dateTime], "The data of %s is updated normally." % dbDateTime, "Updated")
+        return list(allLogs.values())
+
+    def _invalidateFactorValueCache(self, dateTimeList=None):
+        #因子库中这些日期的数据被写入或删除后，缓存中的旧值失效
+        if self.getFactorValueCache() != None:
+            self.getFactorValueCache().invalidate(self, dateTimeList)
+    """
+    #--------------------------------------------------------------------------
+    #----Methods related to the manifest of factor table-----------------------
+    #--------------------------------------------------------------------------
+    # 清单表（manifest）按 (factor_symbol, tdate) 记录每个日期已写入的数据个数、
+    # 缺失值个数和写入时间，由写入和删除的方法维护。设置了清单表后：
+    # 1) 判断某日是否已写入只查清单表，不再读取因子值；
+    # 2) 读取因子值时清单表中存在的日期直接读取，不存在的日期再查因子表，查到的补入清单表；
+    # 3) 多个因子、多年的完成情况可以一次查询（getManifestFromDB）。
+    # 清单表中的tdate统一为'%Y-%m-%d %H:%M:%S'字符串，取因子表中dateTime字段的取值对应的时间
+    # （日期型的dateTimeForm为当天0点），因此同一天不同时刻写入的是同一条记录。
+    # 已有的因子表可用rebuildManifestInDB从因子表一次重建清单。
+    """
+    def _getManifestDateTime(self, dateTimeList):
+        #清单表中的tdate：因子表中的取值再转回datetime
+        return [pd.Timestamp(dt).strftime('%Y-%m-%d %H:%M:%S')
+                for dt in self._parseDateTimeFromDB(self._formatDateTimeForDB(dateTimeList))]
+
+    def _getManifestDtype(self):
+        return {MANIFEST_VARIABLE_NAME['factorSymbol']:VARCHAR(100),
+                MANIFEST_VARIABLE_NAME['dateTime']:CHAR(20),
+                MANIFEST_VARIABLE_NAME['updataDateTime']:CHAR(20)}
+
+    def _prepareManifestInDB(self):
+        #第一次使用时建立(factor_symbol, tdate)上的索引
+        if self.__manifestReady or self.getManifestTableNameInDB() == None:
+            return
+        manifest = self.getManifestTableNameInDB()
+        dateTimeName = MANIFEST_VARIABLE_NAME['dateTime']
+        factorSymbolName = MANIFEST_VARIABLE_NAME['factorSymbol']
+        if self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+            self.getFactorStoreDB().connectDB()[manifest].create_index([(factorSymbolName, 1), (dateTimeName, 1)], unique=True)
+        elif not self.getFactorStoreDB().hasTable(manifest):
+            columns = [MANIFEST_VARIABLE_NAME[item] for item in ['factorSymbol', 'dateTime', 'dataNumber', 'nullNumber', 'updataDateTime']]
+            self._updateSQLTable(pd.DataFrame({column:[] for column in columns}, columns=columns).astype(
+                {MANIFEST_VARIABLE_NAME['dataNumber']:np.int64, MANIFEST_VARIABLE_NAME['nullNumber']:np.int64}),
+                manifest, self._getManifestDtype())
+            self._executeSQL("create unique index " + manifest + "_key on " + manifest
+                             + " (" + factorSymbolName + ", " + dateTimeName + ")")
+        self.__manifestReady = True
+
+    def _executeSQL(self, sqlCause, connection=None, params=None):
+        #在connection（_beginSQLTransaction的事务）中执行，connection为None时由factorStoreDB单独执行；
+        #params为_getSQLParams得到的绑定参数
+        if connection is not None:
+            connection.execute(text(sqlCause), params or {})
+        elif params is not None:
+            self.getFactorStoreDB().deleteDataWithSqlClause(sqlCause, params)
+        else:
+            self.getFactorStoreDB().deleteDataWithSqlClause(sqlCause)
+
+    def _getSQLData(self, sqlCause, params=None):
+        #查询，params同_executeSQL
+        if params is not None:
+            return self.getFactorStoreDB().getDataWithSqlClause(sqlCause, params)
+        return self.getFactorStoreDB().getDataWithSqlClause(sqlCause)
+
+    def _updateSQLTable(self, data, tableNameInDB, dtype, connection=None):
+        #追加写入关系型数据库，connection同_executeSQL
+        if connection is not None:
+            data.to_sql(tableNameInDB, connection, if_exists='append', index=False, dtype=dtype, chunksize=10000)
+        else:
+            self.getFactorStoreDB().updateTableToDB(tableName=data, tableNameInDB=tableNameInDB, dtype=dtype)
+
+    def getManifestFromDB(self, beginDateTime, endDateTime, factorSymbols=None):
+        """
+        #----------------------------------------------------------------------
+        # 一次查询多个因子在[beginDateTime, endDateTime]内的写入情况
+        # @param factorSymbols: type: List or None; None为本因子
+        # @return  DataFrame ['factorSymbol','dateTime','dataNumber','nullNumber','operationDateTime']
+        """
+        columns = ['factorSymbol', 'dateTime', 'dataNumber', 'nullNumber', 'operationDateTime']
+        if self.getFactorStoreDB() == None or self.getManifestTableNameInDB() == None:
+            return pd.DataFrame(columns=columns)
+        self._prepareManifestInDB()
+        if factorSymbols is None:
+            factorSymbols = [self.getFactorSymbol()]
+        manifest = self.getManifestTableNameInDB()
+        name = MANIFEST_VARIABLE_NAME
+        begin, end = beginDateTime.strftime('%Y-%m-%d %H:%M:%S'), endDateTime.strftime('%Y-%m-%d %H:%M:%S')
+        frames = []
+        for start in range(0, len(factorSymbols), 1000):
+            chunk = list(factorSymbols[start:start + 1000])
+            if self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+                cursor = self.getFactorStoreDB().connectDB()[manifest].find(
+                    {name['factorSymbol']:{"$in":chunk}, name['dateTime']:{"$gte":begin, "$lte":end}},
+                    projection=dict((name[item], 1) for item in ['factorSymbol', 'dateTime', 'dataNumber', 'nullNumber', 'updataDateTime']))
+                frames.append(pd.DataFrame(list(cursor)))
+            else:
+                params = self._getSQLParams()
+                sqlCause = ("select " + ", ".join(name[item] for item in ['factorSymbol', 'dateTime', 'dataNumber', 'nullNumber', 'updataDateTime'])
+                        + " from " + manifest + " where " + name['factorSymbol'] + " in ("
+                        + self._toSQLValues(chunk, params, fixedChar=False) + ") and " + name['dateTime']
+                        + " >= " + self._toSQLValues([begin], params) + " and " + name['dateTime'] + " <= " + self._toSQLValues([end], params))
+                frames.append(self._getSQLData(sqlCause, params))
+        data = pd.concat(frames, ignore_index=True)
+        if len(data) == 0:
+            return pd.DataFrame(columns=columns)
+        data.columns = [column.lower() for column in data.columns]
+        data = data.loc[:, [name[item] for item in ['factorSymbol', 'dateTime', 'dataNumber', 'nullNumber', 'updataDateTime']]]
+        data.columns = columns
+        data['factorSymbol'] = data['factorSymbol'].astype(str).str.strip()
+        data['dateTime'] = pd.to_datetime(data['dateTime'].astype(str).str.strip(), format='%Y-%m-%d %H:%M:%S')
+        return data
+
+    def _writeManifestToDB(self, data, connection=None):
+        #data: DataFrame ['dateTime','dataNumber','nullNumber']，已有的记录先删除再写入
+        if self.getManifestTableNameInDB() == None or len(data) == 0:
+            return
+        self._prepareManifestInDB()
+        name = MANIFEST_VARIABLE_NAME
+        records = pd.DataFrame({name['factorSymbol']:self.getFactorSymbol(),
+                                name['dateTime']:self._getManifestDateTime(list(pd.DatetimeIndex(data['dateTime']).to_pydatetime())),
+                                name['dataNumber']:data['dataNumber'].astype(np.int64).values,
+                                name['nullNumber']:data['nullNumber'].astype(np.int64).values,
+                                name['updataDateTime']:datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        self._deleteManifestInDB(list(pd.DatetimeIndex(data['dateTime']).to_pydatetime()), connection)
+        if self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+            self.getFactorStoreDB().connectDB()[self.getManifestTableNameInDB()].insert_many(records.to_dict('records'), ordered=False)
+        else:
+            self._updateSQLTable(records, self.getManifestTableNameInDB(), self._getManifestDtype(), connection)
+
+    def _deleteManifestInDB(self, dateTimeList, connection=None):
+        if self.getManifestTableNameInDB() == None or len(dateTimeList) == 0:
+            return
+        self._prepareManifestInDB()
+        name = MANIFEST_VARIABLE_NAME
+        manifest = self.getManifestTableNameInDB()
+        #之前按原dateTime（带时刻）写入的记录一并删除
+        dbDateTimeList = sorted(set([dt.strftime('%Y-%m-%d %H:%M:%S') for dt in dateTimeList] + self._getManifestDateTime(dateTimeList)))
+        for start in range(0, len(dbDateTimeList), 1000):
+            chunk = dbDateTimeList[start:start + 1000]
+            if self.getFactorStoreDB().getDBType() == DBType.mongoDB:
+                self.getFactorStoreDB().connectDB()[manifest].delete_many(
+                    {name['factorSymbol']:self.getFactorSymbol(), name['dateTime']:{"$in":chunk}})
+            else:
+                params = self._getSQLParams()
+                sqlCause = ("delete from " + manifest + " where " + name['dateTime'] + " in ("
+                        + self._toSQLValues(chunk, params) + ") and "
+                        + name['factorSymbol'] + " = " + self._toSQLValues([self.getFactorSymbol()], params, fixedChar=False))
+                self._executeSQL(sqlCause, connection, params)
+
+    def rebuildManifestInDB(self, dateTimeList):
+        #由因子表统计dateTimeList中各日期的数据个数，重建清单（用于设置清单表之前已写入的因子表）
+        if self.getManifestTableNameInDB() == None:
+            raise BaseException("[BaseFactorWithDB] Please set manifestTableNameInDB first.")
+        counts = self._countFactorValueInDB(dateTimeList)
+        self._deleteManifestInDB(dateTimeList)
+        self._writeManifestToDB(counts)
+        return counts
+
     """
     #--------------------------------------------------------------------------
     #----Methods to set attributes---------------------------------------------
@@ -704,12 +1452,23 @@ class BaseFactorWithDB(BaseFactor):
         #----------------------------------------------------------------------
         # factorStoreDB: type: ConnectDB(a specific one)
 
-        if isinstance(factorStoreDB, ConnectDB) or factorStoreDB == None or isinstance(factorStoreDB, ConnectNoSQLDB):
+        if isinstance(factorStoreDB, ConnectDB) or factorStoreDB == None or isinstance(factorStoreDB, ConnectNoSQLDB) \
+                or isinstance(factorStoreDB, BasePooledStore):
 #            print "__________iiii______"
             self.__factorStoreDB = factorStoreDB
+            self.__factorStoreDSN = None
+            self.__manifestReady = False
+            self.__mongoIndexReady = False
         else:
             raise BaseException("[BaseFactorWithDB]'__factorStoreDB' doesn't support factorStoreDB:%s" % factorStoreDB) 
             
+    def setFactorStoreDSN(self, dsn, **options):
+        #----------------------------------------------------------------------
+        # dsn: type: Str; 使用进程内按dsn共享的连接池（storepool.getFactorStore）作为factorStoreDB
+        # options: 连接池的参数，如poolSize、maxOverflow（Mongo为maxPoolSize、database）
+        self.setFactorStoreDB(getFactorStore(dsn, **options))
+        self.__factorStoreDSN = (dsn, options)
+
     def setTableNameInDB(self, tableNameInDB=None):
         #----------------------------------------------------------------------
         # setTableNameInDB: type: Str or Unicode
@@ -763,6 +1522,22 @@ class BaseFactorWithDB(BaseFactor):
             self.__tableVariableName['updataDateTime'] = updataDateTimeName.lower()
             
             
+    def setManifestTableNameInDB(self, manifestTableNameInDB=None):
+        #----------------------------------------------------------------------
+        # manifestTableNameInDB: type: Str or None; 清单表的表名，None为不使用清单表
+        if manifestTableNameInDB != None and type(manifestTableNameInDB) not in [types.StringType, types.UnicodeType]:
+            raise BaseException("[BaseFactorWithDB] '__manifestTableNameInDB' doesn't support %s" % manifestTableNameInDB)
+        self.__manifestTableNameInDB = manifestTableNameInDB if manifestTableNameInDB == None else manifestTableNameInDB.lower()
+        self.__manifestReady = False
+
+    def setFactorValueCache(self, factorValueCache=None):
+        #----------------------------------------------------------------------
+        # factorValueCache: type: FactorValueCache or None; getOrCalculateFactorValue的缓存，
+        #                   可以被多个因子共用，None为不使用缓存
+        if factorValueCache != None and not isinstance(factorValueCache, FactorValueCache):
+            raise BaseException("[BaseFactorWithDB] '__factorValueCache' doesn't support %s" % factorValueCache)
+        self.__factorValueCache = factorValueCache
+
     def setDateTimeFormInDB(self,dateTimeForm):
         #----------------------------------------------------------------------
         # dateTimeForm: type: Int 
@@ -819,8 +1594,15 @@ class BaseFactorWithDB(BaseFactor):
     #--------------------------------------------------------------------------
     """        
     def getFactorStoreDB(self):
+        #通过dsn使用共享连接池时，fork出的子进程中改用本进程的连接池
+        if self.__factorStoreDSN != None and not isCurrentProcess(self.__factorStoreDB):
+            factorStoreDSN = self.__factorStoreDSN
+            self.setFactorStoreDSN(factorStoreDSN[0], **factorStoreDSN[1])
         return self.__factorStoreDB
         
+    def getFactorStoreDSN(self):
+        return None if self.__factorStoreDSN == None else self.__factorStoreDSN[0]
+
     def getTableNameInDB(self):
         return self.__tableNameInDB
         
@@ -833,6 +1615,12 @@ class BaseFactorWithDB(BaseFactor):
             else:
                 return self.__tableVariableName[item]
     
+    def getManifestTableNameInDB(self):
+        return self.__manifestTableNameInDB
+
+    def getFactorValueCache(self):
+        return self.__factorValueCache
+
     def getDateTimeFormInDB(self):
         return self.__dateTimeFormInDB
     
@@ -859,6 +1647,14 @@ class TradeFactorDemo(BaseFactorWithDB):
     #----Class Instruction----------------------------------------------------
     #--------------------------------------------------------------------------
     """    
+    #数据源，默认为DataFeeds；可以换为CachedDataFeeds（录制/回放）或SyntheticDataFeeds（合成数据）
+    _dataFeedsFactory = staticmethod(DataFeeds)
+
+    @classmethod
+    def setDataFeedsFactory(cls, factory):
+        #factory(): 返回有getDataFeed(name)的对象，之后新建（及反序列化）的因子使用它，None恢复为DataFeeds
+        cls._dataFeedsFactory = staticmethod(factory if factory is not None else DataFeeds)
+
     def __init__(self, lagTradeDays=None,frequency=86400,validTradingDayRatio=0.7,items=None,varitems=None,
                  factorSymbol=None,  factorDirection=1, fetchDataOnOld=True):
         BaseFactorWithDB.__init__(self, factorSymbol=factorSymbol, factorDirection=factorDirection)
@@ -866,51 +1662,259 @@ class TradeFactorDemo(BaseFactorWithDB):
         self.varsitems = varitems
         self.FREQUENCY = frequency
         self.stocklist = None
+        # fetchDataOnOld时stockdata、stockvars背后的滑动窗口，长表在第一次访问时才生成
+        self.__stockdataRing = None
+        self.__stockvarsRing = None
         self.stockdata = pd.DataFrame()
         self.stockvars = pd.DataFrame()
+        # 按股票和交易日分块并发取数
+        self.__fetcher = ChunkedFetcher()
         self.offset1 = lagTradeDays
         self.validTradingDayRatio = validTradingDayRatio
         if self.offset1 is None:
             self.maxoffset = None
         else:
-            self.maxoffset = self.offset1*max(14400/self.FREQUENCY, 1)
+            self.maxoffset = self.offset1*max(14400//self.FREQUENCY, 1)
         self.maxoffset_day = self.offset1
         self.fetchDataOnOld = fetchDataOnOld
-        self.__database = DataFeeds()
+        self._connectDataSource()
+
+    def _connectDataSource(self):
+        self.__database = self._dataFeedsFactory()
         self.__tcalendar = self.__database.getDataFeed("AShareCalendar")
         self.__stockcode = self.__database.getDataFeed("AShareCodes")
         self.__stockdata = self.__database.getDataFeed("AShareQuotation")
         self.__stockvars = self.__database.getDataFeed("AShareVars")
+        self.__calendar = TradingCalendar(self._loadTradeBars)
+        self.__universe = UniverseStore(self._loadStockCode)
+        # 其他线程（ChunkedFetcher的工作线程等）借用的数据源，最多与并发数相同，见_useFeed
+        self.__feedThread = threading.current_thread()
+        self.__feedPool = FeedPool(self._dataFeedsFactory, self.__fetcher.maxWorkers)
+
+    @property
+    def stockdata(self):
+        #getData的结果：以'dateTime','securityId'为索引的长表。fetchDataOnOld时由滑动窗口生成，
+        #同一个窗口只生成一次，不访问时不生成（按数组计算时用getStockDataPanel）
+        if self.__stockdataFrame is None and self.__stockdataRing is not None:
+            self.__stockdataFrame = self.__stockdataRing.toFrame()
+        return self.__stockdataFrame
+
+    @stockdata.setter
+    def stockdata(self, value):
+        self.__stockdataFrame = value
+
+    @property
+    def stockvars(self):
+        #getVars的结果，同stockdata
+        if self.__stockvarsFrame is None and self.__stockvarsRing is not None:
+            self.__stockvarsFrame = self.__stockvarsRing.toFrame()
+        return self.__stockvarsFrame
+
+    @stockvars.setter
+    def stockvars(self, value):
+        self.__stockvarsFrame = value
+
+    def getStockDataPanel(self):
+        #fetchDataOnOld时getData的滑动窗口（RingPanel），ring.getPanel(item)为 时间点×股票 的数组；否则为None
+        return self.__stockdataRing
+
+    def getStockVarsPanel(self):
+        #fetchDataOnOld时getVars的滑动窗口，同getStockDataPanel
+        return self.__stockvarsRing
+
+    @contextlib.contextmanager
+    def _useFeed(self, name, feed):
+        #DataFeeds不保证线程安全：建立数据源的线程用原来的feed，其他线程（如分块取数的工作线程）
+        #在请求期间从数据源池借用一个，请求结束即归还，之后的请求和fetch重用
+        if threading.current_thread() is self.__feedThread:
+            yield feed
+            return
+        with self.__feedPool.use() as database:
+            yield database.getDataFeed(name)
+
+    def close(self):
+        #关闭数据源池中工作线程用过的数据源；之后仍需要时重新建立
+        self.__feedPool.close()
+        self.__feedPool = FeedPool(self._dataFeedsFactory, self.__fetcher.maxWorkers)
+
+    def __getstate__(self):
+        #数据源和因子库的连接不能跨进程传递（如多进程计算日度因子）：序列化时去掉，反序列化时重新建立数据源
+        #（通过dsn使用共享连接池时，反序列化后按dsn重新取得连接池）
+        state = self.__dict__.copy()
+        for name in ['_TradeFactorDemo__database', '_TradeFactorDemo__tcalendar', '_TradeFactorDemo__stockcode',
+                     '_TradeFactorDemo__stockdata', '_TradeFactorDemo__stockvars', '_TradeFactorDemo__calendar',
+                     '_TradeFactorDemo__universe', '_TradeFactorDemo__feedThread', '_TradeFactorDemo__feedPool']:
+            state.pop(name, None)
+        state['_BaseFactorWithDB__factorStoreDB'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._connectDataSource()
+        #通过dsn使用共享连接池的，在新进程中重新取得连接池
+        factorStoreDSN = state.get('_BaseFactorWithDB__factorStoreDSN')
+        if factorStoreDSN != None:
+            self.setFactorStoreDSN(factorStoreDSN[0], **factorStoreDSN[1])
         
     def getDataSource(self):
         return self.__database
 
+    def getTradingCalendar(self):
+        return self.__calendar
+
+    def setTradingCalendar(self, calendar):
+        #多个因子可以共用一个TradingCalendar
+        if not isinstance(calendar, TradingCalendar):
+            raise BaseException("[TradeFactorDemo] Not support calendar: %s" % calendar)
+        self.__calendar = calendar
+
+    def getUniverseStore(self):
+        return self.__universe
+
+    def setUniverseStore(self, universe):
+        #多个因子可以共用一个UniverseStore
+        if not isinstance(universe, UniverseStore):
+            raise BaseException("[TradeFactorDemo] Not support universe: %s" % universe)
+        self.__universe = universe
+
+    def getDataFetcher(self):
+        return self.__fetcher
+
+    def setDataFetcher(self, fetcher):
+        #分块的大小、并发数、重试次数，见ChunkedFetcher
+        if not isinstance(fetcher, ChunkedFetcher):
+            raise BaseException("[TradeFactorDemo] Not support fetcher: %s" % fetcher)
+        self.__fetcher = fetcher
+        self.__feedPool.resize(fetcher.maxWorkers)
+
+    def buildUniverse(self, beginDateTime, endDateTime, suspended=False):
+        #一次取得区间内每个交易日的股票列表，之后区间内的_getStockCode不再访问数据源
+        #suspended为True时同时标记区间内的停牌，见loadSuspended
+        days = self.__calendar.getBars(beginDateTime, endDateTime.replace(hour = 15), 86400)
+        self.__universe.build([pd.Timestamp(dt).to_pydatetime() for dt in days])
+        if suspended:
+            self.loadSuspended(beginDateTime, endDateTime)
+
+    def loadSuspended(self, beginDateTime, endDateTime):
+        """
+        #----------------------------------------------------------------------
+        # 由日行情标记区间内每个交易日的停牌股票（交给UniverseStore.setSuspended）：
+        # 当天在股票池中，但没有日行情或成交量为0、缺失的股票
+        # 之后可以用 getUniverseStore().getUniverse(dateTime, excludeSuspended=True) 去掉停牌的股票
+        """
+        days = [pd.Timestamp(dt).to_pydatetime() for dt in
+                self.__calendar.getBars(beginDateTime, endDateTime.replace(hour = 15), 86400)]
+        if len(days) == 0:
+            return
+        members = dict((day, self.__universe.getUniverse(day)['securityId']) for day in days)
+        securityIds = sorted(set(pd.concat(list(members.values()), ignore_index=True)))
+        data = self.__stockdata.getAShareQuotation(securityIds, ['volume'], 86400, days[0].replace(hour = 0),
+                                                   days[-1].replace(hour = 15), 1, datetime.datetime(1970, 1, 1))
+        data = data[data['volume'] > 0]
+        traded = pd.Series(data['securityId'].values, index=pd.DatetimeIndex(data['dateTime']).normalize())
+        frames = []
+        for day in days:
+            date = pd.Timestamp(day).normalize()
+            tradedIds = traded.loc[[date]].values if date in traded.index else []
+            suspended = members[day][~members[day].isin(tradedIds)]
+            frames.append(pd.DataFrame({'dateTime':date, 'securityId':suspended.values}))
+        frame = pd.concat(frames, ignore_index=True)
+        if len(frame) > 0:
+            self.__universe.setSuspended(frame)
+
+    def _loadStockCode(self, dateTime):
+        return self.__stockcode.getAShareCodes(dateTime, dateTime)
+
     def _getStockCode(self, beginDateTime=None, endDateTime=None):
+        #某一天的股票列表从UniverseStore中取（带数据源返回的其他列），区间的股票列表仍从数据源取
+        if beginDateTime is not None and endDateTime is not None and beginDateTime.date() == endDateTime.date():
+            return self.__universe.getUniverse(endDateTime)
         return self.__stockcode.getAShareCodes(beginDateTime, endDateTime)
 
     def _getStockData(self, securityIds, items, beginDateTime=None, endDatetime=None, frequency= None, adjusted=1,
                       adjustedDate=datetime.datetime(1970, 1, 1)):
         endDatetime = endDatetime.replace(hour = 15)
         frequency = self.FREQUENCY
-        return self.__stockdata.getAShareQuotation(securityIds, items, frequency, beginDateTime, endDatetime, adjusted,
-                                                   adjustedDate)
+        with self._useFeed("AShareQuotation", self.__stockdata) as stockdata:
+            return stockdata.getAShareQuotation(securityIds, items, frequency, beginDateTime, endDatetime, adjusted,
+                                                adjustedDate)
         
     def _getStockVars(self,securityIds, dateTimeList, items = []):
         if items == []:
             return pd.DataFrame()
-        return self.__stockvars.getAShareDayVars(dateTimeList, securityIds, items)
+        with self._useFeed("AShareVars", self.__stockvars) as stockvars:
+            return stockvars.getAShareDayVars(dateTimeList, securityIds, items)
 
-    def _getTradeDate(self, beginDateTime=None, endDateTime=None):
+    def _fetchStockData(self, securityIds, items, beginDateTime, endDateTime, sink=None):
+        """
+        #----------------------------------------------------------------------
+        # 按股票和交易日分块并发地取行情，结果与_getStockData一次请求的相同
+        # @param sink: type: 函数 sink(data)，每块取到后调用；None时返回拼接后的长表
+        """
         endDateTime = endDateTime.replace(hour = 15)
-        return self.__stockdata.getAShareQuotation(['000001.SH'], ['close'], self.FREQUENCY, 
+        firstDay = beginDateTime.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+        days = [pd.Timestamp(dt).normalize().to_pydatetime() for dt in self.__calendar.getBars(firstDay, endDateTime, 86400)]
+        def load(ids, dates):
+            #第一块从beginDateTime开始、最后一块到endDateTime，中间的块按整日（到最后一天的15点，含日内的时间点）
+            if len(dates) == 0:
+                return self._getStockData(ids, items, beginDateTime, endDateTime)
+            b = beginDateTime if dates[0] <= beginDateTime else dates[0]
+            e = endDateTime if dates[-1].date() >= endDateTime.date() else dates[-1].replace(hour = 15)
+            return self._getStockData(ids, items, b, e)
+        return self.__fetcher.fetch(load, securityIds, days, sink)
+
+    def _fetchStockVars(self, securityIds, dateTimeList, items, sink=None):
+        #按股票和交易日分块并发地取指标，结果与_getStockVars一次请求的相同
+        if items == []:
+            return pd.DataFrame()
+        return self.__fetcher.fetch(lambda ids, dates: self._getStockVars(ids, dates, items),
+                                    securityIds, dateTimeList, sink)
+
+    def _loadTradeBars(self, frequency, beginDateTime, endDateTime):
+        #交易日历的数据源：000001.SH在该频率上的时间点
+        return self.__stockdata.getAShareQuotation(['000001.SH'], ['close'], frequency, 
                                                    beginDateTime, endDateTime, 1, datetime.datetime(1970, 1, 1)
-                                                   )['dateTime'].to_frame()
+                                                   )['dateTime']
+
+    def _getTradeDate(self, beginDateTime=None, endDateTime=None):
+        endDateTime = endDateTime.replace(hour = 15)
+        return pd.DataFrame({'dateTime':self.__calendar.getBars(beginDateTime, endDateTime, self.FREQUENCY)})
         
     def _getVarsDate(self, beginDateTime=None, endDateTime=None):
         endDateTime = endDateTime.replace(hour = 15)
-        return self.__stockdata.getAShareQuotation(['000001.SH'], ['close'], 86400, 
-                                                   beginDateTime, endDateTime, 1, datetime.datetime(1970, 1, 1)
-                                                   )['dateTime'].to_frame()
+        return pd.DataFrame({'dateTime':self.__calendar.getBars(beginDateTime, endDateTime, 86400)})
+
+    def _getLastTradeDate(self, dateTime, n, frequency=None):
+        #不晚于dateTime当天15点的最后n个时间点
+        if frequency is None:
+            frequency = self.FREQUENCY
+        return pd.DataFrame({'dateTime':self.__calendar.getLastBars(dateTime.replace(hour = 15), n, frequency)})
+
+    def _slideRingPanel(self, ring, dateTimes, securityIds, fetch):
+        """
+        #----------------------------------------------------------------------
+        # fetchDataOnOld时滑动窗口：清空过期的时间点和调出的股票，
+        # 原有股票只取新的时间点，新调入的股票取整个窗口
+        # @param fetch: 函数 fetch(securityIds, dateTimeList, sink)，取到的长表 ['dateTime','securityId', 指标...]
+        #               分块交给sink(data)
+        # @return  RingPanel
+        """
+        dateTimes = pd.DatetimeIndex(dateTimes)
+        if ring is None or ring.capacity != len(dateTimes):
+            ring = RingPanel(len(dateTimes))
+        oldSecurityIds = set(ring.getSecurityIds())
+        ring.retainDates(dateTimes)
+        ring.setUniverse(securityIds)
+        staying = [securityId for securityId in securityIds if securityId in oldSecurityIds]
+        entering = [securityId for securityId in securityIds if securityId not in oldSecurityIds]
+        newDates = dateTimes.difference(ring.getDates())
+        def sink(data):
+            if len(data) > 0:
+                ring.insert(data[pd.DatetimeIndex(data['dateTime']).isin(dateTimes)])
+        for ids, dates in [(staying, newDates), (entering, dateTimes)]:
+            if len(ids) > 0 and len(dates) > 0:
+                fetch(ids, [dt.to_pydatetime() for dt in dates], sink)
+        return ring
 
     def getData(self, dateTime=None):
         if not dateTime:
@@ -920,48 +1924,19 @@ class TradeFactorDemo(BaseFactorWithDB):
         if self.items is None or self.maxoffset is None:
             return
         try:
-            timedelta = datetime.timedelta(days=self.offset1 *2 +20)
-            tradedates = self._getTradeDate(dateTime - timedelta, dateTime)
+            tradedates = self._getLastTradeDate(dateTime, self.maxoffset)
             self.beginDateTime = tradedates.iloc[-self.maxoffset, 0].to_pydatetime()
             self.endDateTime = tradedates.iloc[-1, 0].to_pydatetime()
             self.stocklist = self._getStockCode(self.endDateTime, self.endDateTime)
-            if self.fetchDataOnOld and not self.stockdata.empty:
-                oldstockset = pd.Index(self.stockdata.index.get_level_values("securityId").unique())
-                newstockset = self.stocklist.set_index("securityId").index
-                # 去除新代码列表中没有的代码
-                stock_drop = oldstockset.difference(newstockset)
-
-                if not pd.Series(stock_drop).empty:
-                    self.stockdata.drop(labels=stock_drop, level="securityId", inplace=True)
-                # 取旧代码新数据，
-                stock_intersection = newstockset.intersection(oldstockset)
-                if not pd.Series(stock_intersection).empty:
-                    olddateset = pd.Index(self.stockdata.index.get_level_values("dateTime").unique())
-                    newdateset = tradedates.iloc[-self.maxoffset:].set_index("dateTime").index
-                    date_drop = olddateset.difference(newdateset)
-                    
-                    # 去除新日期中没有的部分
-                    if not pd.Series(date_drop).empty:
-                        self.stockdata.drop(labels=date_drop, level="dateTime", inplace=True)
-                    # 更新旧日期中没有的部分
-                    date_new = newdateset.difference(olddateset)
-                    if not pd.Series(date_new).empty:
-                        tmp_begin = date_new[0].to_pydatetime()
-                        tmp_end = date_new[-1].to_pydatetime()
-                        update_data = self._getStockData(stock_intersection.tolist(), self.items, tmp_begin, tmp_end)
-                        update_data.set_index(['dateTime', 'securityId'], inplace=True)
-                        self.stockdata = self.stockdata.append(update_data)
-                # 取新增代码数据
-                stock_new = newstockset.difference(oldstockset)
-                if not pd.Series(stock_new).empty:
-                    new_stock_data = self._getStockData(stock_new.tolist(), self.items, self.beginDateTime,
-                                                        self.endDateTime)
-                    new_stock_data.set_index(['dateTime', 'securityId'], inplace=True)
-                    self.stockdata = self.stockdata.append(new_stock_data)
-                self.stockdata.sort_index(inplace=True)
+            if self.fetchDataOnOld:
+                # 窗口在预先分配的数组上滑动，只取新的时间点和新调入股票的数据
+                fetch = lambda securityIds, dates, sink: self._fetchStockData(securityIds, self.items, dates[0], dates[-1], sink)
+                self.__stockdataRing = self._slideRingPanel(self.__stockdataRing, tradedates['dateTime'],
+                                                            self.stocklist['securityId'].tolist(), fetch)
+                self.stockdata = None
             else:
-                self.stockdata = self._getStockData(self.stocklist['securityId'].tolist(), self.items,
-                                                    self.beginDateTime, self.endDateTime)
+                self.stockdata = self._fetchStockData(self.stocklist['securityId'].tolist(), self.items,
+                                                      self.beginDateTime, self.endDateTime)
                 self.stockdata.set_index(['dateTime', 'securityId'], inplace=True)
         except Exception as err:
             print(err)
@@ -975,46 +1950,19 @@ class TradeFactorDemo(BaseFactorWithDB):
         if self.varsitems is None or self.maxoffset_day is None:
             return
         try:
-            timedelta = datetime.timedelta(days=self.offset1 *2 +20)
-            tradedates = self._getVarsDate(dateTime - timedelta, dateTime)
+            tradedates = self._getLastTradeDate(dateTime, self.maxoffset_day, 86400)
             self.beginDateTime = tradedates.iloc[-self.maxoffset_day, 0].to_pydatetime()
             self.endDateTime = tradedates.iloc[-1, 0].to_pydatetime()
             tradedates2 = tradedates.loc[tradedates['dateTime']>=self.beginDateTime]
             tradedates2 = [date.to_pydatetime() for date in tradedates2['dateTime']]
             self.stocklist = self._getStockCode(self.endDateTime, self.endDateTime)
-            if self.fetchDataOnOld and not self.stockvars.empty:
-                oldstockset = pd.Index(self.stockvars.index.get_level_values("securityId").unique())
-                newstockset = self.stocklist.set_index("securityId").index
-                # 去除新代码列表中没有的代码
-                stock_drop = oldstockset.difference(newstockset)
-                if not pd.Series(stock_drop).empty:
-                    self.stockvars.drop(labels=stock_drop, level="securityId", inplace=True)
-                # 取旧代码新数据，
-                stock_intersection = newstockset.intersection(oldstockset)
-                if not pd.Series(stock_intersection).empty:
-                    olddateset = pd.Index(self.stockvars.index.get_level_values("dateTime").unique())
-                    newdateset = tradedates.iloc[-self.maxoffset_day:].set_index("dateTime").index
-                    date_drop = olddateset.difference(newdateset)
-                    
-                    # 去除新日期中没有的部分
-                    if not pd.Series(date_drop).empty:
-                        self.stockvars.drop(labels=date_drop, level="dateTime", inplace=True)
-                    # 更新旧日期中没有的部分
-                    date_new = newdateset.difference(olddateset)
-                    if not pd.Series(date_new).empty:
-                        date_new = [date.to_pydatetime() for date in date_new]
-                        update_data = self._getStockVars(stock_intersection.tolist(), date_new, self.varsitems)
-                        update_data.set_index(['dateTime', 'securityId'], inplace=True)
-                        self.stockvars = self.stockvars.append(update_data)
-                # 取新增代码数据
-                stock_new = newstockset.difference(oldstockset)
-                if not pd.Series(stock_new).empty:
-                    new_stock_data = self._getStockVars(stock_new.tolist(), tradedates2, self.varsitems)
-                    new_stock_data.set_index(['dateTime', 'securityId'], inplace=True)
-                    self.stockvars = self.stockvars.append(new_stock_data)
-                self.stockvars.sort_index(inplace=True)
+            if self.fetchDataOnOld:
+                fetch = lambda securityIds, dates, sink: self._fetchStockVars(securityIds, dates, self.varsitems, sink)
+                self.__stockvarsRing = self._slideRingPanel(self.__stockvarsRing, tradedates['dateTime'],
+                                                            self.stocklist['securityId'].tolist(), fetch)
+                self.stockvars = None
             else:
-                self.stockvars = self._getStockVars(self.stocklist['securityId'].tolist(), tradedates2, self.varsitems)
+                self.stockvars = self._fetchStockVars(self.stocklist['securityId'].tolist(), tradedates2, self.varsitems)
                 self.stockvars.set_index(['dateTime', 'securityId'], inplace=True)
         except Exception as err:
             print(err)
@@ -1040,10 +1988,11 @@ class HTradeFactorDemo(TradeFactorDemo):
         
         其中:dailydata是DataFrame，索引为'dateTime', 'securityId'；列为items。
              dailyfactor是Series,索引为'date', 'securityId'。
+             getDailyPanel()返回dailydata的稠密面板（MinutePanel），每个指标为 股票×分钟 的二维数组。
     """    
     def __init__(self,path,standard=False,how='mean',lagTradeDays=None,frequency=60,
                  validTradingDayRatio=0.7,items=None,varitems=None,factorSymbol=None,  factorDirection=1, 
-                 fetchDataOnOld=False,dailyFactorSymbol=None):
+                 fetchDataOnOld=False,dailyFactorSymbol=None,n_jobs=1,dailyFactorStore='pickle',prefetchDepth=2):
         s_str='_s' if standard else '' #是否对日度因子横截面标准化
         factorSymbol=factorSymbol+'_'+str(lagTradeDays)+how+s_str
         TradeFactorDemo.__init__(self, factorSymbol=factorSymbol, factorDirection=factorDirection,
@@ -1051,8 +2000,18 @@ class HTradeFactorDemo(TradeFactorDemo):
                                   items=items,varitems=varitems,fetchDataOnOld=fetchDataOnOld)
         self.standard=standard
         self.how=how
+        #计算缺失日度因子时使用的进程数，1为单进程
+        self.n_jobs=n_jobs
+        #单进程计算缺失的日度因子时，后台线程预先导入后面prefetchDepth天的数据，0为不预取
+        self.prefetchDepth=prefetchDepth
+        #getDailyFactors计算缺失的日度因子期间的预取线程
+        self.__dailyPrefetcher=None
+        #getDailyFactors期间，本地已有的日度因子由readRange一次读出，按日期存放
+        self.__dailyWindow=None
         #dailyData路径
         self.dailyData_path=path+'\\_dailyData\\'+str(frequency)
+        #本地分钟数据的读取：有列式文件时只读取用到的列，否则读取原pickle
+        self.minuteDataStore=MinuteDataStore(self.dailyData_path)
         #dailyFactor路径
         if type(dailyFactorSymbol) not in [types.StringType, types.UnicodeType]:
             raise BaseException("dailyFactorSymbol must be string.")  
@@ -1060,77 +2019,214 @@ class HTradeFactorDemo(TradeFactorDemo):
             self.dailyFactor_path=path+'\\_dailyFactor\\'+dailyFactorSymbol
             if not os.path.exists(self.dailyFactor_path):
                 os.makedirs(self.dailyFactor_path)
+        #dailyFactor存储方式：'pickle'每天一个pickle文件；'columnar'按年月分区的列式存储（原pickle文件仍可读取）
+        if isinstance(dailyFactorStore, BaseDailyFactorStore):
+            self.dailyFactorStore=dailyFactorStore
+        elif dailyFactorStore=='pickle':
+            self.dailyFactorStore=PickleDailyFactorStore(self.dailyFactor_path)
+        elif dailyFactorStore=='columnar':
+            self.dailyFactorStore=ColumnarDailyFactorStore(self.dailyFactor_path,
+                                                           legacy=PickleDailyFactorStore(self.dailyFactor_path))
+        else:
+            raise BaseException("Not support dailyFactorStore:%s" % dailyFactorStore)
         
         self.dailydata=pd.DataFrame()
+        self.dailypanel=None
+        #生成self.dailypanel所用的dailydata，dailydata被重新赋值后面板随之重建
+        self.__dailypanelSource=None
         self.dailyfactor=pd.DataFrame()
         
-    def getDailyData(self,dateTime):
-        #导入dateTime当天的数据
+    def getDailyData(self,dateTime,items=None):
+        #导入dateTime当天的数据，items默认为self.items
         if not isinstance(dateTime, datetime.datetime):
             raise BaseException("[getData] 'dateTime'must be datetime.datetime")
-        if self.items is None or self.maxoffset is None:
+        if items is None:
+            items=self.items
+        if items is None or self.maxoffset is None:
             return
-        
+        self.dailypanel=None
+        self.dailydata=self._loadDailyData(dateTime,items)
+
+    def _loadDailyData(self,dateTime,items=None):
+        #导入dateTime当天的数据并返回，不修改实例的状态，可以在预取线程中调用
+        if items is None:
+            items=self.items
         if os.path.exists(self.dailyData_path):
             #如果本地数据文件存在，则导入本地数据:包括量价base、委托仓位position、衍生derived三部分
             
-            items0=list(set(self.items).intersection(['close', 'preClose','volume']))
+            items0=list(set(items).intersection(['close', 'preClose','volume']))
             data0=pd.DataFrame()
             if len(items0)>0:
                 #如果要提取的指标在base包括的三个指标中
-                file0=self.dailyData_path+'\\base\\'+dateTime.strftime('%Y-%m-%d')+'.pkl'
-                data0=pd.read_pickle(file0)
-                data0=data0[items0]
+                data0=self.minuteDataStore.read('base',dateTime,items0)
             
-            items1=list(set(self.items).intersection(['bc1','buy1','sc1','sale1','bc2','buy2',
+            items1=list(set(items).intersection(['bc1','buy1','sc1','sale1','bc2','buy2',
                         'sc2','sale2','bc3','buy3','sc3','sale3','bc4','buy4','sc4','sale4','bc5','buy5','sc5','sale5']))
             data1=pd.DataFrame()
             if len(items1)>0:
                 #如果要提取的指标在position包括的三个指标中
-                file1=self.dailyData_path+'\\position\\'+dateTime.strftime('%Y-%m-%d')+'.pkl'
-                data1=pd.read_pickle(file1)
-                data1=data1[items1]
+                data1=self.minuteDataStore.read('position',dateTime,items1)
             
-            items2=list(set(self.items).intersection(['spread']))
+            items2=list(set(items).intersection(['spread']))
             data2=pd.DataFrame()
             if len(items2)>0:
                 #如果要提取的指标在derived包括的三个指标中
-                file2=self.dailyData_path+'\\derived\\'+dateTime.strftime('%Y-%m-%d')+'.pkl'
-                data2=pd.read_pickle(file2)
-                data2=data2[items2]
+                data2=self.minuteDataStore.read('derived',dateTime,items2)
             
-            self.dailydata=pd.concat([data0,data1,data2],axis=1)
+            return pd.concat([data0,data1,data2],axis=1)
         else:
             #如果本地数据文件不存在，则导入线上数据
-            self.dailydata = self._getStockData(self.stocklist['securityId'].tolist(), self.items,
+            dailydata = self._fetchStockData(self.stocklist['securityId'].tolist(), items,
                                                     dateTime,dateTime)
-            self.dailydata.set_index(['dateTime', 'securityId'], inplace=True)
+            dailydata.set_index(['dateTime', 'securityId'], inplace=True)
+            return dailydata
+
+    def _prefetchDailyData(self,dateTimeList,items=None):
+        #后台线程按顺序导入dateTimeList的数据；prefetchDepth为0或子类重写了getDailyData时返回None
+        if self.prefetchDepth<=0 or len(dateTimeList)<=1 or self.items is None or self.maxoffset is None:
+            return None
+        #python2中类属性取得的是每次新建的unbound method，比较其下的函数
+        getDailyData=type(self).getDailyData
+        if getattr(getDailyData,'__func__',getDailyData) is not getattr(HTradeFactorDemo.getDailyData,'__func__',HTradeFactorDemo.getDailyData):
+            return None
+        return Prefetcher(lambda dt: self._loadDailyData(dt,items),dateTimeList,self.prefetchDepth)
 
 
+    def getDailyPanel(self,dtype=np.float32):
+        #由self.dailydata生成稠密面板，同一份dailydata（同一对象）、同一dtype只生成一次
+        #默认float32，数值部分的内存为float64的一半；对精度敏感的计算在取出的数组上转为float64（如H_RVdir3）
+        if self.dailypanel is None or self.__dailypanelSource is not self.dailydata \
+                or self.dailypanel.dtype!=np.dtype(dtype):
+            self.dailypanel=MinutePanel.fromFrame(self.dailydata,items=list(self.dailydata.columns),dtype=dtype)
+            self.__dailypanelSource=self.dailydata
+        return self.dailypanel
+
     def getDailyFactor(self,dateTime):
         #如果存在日度因子数据，则导入；否则首先导入日度数据，然后计算日度因子并保存在本地
         #其中,self.getFactor()使用self.dailydata计算self.dailyfactor
         if not isinstance(dateTime, datetime.datetime):
             raise BaseException("[getData] 'dateTime'must be datetime.datetime")
         
-        file0=self.dailyFactor_path+'\\'+dateTime.strftime('%Y-%m-%d')+'.pkl'
-        if os.path.exists(file0):
+        day=pd.Timestamp(dateTime.date())
+        if self.__dailyWindow is not None and day in self.__dailyWindow:
+            #getDailyFactors已一次读出的日度因子
+            self.dailyfactor=self.__dailyWindow[day]
+        elif self.dailyFactorStore.exists(dateTime):
             #如果存在日度因子数据，则导入
-            self.dailyfactor=pd.read_pickle(file0)
+            self.dailyfactor=self.dailyFactorStore.read(dateTime)
         else:
             #如果不存在，则首先导入日度数据，然后计算日度因子并保存在本地
-            self.getDailyData(dateTime)
-            self.getFactor()
-            self.dailyfactor.replace([np.inf,-np.inf],np.nan,inplace=True)
-            self.dailyfactor.to_pickle(file0)
+            self._calculateDailyFactor(dateTime)
         if self.standard:
             self.dailyfactor=(self.dailyfactor-self.dailyfactor.mean())/self.dailyfactor.std()
 
+    def _calculateDailyFactor(self,dateTime,dailydata=None):
+        #导入日度数据，计算日度因子并保存在本地；dailydata不为None时直接使用（如FactorBatch已导入的数据）
+        #getDailyFactors预取期间，日度数据从预取线程中取
+        if dailydata is None and self.__dailyPrefetcher is not None:
+            dailydata=self.__dailyPrefetcher.get(dateTime)
+        if dailydata is None:
+            self.getDailyData(dateTime)
+        else:
+            self.dailydata=dailydata
+            self.dailypanel=None
+        self.getFactor()
+        self.dailyfactor.replace([np.inf,-np.inf],np.nan,inplace=True)
+        self.dailyFactorStore.write(dateTime,self.dailyfactor)
+
+    def _calculateDailyFactorsParallel(self,dateTimeList,n_jobs):
+        #多进程计算本地没有的日度因子，各进程只负责计算并写入日度因子文件
+        missing=[dt for dt in dateTimeList if not self.dailyFactorStore.exists(dt)]
+        if len(missing)<=1:
+            return
+        pool=multiprocessing.Pool(processes=min(n_jobs,len(missing)),
+                                  initializer=_initDailyFactorWorker,initargs=(self,))
+        try:
+            pool.map(_dailyFactorWorker,missing,chunksize=1)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            #合并各进程写入的日度因子
+            self.dailyFactorStore.flush(missing)
+
+    def _readDailyFactorWindow(self,dateTimeList):
+        #用readRange一次读出dateTimeList的日度因子，返回 {日期: 当天的日度因子}；不足两天或索引中没有'date'时返回None
+        if len(dateTimeList)<=1:
+            return None
+        data=self.dailyFactorStore.readRange(min(dateTimeList),max(dateTimeList),dateTimeList)
+        if data is None or 'date' not in data.index.names:
+            return None
+        dates=pd.DatetimeIndex(pd.to_datetime(data.index.get_level_values('date'))).normalize()
+        window={}
+        for day,rows in pd.Series(np.arange(len(data))).groupby(dates.values):
+            window[pd.Timestamp(day)]=data.iloc[rows.values]
+        return window
+
+    def getDailyFactors(self,dateTimeList,n_jobs=None,dailyWindow=None):
+        #批量导入dateTimeList中每天的日度因子，先收集再一次性拼接，避免逐日append带来的平方复杂度
+        #n_jobs>1时先用进程池并行计算本地没有的日度因子，默认取self.n_jobs
+        #dailyWindow: _readDailyFactorWindow已读出的日度因子（如FactorBatch中dailyFactor路径相同的因子共用），None时自行读取
+        #返回长表：['securityId','date','dailyfactor']
+        if n_jobs is None:
+            n_jobs=self.n_jobs
+        if n_jobs>1:
+            self._calculateDailyFactorsParallel(dateTimeList,n_jobs)
+        #本地没有日度因子的日期，计算当天时预取后面几天的数据
+        missing=[]
+        for dt in dateTimeList:
+            if dt not in missing and not self.dailyFactorStore.exists(dt):
+                missing.append(dt)
+        #本地已有的日度因子用readRange一次读出
+        if dailyWindow is None:
+            dailyWindow=self._readDailyFactorWindow([dt for dt in dateTimeList if dt not in missing])
+        self.__dailyWindow=dailyWindow
+        self.__dailyPrefetcher=self._prefetchDailyData(missing)
+        frames=[]
+        try:
+            for dt in dateTimeList:
+                self.getDailyFactor(dt)
+                frames.append(self.dailyfactor.to_frame('dailyfactor').reset_index())
+        finally:
+            self.__dailyWindow=None
+            if self.__dailyPrefetcher is not None:
+                self.__dailyPrefetcher.close()
+                self.__dailyPrefetcher=None
+        #整批计算完后只合并一次新写入的日度因子
+        if len(missing)>0:
+            self.dailyFactorStore.flush()
+        if len(frames)==0:
+            return pd.DataFrame(columns=['securityId','date','dailyfactor'])
+        dailyfactor=pd.concat(frames,ignore_index=True)
+        dailyfactor['date']=dailyfactor['date'].astype('datetime64[ns]')
+        return dailyfactor
+
 
     def _wavg(self,group,avg_name,weight_name):
         d=group[avg_name]
         w=group[weight_name]
         return (d*w).sum()/w.sum()
+
+    def _groupedWavg(self,data,ascending,weightFunc):
+        #按securityId分组的加权平均，用排序后的分组编码一次完成，不再逐只股票调用_wavg
+        #组内按date排序后的序号rank(从1开始)经weightFunc得到权重；与_wavg一致，缺失值计入权重和但不计入分子
+        if len(data)==0:
+            return pd.Series([],index=pd.Index([],name='securityId'),dtype=np.float64)
+        data=data.sort_values('date',ascending=ascending,kind='mergesort')
+        codes,uniques=pd.factorize(data['securityId'].values,sort=True)
+        order=np.argsort(codes,kind='mergesort')#稳定排序，组内保持date的顺序
+        codes=codes[order]
+        starts=np.r_[0,np.flatnonzero(np.diff(codes))+1]
+        sizes=np.diff(np.r_[starts,len(codes)])
+        rank=np.arange(len(codes))-np.repeat(starts,sizes)+1
+        weight=weightFunc(rank.astype(np.float64))
+        value=data['dailyfactor'].values.astype(np.float64)[order]
+        numerator=np.bincount(codes,weights=np.where(np.isnan(value),0.0,value*weight),minlength=len(uniques))
+        denominator=np.bincount(codes,weights=weight,minlength=len(uniques))
+        return pd.Series(numerator/denominator,index=pd.Index(uniques,name='securityId'))
+
     def transformToId(self,data):
         #将日度因子值转化成月度因子值，其中['dailyfactor']为日度因子值
         if self.how=='mean':
@@ -1138,18 +2234,11 @@ class HTradeFactorDemo(TradeFactorDemo):
             data=data.groupby('securityId')['dailyfactor'].mean()
         elif self.how=='wmean':
             #线性加权平均数
-            data=data.sort_values( 'date', ascending=1)#越远的在前面
-            data['weight']=1.0
-            data['weight']=data.groupby('securityId')['weight'].cumsum()
-            data=data.groupby('securityId').apply(self._wavg,'dailyfactor','weight')
+            data=self._groupedWavg(data,True,lambda x:x)#越远的在前面，权重依次为1,2,...
         elif self.how=='ewmean':
             #指数加权平均数
             a=2.0/(1+self.offset1)
-            data=data.sort_values('date', ascending=0)#越近的在前面
-            data['weight']=1
-            data['weight']=data.groupby('securityId')['weight'].cumsum()
-            data['weight']=data['weight'].apply(lambda x:(1-a)**(x-1))
-            data=data.groupby('securityId').apply(self._wavg,'dailyfactor','weight')
+            data=self._groupedWavg(data,False,lambda x:(1-a)**(x-1))#越近的在前面
         elif self.how=='median':
             #中位数
             data=data.groupby('securityId')['dailyfactor'].median()
@@ -1170,31 +2259,210 @@ class HTradeFactorDemo(TradeFactorDemo):
             raise BaseException("[getData] 'dateTime'must be datetime.datetime")
             
 
-        timedelta = datetime.timedelta(days=self.offset1 *2 +20)
-        tradedates = self._getTradeDate(dateTime - timedelta, dateTime)         #频率为类频率
+        tradedates = self._getLastTradeDate(dateTime, self.maxoffset)         #频率为类频率
         self.beginDateTime = tradedates.iloc[-self.maxoffset, 0].to_pydatetime()
         self.endDateTime = tradedates.iloc[-1, 0].to_pydatetime()
         self.tradeDateList =self._getVarsDate(self.beginDateTime, self.endDateTime)   #频率为天
         self.stocklist = self._getStockCode(self.endDateTime, self.endDateTime)
         
-        dailyfactor = pd.DataFrame()
         tradeDateList1 = [dt.to_pydatetime() for dt in self.tradeDateList['dateTime']]
-        for dt in tradeDateList1:
-            self.getDailyFactor(dt)
-            dailyfactor=dailyfactor.append(self.dailyfactor.to_frame('dailyfactor').reset_index())
-            dailyfactor['date']=dailyfactor['date'].astype('datetime64[ns]')
+        dailyfactor = self.getDailyFactors(tradeDateList1)
+        return self._aggregateDailyFactor(dailyfactor, self.stocklist)
 
-        
+    def _aggregateDailyFactor(self, dailyfactor, stocklist):
         #保留有效的股票列表
         count=dailyfactor.groupby('securityId').size()
-        stocklist=count[count>=self.offset1 * self.validTradingDayRatio]
-        dailyfactor=pd.merge(dailyfactor,stocklist.reset_index()[['securityId']],on='securityId',how='inner')
+        validlist=count[count>=self.offset1 * self.validTradingDayRatio]
+        dailyfactor=pd.merge(dailyfactor,validlist.reset_index()[['securityId']],on='securityId',how='inner')
         
         factor=self.transformToId(dailyfactor).to_frame('factorValue')
-        return  self.stocklist.merge(factor, left_on='securityId', right_index=True, how='left')
+        return  stocklist.merge(factor, left_on='securityId', right_index=True, how='left')
+
+    def _getRebalanceDates(self, tradeDates, rebalance='M'):
+        #由交易日序列得到调仓日：'D'为每个交易日，其余取每个周期（'W'、'M'、'Q'、'A'等）的最后一个交易日
+        tradeDates = pd.Series(pd.to_datetime(tradeDates)).sort_values().reset_index(drop=True)
+        if rebalance == 'D':
+            return tradeDates
+        return tradeDates.groupby(tradeDates.dt.to_period(rebalance)).max().reset_index(drop=True)
+
+    def calculateFactorValueRange(self, beginDateTime, endDateTime, rebalance='M', incremental=None):
+        """
+        #----------------------------------------------------------------------
+        # 区间回填：在[beginDateTime, endDateTime]内的每个调仓日计算因子值，
+        # 每个调仓日的结果与calculateFactorValue(调仓日)一致。
+        # 交易日历只取一次，区间内每个日度因子只导入一次，各调仓日的lagTradeDays窗口在其上滑动。
+        # @param rebalance: type: Str; 'D'每日，'W'每周，'M'每月（默认），也可为pandas的其他周期
+        # @param incremental: type: Bool; 是否用增量滚动统计（rolling.RollingFactorWindow），
+        #                     默认None表示按日调仓时使用
+        # @return  DataFrame ['dateTime','securityId','factorValue']，长表
+        """
+        if not isinstance(beginDateTime, datetime.datetime) or not isinstance(endDateTime, datetime.datetime):
+            raise BaseException("[calculateFactorValueRange] 'beginDateTime' and 'endDateTime' must be datetime.datetime")
+        if beginDateTime > endDateTime:
+            raise BaseException("[calculateFactorValueRange] 'beginDateTime' must not be later than 'endDateTime'")
+
+        # step1 交易日历只取一次，向前多取一个窗口
+        bars, days = self._getRangeCalendar(beginDateTime, endDateTime)
+        # step2 与calculateFactorValue相同的方式确定每个调仓日的窗口
+        windows = self._getRangeWindows(bars, days, beginDateTime, rebalance)
+        if len(windows) == 0:
+            return pd.DataFrame()
+        if incremental is None:
+            incremental = rebalance == 'D'
+        # step3,4 导入日度因子，窗口在其上滑动
+        return self._calculateRangeOnWindows(days, windows, incremental)
+
+    def _getRangeCalendar(self, beginDateTime, endDateTime):
+        #区间回填用的交易日历，向前多取一个窗口：bars为类频率的时间点，days为交易日
+        #从beginDateTime当天的窗口的第一个时间点所在的日期开始，之后各日期的窗口都不会更早
+        first = self._getLastTradeDate(beginDateTime, self.maxoffset).iloc[0, 0]
+        first = pd.Timestamp(first).normalize().to_pydatetime()
+        bars = np.sort(pd.to_datetime(self._getTradeDate(first, endDateTime)['dateTime']).values)    #频率为类频率
+        days = np.sort(pd.to_datetime(self._getVarsDate(first, endDateTime)['dateTime']).values)     #频率为天
+        return bars, days
+
+    def _getRangeWindows(self, bars, days, beginDateTime, rebalance='M'):
+        #每个调仓日的窗口(dt, lo, hi)，lo:hi为days的下标区间，与calculateFactorValue(dt)所用的交易日相同
+        rebalanceDates = self._getRebalanceDates(days[days >= np.datetime64(beginDateTime.date())], rebalance)
+        windows = []
+        for dt in rebalanceDates:
+            dt = dt.to_pydatetime()
+            window = self._getBarWindow(bars, days, dt)
+            if window is not None:
+                windows.append((dt, window[1], window[2]))
+        return windows
+
+    def _getBarWindow(self, bars, days, dateTime):
+        #与calculateFactorValue(dateTime)相同的窗口(窗口最后的时间点, lo, hi)，lo:hi为days的下标区间；
+        #bars中的时间点不够时为None
+        barEnd = bars.searchsorted(np.datetime64(dateTime.replace(hour=15)), side='right')
+        if barEnd < self.maxoffset:
+            return None
+        windowBegin = bars[barEnd - self.maxoffset]
+        windowEnd = bars[barEnd - 1]
+        lo = days.searchsorted(windowBegin, side='left')
+        hi = days.searchsorted(windowEnd, side='right')
+        return pd.Timestamp(windowEnd).to_pydatetime(), lo, hi
+
+    def calculateFactorValues(self, dateTimeList):
+        """
+        #----------------------------------------------------------------------
+        # 多个日期一起计算，每个日期的结果与calculateFactorValue(dateTime)一致：
+        # 交易日历只取一次，各日期窗口内的日度因子只导入一次。窗口相同的日期（如周末）只算一次。
+        # @return  DataFrame ['dateTime','securityId','factorValue']，长表
+        """
+        for dateTime in dateTimeList:
+            if not isinstance(dateTime, datetime.datetime):
+                raise BaseException("[calculateFactorValues] item in 'dateTimeList' must be datetime.datetime")
+        if len(dateTimeList) == 0:
+            return pd.DataFrame()
+        bars, days = self._getRangeCalendar(min(dateTimeList), max(dateTimeList))
+        windows = collections.OrderedDict()
+        requested = collections.defaultdict(list)
+        frames = []
+        for dateTime in sorted(dateTimeList):
+            window = self._getBarWindow(bars, days, dateTime)
+            if window is None:
+                #日历向前取得不够，单独计算
+                frames.append(BaseFactorWithDB.calculateFactorValues(self, [dateTime]))
+                continue
+            windows[window[0]] = window
+            requested[window[0]].append(dateTime)
+        if len(windows) > 0:
+            data = self._calculateRangeOnWindows(days, list(windows.values()))
+            for windowEnd, group in data.groupby('dateTime', sort=False):
+                for dateTime in requested[pd.Timestamp(windowEnd).to_pydatetime()]:
+                    group = group.copy()
+                    group.loc[:, 'dateTime'] = dateTime
+                    frames.append(group)
+        frames = [frame for frame in frames if len(frame) > 0]
+        if len(frames) == 0:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _getStockCodeCached(self, beginDateTime, endDateTime, stockCodes=None):
+        #stockCodes为{(beginDateTime, endDateTime): 股票列表}，多个因子一起计算时共用
+        if stockCodes is None:
+            return self._getStockCode(beginDateTime, endDateTime)
+        key = (beginDateTime, endDateTime)
+        if key not in stockCodes:
+            stockCodes[key] = self._getStockCode(beginDateTime, endDateTime)
+        return stockCodes[key]
+
+    def _getRangeWindowDates(self, days, windows):
+        #windows覆盖的全部交易日
+        first = min(w[1] for w in windows)
+        last = max(w[2] for w in windows)
+        return [pd.Timestamp(dt).to_pydatetime() for dt in days[first:last]]
+
+    def _calculateRangeOnWindows(self, days, windows, incremental=False, stockCodes=None, dailyWindow=None):
+        #导入windows覆盖的全部日度因子，再在其上计算各调仓日的因子值
+        #dailyWindow: 已读出的日度因子，见getDailyFactors
+        # step3 区间内所有需要的日度因子只导入一次
+        windowDates = self._getRangeWindowDates(days, windows)
+        self.beginDateTime = windowDates[0]
+        self.endDateTime = windowDates[-1]
+        self.stocklist = self._getStockCodeCached(self.beginDateTime, self.endDateTime, stockCodes)
+        dailyfactor = self.getDailyFactors(windowDates, dailyWindow=dailyWindow)
+        dailyfactor = dailyfactor.sort_values('date', kind='mergesort').reset_index(drop=True)
+        factorDates = dailyfactor['date'].values
+
+        # step4 窗口在已导入的日度因子上滑动
+        if incremental:
+            return self._slideDailyFactor(dailyfactor, days, windows, stockCodes)
+        result = []
+        for dt, lo, hi in windows:
+            lo = factorDates.searchsorted(pd.Timestamp(days[lo]).normalize().to_datetime64(), side='left')
+            hi = factorDates.searchsorted(pd.Timestamp(days[hi - 1]).normalize().to_datetime64(), side='right')
+            stocklist = self._getStockCodeCached(dt, dt, stockCodes)
+            factor = self._aggregateDailyFactor(dailyfactor.iloc[lo:hi], stocklist)
+            factor.loc[:, 'dateTime'] = dt
+            result.append(factor)
+        return pd.concat(result, ignore_index=True)
+
+    def _slideDailyFactor(self, dailyfactor, days, windows, stockCodes=None):
+        #用增量滚动统计依次计算各窗口：相邻窗口只需加入新的日度因子、移除最早的日度因子
+        #windows中的(lo,hi)为days的下标区间，且随调仓日单调递增
+        byDate = dict((date, group.set_index('securityId')['dailyfactor'])
+                      for date, group in dailyfactor.groupby('date'))
+        dates = [pd.Timestamp(dt).normalize() for dt in days]
+        rolling = RollingFactorWindow(self.how, self.offset1)
+        curLo = curHi = 0
+        result = []
+        for dt, lo, hi in windows:
+            while curLo < lo and curLo < curHi:
+                if dates[curLo] in byDate:
+                    rolling.pop()
+                curLo += 1
+            if curHi < lo:
+                curLo = curHi = lo
+            while curHi < hi:
+                if dates[curHi] in byDate:
+                    rolling.push(dates[curHi], byDate[dates[curHi]])
+                curHi += 1
+            count = rolling.getCount()
+            value = rolling.getValue()
+            factor = value[count >= self.offset1 * self.validTradingDayRatio].to_frame('factorValue')
+            stocklist = self._getStockCodeCached(dt, dt, stockCodes)
+            factor = stocklist.merge(factor, left_on='securityId', right_index=True, how='left')
+            factor.loc[:, 'dateTime'] = dt
+            result.append(factor)
+        return pd.concat(result, ignore_index=True)
     
     
 
+_workerFactor = None
+
+def _initDailyFactorWorker(factor):
+    #进程池的初始化：每个进程只接收一次因子实例
+    global _workerFactor
+    _workerFactor = factor
+
+def _dailyFactorWorker(dateTime):
+    if not _workerFactor.dailyFactorStore.exists(dateTime):
+        _workerFactor._calculateDailyFactor(dateTime)
+    return dateTime
+
 
 if __name__=='__main__':
     #from pyalgotrade.multifactor.connectdb import ConnectSqlServer, ConnectOracle
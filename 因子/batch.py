@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 多个高频因子（HTradeFactorDemo的子类实例）一起计算。
+#
+# 同一频率的多个因子（如H_RVdir3的parm 1~4、不同的how和lagTradeDays）各自计算时，
+# 会重复导入同样的dailyData、股票列表和交易日历。FactorBatch 按频率和dailyData路径
+# 把因子分组，每组：
+#     1) 交易日历只取一次，各因子在其上确定自己的调仓窗口；
+#     2) 各因子缺失的日度因子按天汇总，每天按所有因子items的并集只导入一次数据（后台线程预取），
+#        依次交给各因子的getFactor计算并保存；dailyFactor路径相同的因子只计算一次；
+#     3) 各因子在已保存的日度因子上计算因子值，股票列表在组内共用，
+#        dailyFactor路径相同的因子共用一次读出的日度因子。
+"""
+import collections
+import datetime
+import pandas as pd
+
+
+class FactorBatch(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # factors: List，HTradeFactorDemo子类的实例，factorSymbol不能重复
+    #
+    # calculateFactorValueRange(beginDateTime, endDateTime, rebalance, incremental)
+    #     返回 {factorSymbol: DataFrame ['dateTime','securityId','factorValue']}，
+    #     每个因子的结果与其自身的calculateFactorValueRange一致
+    # calculateFactorValue(dateTime)
+    #     返回 {factorSymbol: DataFrame}，dateTime不是交易日时取之前的最后一个交易日
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, factors):
+        self.factors = list(factors)
+        symbols = [factor.getFactorSymbol() for factor in self.factors]
+        duplicated = set(s for s in symbols if symbols.count(s) > 1)
+        if len(duplicated) > 0:
+            raise BaseException("[FactorBatch] Duplicated factorSymbol: %s" % sorted(duplicated))
+        self.groups = self._groupFactors(self.factors)
+
+    def _groupFactors(self, factors):
+        #按频率和dailyData路径分组，同一组的因子可以共用每天导入的数据
+        groups = collections.OrderedDict()
+        for factor in factors:
+            key = (factor.FREQUENCY, factor.dailyData_path)
+            groups.setdefault(key, []).append(factor)
+        return list(groups.values())
+
+    def _getWriterKey(self, factor):
+        #dailyFactor路径和存储方式相同的因子，日度因子相同，只需计算一次
+        return (factor.dailyFactor_path, factor.dailyFactorStore.__class__.__name__)
+
+    def prepareDailyFactors(self, group, dateTimeLists, stockCodes=None):
+        """
+        #----------------------------------------------------------------------
+        # 计算并保存一组因子缺失的日度因子，每天的数据只导入一次
+        # @param group: type: List; 同一组（频率和dailyData路径相同）的因子
+        # @param dateTimeLists: type: List; 与group一一对应，每个因子需要的交易日
+        # @param stockCodes: type: Dict; 组内共用的股票列表缓存
+        """
+        writers = collections.OrderedDict()
+        for factor, dateTimeList in zip(group, dateTimeLists):
+            if factor.items is None:
+                continue
+            key = self._getWriterKey(factor)
+            missing = set(dt for dt in dateTimeList if not factor.dailyFactorStore.exists(dt))
+            if key in writers:
+                writers[key][1].update(missing)
+            else:
+                writers[key] = (factor, missing)
+        allDates = sorted(set().union(*[missing for _, missing in writers.values()]))
+        if len(allDates) == 0:
+            return
+
+        items = []
+        for factor, missing in writers.values():
+            if len(missing) > 0:
+                items.extend(item for item in factor.items if item not in items)
+        loader = [factor for factor, missing in writers.values() if len(missing) > 0][0]
+        #本地没有dailyData时从线上导入，需要区间内的股票列表
+        loader.stocklist = loader._getStockCodeCached(allDates[0], allDates[-1], stockCodes)
+        #计算当天的日度因子时，后台线程预取后面几天的数据
+        prefetcher = loader._prefetchDailyData(allDates, items)
+        try:
+            for dt in allDates:
+                if prefetcher is not None:
+                    data = prefetcher.get(dt)
+                else:
+                    loader.getDailyData(dt, items=items)
+                    data = loader.dailydata
+                for factor, missing in writers.values():
+                    if dt in missing:
+                        factor._calculateDailyFactor(dt, dailydata=data[[item for item in factor.items if item in data.columns]])
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+        for factor, _ in writers.values():
+            factor.dailyFactorStore.flush()
+        #同一路径的其他因子只清空新写入日期所在的缓存
+        for factor in group:
+            factor.dailyFactorStore.refresh(allDates)
+
+    def calculateFactorValueRange(self, beginDateTime, endDateTime, rebalance='M', incremental=None):
+        """
+        #----------------------------------------------------------------------
+        # 区间回填，参数同HTradeFactorDemo.calculateFactorValueRange
+        # @return  Dict{factorSymbol: DataFrame ['dateTime','securityId','factorValue']}
+        """
+        if not isinstance(beginDateTime, datetime.datetime) or not isinstance(endDateTime, datetime.datetime):
+            raise BaseException("[FactorBatch] 'beginDateTime' and 'endDateTime' must be datetime.datetime")
+        if beginDateTime > endDateTime:
+            raise BaseException("[FactorBatch] 'beginDateTime' must not be later than 'endDateTime'")
+        if incremental is None:
+            incremental = rebalance == 'D'
+
+        result = collections.OrderedDict()
+        for group in self.groups:
+            # step1 交易日历只取一次，按组内最长的lagTradeDays向前取
+            lead = max(group, key=lambda factor: factor.offset1)
+            bars, days = lead._getRangeCalendar(beginDateTime, endDateTime)
+            stockCodes = {}
+            # step2 各因子的调仓窗口及需要的日度因子
+            windowsList = [factor._getRangeWindows(bars, days, beginDateTime, rebalance) for factor in group]
+            dateTimeLists = [factor._getRangeWindowDates(days, windows) if len(windows) > 0 else []
+                             for factor, windows in zip(group, windowsList)]
+            # step3 缺失的日度因子按天一起计算
+            self.prepareDailyFactors(group, dateTimeLists, stockCodes)
+            # step4 dailyFactor路径相同的因子（如H_RVdir3的不同parm）共用一次读出的日度因子
+            dailyWindows = self.readDailyFactors(group, dateTimeLists)
+            for factor, windows in zip(group, windowsList):
+                if len(windows) == 0:
+                    result[factor.getFactorSymbol()] = pd.DataFrame()
+                else:
+                    result[factor.getFactorSymbol()] = factor._calculateRangeOnWindows(
+                        days, windows, incremental, stockCodes, dailyWindows.get(self._getWriterKey(factor)))
+        return result
+
+    def readDailyFactors(self, group, dateTimeLists):
+        """
+        #----------------------------------------------------------------------
+        # dailyFactor路径和存储方式相同的因子，日度因子按各因子所需日期的并集只读取一次
+        # @return  Dict{writerKey: {日期: 当天的日度因子}}，只有一个因子使用的路径不在其中
+        """
+        readers = collections.OrderedDict()
+        for factor, dateTimeList in zip(group, dateTimeLists):
+            if len(dateTimeList) > 0:
+                readers.setdefault(self._getWriterKey(factor), []).append((factor, dateTimeList))
+        dailyWindows = {}
+        for key, members in readers.items():
+            if len(members) <= 1:
+                continue
+            dateTimeList = sorted(set().union(*[dateTimeList for _, dateTimeList in members]))
+            dailyWindow = members[0][0]._readDailyFactorWindow(dateTimeList)
+            if dailyWindow is not None:
+                dailyWindows[key] = dailyWindow
+        return dailyWindows
+
+    def calculateFactorValue(self, dateTime):
+        """
+        #----------------------------------------------------------------------
+        # 计算dateTime的全部因子值，结果与各因子的calculateFactorValue(dateTime)一致
+        # @return  Dict{factorSymbol: DataFrame ['securityId','factorValue']}
+        """
+        if not isinstance(dateTime, datetime.datetime):
+            raise BaseException("[FactorBatch] 'dateTime' must be datetime.datetime")
+        #与各因子的calculateFactorValue相同，dateTime不是交易日时取之前的最后一个交易日
+        lastDay = pd.Timestamp(self.factors[0]._getLastTradeDate(dateTime, 1, 86400)['dateTime'].iloc[-1])
+        tradeDay = datetime.datetime(lastDay.year, lastDay.month, lastDay.day)
+        values = self.calculateFactorValueRange(tradeDay, tradeDay, rebalance='D', incremental=False)
+        result = collections.OrderedDict()
+        for symbol, value in values.items():
+            if 'dateTime' in value.columns:
+                value = value.drop('dateTime', axis=1)
+            result[symbol] = value
+        return result
@@ -0,0 +1,329 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 高频因子流程的端到端基准测试。
+#
+# 在 SyntheticDataFeeds 的合成分钟数据上（不需要网络和数据库），按给定的股票数、频率和
+# lagTradeDays依次计时各阶段：
+#     getDailyData            逐日导入分钟数据
+#     getFactor               逐日计算日度因子（默认H_RVdir3）
+#     getDailyFactor.cold     getDailyFactors计算并保存整个窗口的日度因子（含预取）
+#     getDailyFactor.warm     再次getDailyFactors，全部从本地读取
+#     calculateFactorValueRange  按日调仓，在已保存的日度因子上计算因子值
+#     transformToId.<how>     每种how的汇总
+#     dbWrite / dbRead        updateFactorRangeToDB、getFactorValueFromDB，本地sqlite因子库
+# 每个阶段记录耗时、股票日数（stock-days）和吞吐（stock-days/s）、阶段中进程内存（RSS）
+# 的峰值及增量。结果为可以序列化为json的dict，compareResults 与上一个版本的结果比较，
+# 列出吞吐下降或内存上升超过容忍度的阶段。
+#
+# 命令行：
+#     python -m portmgr_Q.factor.benchmark --stocks 300 --frequency 60 --lagTradeDays 10 --days 10 \
+#            --output result.json --baseline last.json
+# 有baseline且存在退化时返回1。
+"""
+import os
+import sys
+import gc
+import json
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import threading
+import collections
+import timeit
+import numpy as np
+import pandas as pd
+try:
+    import psutil
+except ImportError:
+    psutil = None
+from portmgr_Q.factor import TradeFactorDemo
+from portmgr_Q.factor.synthfeed import SyntheticDataFeeds
+
+RESULT_VERSION = 1
+HOWS = ['mean', 'wmean', 'ewmean', 'median', 'std', 'cv', 'prod']
+
+
+def getRSS():
+    #进程当前的内存（字节），不能取得时为None
+    if psutil is not None:
+        return psutil.Process(os.getpid()).memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+class RSSSampler(object):
+    """
+    #--------------------------------------------------------------------------
+    # 后台线程每interval秒取一次RSS，记录峰值；不影响被测代码的内存分配和计时
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = None
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _sample(self):
+        rss = getRSS()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start = getRSS()
+        self.peak = self.start
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+        self.thread.join()
+        self._sample()
+
+
+class Benchmark(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # securityCount: 合成数据的股票数
+    # frequency:     分钟数据的频率（秒）
+    # lagTradeDays:  因子的窗口（交易日）
+    # days:          计时的交易日数（调仓日数）
+    # endDate:       最后一个交易日
+    # factorClass:   HTradeFactorDemo的子类，默认factorZoo.H_RVdir3
+    # factorParameters: factorClass的其他参数，如{'parm': 3}
+    # hows:          transformToId计时的汇总方式
+    # path:          工作目录，None时用临时目录并在结束后删除
+    #
+    # run()  运行全部阶段，返回结果dict
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, securityCount=300, frequency=60, lagTradeDays=10, days=10,
+                 endDate=datetime.datetime(2020, 6, 30), factorClass=None, factorParameters=None,
+                 hows=None, path=None, seed=0, prefetchDepth=2):
+        if factorClass is None:
+            from portmgr_Q.factor.factorZoo import H_RVdir3
+            factorClass = H_RVdir3
+            if factorParameters is None:
+                factorParameters = {'parm': 3}
+        self.securityCount = securityCount
+        self.frequency = frequency
+        self.lagTradeDays = lagTradeDays
+        self.days = days
+        self.endDate = endDate
+        self.factorClass = factorClass
+        self.factorParameters = dict(factorParameters or {})
+        self.hows = list(hows or HOWS)
+        self.path = path
+        self.seed = seed
+        self.prefetchDepth = prefetchDepth
+        self.stages = collections.OrderedDict()
+
+    def getConfig(self):
+        return collections.OrderedDict([
+            ('securityCount', self.securityCount), ('frequency', self.frequency),
+            ('lagTradeDays', self.lagTradeDays), ('days', self.days),
+            ('endDate', self.endDate.strftime('%Y-%m-%d')), ('factor', self.factorClass.__name__),
+            ('factorParameters', self.factorParameters), ('hows', self.hows),
+            ('seed', self.seed), ('prefetchDepth', self.prefetchDepth)])
+
+    def _record(self, name, seconds, stockDays, sampler, calls=1):
+        stage = collections.OrderedDict()
+        stage['seconds'] = seconds
+        stage['calls'] = calls
+        stage['stockDays'] = int(stockDays)
+        stage['stockDaysPerSecond'] = stockDays / seconds if seconds > 0 else None
+        stage['peakRSS'] = sampler.peak
+        stage['rssDelta'] = sampler.peak - sampler.start if sampler.peak is not None and sampler.start is not None else None
+        self.stages[name] = stage
+
+    def _time(self, name, function, stockDays=None):
+        #计时一次调用；stockDays为函数 stockDays(返回值)
+        gc.collect()
+        with RSSSampler() as sampler:
+            begin = timeit.default_timer()
+            result = function()
+            seconds = timeit.default_timer() - begin
+        self._record(name, seconds, stockDays(result) if stockDays is not None else 0, sampler)
+        return result
+
+    def _makeFactor(self, path, how='mean'):
+        parameters = dict(self.factorParameters)
+        parameters.update({'how': how, 'frequency': self.frequency, 'lagTradeDays': self.lagTradeDays, 'path': path})
+        factor = self.factorClass(**parameters)
+        factor.prefetchDepth = self.prefetchDepth
+        return factor
+
+    def _getTradeDates(self, factor, n):
+        #endDate及之前的n个交易日
+        bars = factor.getTradingCalendar().getLastBars(self.endDate.replace(hour = 15), n, 86400)
+        return [pd.Timestamp(dt).normalize().to_pydatetime() for dt in bars]
+
+    def _runDaily(self, factor, dates):
+        #逐日导入数据和计算日度因子，两个阶段分别计时
+        factor.stocklist = factor._getStockCode(dates[0], dates[-1])
+        loadSeconds = factorSeconds = 0.0
+        stockDays = 0
+        gc.collect()
+        with RSSSampler() as sampler:
+            for dt in dates:
+                begin = timeit.default_timer()
+                factor.getDailyData(dt)
+                middle = timeit.default_timer()
+                factor.getFactor()
+                end = timeit.default_timer()
+                loadSeconds += middle - begin
+                factorSeconds += end - middle
+                stockDays += factor.dailydata.index.get_level_values('securityId').nunique()
+        #两个阶段交替进行，内存峰值为两者共同的峰值
+        self._record('getDailyData', loadSeconds, stockDays, sampler, len(dates))
+        self._record('getFactor', factorSeconds, stockDays, sampler, len(dates))
+
+    def run(self):
+        workPath = self.path if self.path is not None else tempfile.mkdtemp(prefix='factorBenchmark')
+        feeds = SyntheticDataFeeds(self.securityCount, self.endDate - datetime.timedelta(days=365 + self.lagTradeDays * 3),
+                                   self.endDate + datetime.timedelta(days=30), self.seed)
+        factory = TradeFactorDemo._dataFeedsFactory
+        TradeFactorDemo.setDataFeedsFactory(lambda: feeds)
+        self.stages = collections.OrderedDict()
+        begin = timeit.default_timer()
+        try:
+            self._run(os.path.join(workPath, 'data'), workPath)
+        finally:
+            TradeFactorDemo.setDataFeedsFactory(factory)
+            if self.path is None:
+                shutil.rmtree(workPath, ignore_errors=True)
+        result = collections.OrderedDict()
+        result['version'] = RESULT_VERSION
+        result['createdAt'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        result['config'] = self.getConfig()
+        result['environment'] = collections.OrderedDict([
+            ('python', platform.python_version()), ('numpy', np.__version__), ('pandas', pd.__version__),
+            ('platform', platform.platform()), ('processor', platform.processor())])
+        result['seconds'] = timeit.default_timer() - begin
+        result['stages'] = self.stages
+        return result
+
+    def _run(self, path, workPath):
+        factor = self._makeFactor(path)
+        dates = self._getTradeDates(factor, self.days)
+        windowDates = self._getTradeDates(factor, self.days + self.lagTradeDays - 1)
+
+        # step1 逐日导入数据、计算日度因子（不保存）
+        self._runDaily(self._makeFactor(path), dates)
+
+        # step2 日度因子的计算和本地读取
+        factor.stocklist = factor._getStockCode(windowDates[0], windowDates[-1])
+        self._time('getDailyFactor.cold', lambda: factor.getDailyFactors(windowDates), len)
+        dailyfactor = self._time('getDailyFactor.warm', lambda: factor.getDailyFactors(windowDates), len)
+
+        # step3 区间计算因子值
+        values = self._time('calculateFactorValueRange',
+                            lambda: factor.calculateFactorValueRange(dates[0], dates[-1], 'D'),
+                            lambda data: data['factorValue'].notnull().sum())
+
+        # step4 每种how的汇总，使用最后一个窗口的日度因子
+        window = dailyfactor[dailyfactor['date'].isin(pd.DatetimeIndex(windowDates[-self.lagTradeDays:]).normalize())]
+        for how in self.hows:
+            factor.how = how
+            self._time('transformToId.' + how, lambda: factor.transformToId(window), lambda data: len(window))
+        factor.how = self.factorParameters.get('how', 'mean')
+
+        # step5 因子库的写入和读取，本地sqlite
+        factor.setFactorStoreDSN('sqlite:///' + os.path.join(workPath, 'factor.db'))
+        self._time('dbWrite', lambda: factor.updateFactorRangeToDB(values), lambda logs: len(values))
+        self._time('dbRead', lambda: factor.getFactorValueFromDB(dates), len)
+
+
+def compareResults(baseline, result, tolerance=0.2, minMemory=16 * 1048576):
+    """
+    #----------------------------------------------------------------------
+    # 与baseline比较，吞吐下降或内存增量上升超过tolerance的阶段视为退化
+    # 内存增量的变化小于minMemory（字节）时不计，RSS的采样有几十KB的波动
+    # @return  List[OrderedDict]，每个退化一项：stage、metric、baseline、current、change
+    """
+    regressions = []
+    for name, stage in result['stages'].items():
+        old = baseline.get('stages', {}).get(name)
+        if old is None:
+            continue
+        for metric, worse in [('stockDaysPerSecond', -1), ('rssDelta', 1)]:
+            before, after = old.get(metric), stage.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / float(before)
+            if metric == 'rssDelta' and abs(after - before) < minMemory:
+                continue
+            if change * worse > tolerance:
+                regressions.append(collections.OrderedDict([('stage', name), ('metric', metric),
+                                                            ('baseline', before), ('current', after),
+                                                            ('change', change)]))
+    return regressions
+
+
+def formatResult(result):
+    lines = ['%-28s %10s %12s %16s %12s' % ('stage', 'seconds', 'stock-days', 'stock-days/s', 'peakRSS(MB)')]
+    for name, stage in result['stages'].items():
+        sps = stage['stockDaysPerSecond']
+        peak = stage['peakRSS']
+        lines.append('%-28s %10.3f %12d %16s %12s' % (name, stage['seconds'], stage['stockDays'],
+                                                      '%.1f' % sps if sps is not None else '-',
+                                                      '%.1f' % (peak / 1048576.0) if peak is not None else '-'))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the high-frequency factor pipeline.')
+    parser.add_argument('--stocks', type=int, default=300)
+    parser.add_argument('--frequency', type=int, default=60)
+    parser.add_argument('--lagTradeDays', type=int, default=10)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--end', default='2020-06-30')
+    parser.add_argument('--hows', default=','.join(HOWS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--prefetchDepth', type=int, default=2)
+    parser.add_argument('--path', default=None)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(securityCount=args.stocks, frequency=args.frequency, lagTradeDays=args.lagTradeDays,
+                          days=args.days, endDate=datetime.datetime.strptime(args.end, '%Y-%m-%d'),
+                          hows=args.hows.split(','), path=args.path, seed=args.seed, prefetchDepth=args.prefetchDepth)
+    result = benchmark.run()
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    print(formatResult(result))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f, object_pairs_hook=collections.OrderedDict)
+        regressions = compareResults(baseline, result, args.tolerance)
+        for r in regressions:
+            print('REGRESSION %(stage)s %(metric)s: %(baseline)s -> %(current)s (%(change)+.1f%%)' %
+                  dict(r, change=r['change'] * 100))
+        return 1 if len(regressions) > 0 else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
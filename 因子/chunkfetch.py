@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 分块并发地从数据源取行情、指标数据。
+#
+# 本地没有日度数据时，_getStockData、_getStockVars 对整个股票列表和整个窗口只发一次请求，
+# 请求很大时慢、内存峰值高，中途失败只能从头再来。ChunkedFetcher 把请求按股票和日期分块：
+#     1) 股票每securityChunk只一块，日期（交易日）每dateChunk天一块；
+#     2) 各块在最多maxWorkers个线程中并发请求（访问数据源是I/O，线程即可），load需可在多个线程中
+#        同时调用（TradeFactorDemo的工作线程从FeedPool借用数据源，用完归还）；
+#     3) 某块失败时等待后重试，最多retries次，仍失败才抛出异常；
+#     4) 给出sink时，每块取到后立即在调用线程中交给sink(data)（如写入RingPanel），不再拼接；
+#        否则拼接为一个长表，按 dateTime、请求中securityId的顺序 排列，与一次请求的结果一致。
+# 只有一块时直接请求，与原来完全相同。
+#
+# FeedPool 是工作线程共用的数据源池：最多建立size个，归还后给之后的请求（包括之后的fetch）重用，
+# 不会每次fetch、每个工作线程都新建一个数据源（连接）。
+"""
+import time
+import threading
+import contextlib
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import pandas as pd
+
+
+def splitList(values, size):
+    #按size分块，size为None或0时不分块
+    values = list(values)
+    if not size or len(values) <= size:
+        return [values]
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+class ChunkedFetcher(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # securityChunk: 每块的股票数，None为不按股票分块
+    # dateChunk:     每块的交易日数，None为不按日期分块
+    # maxWorkers:    同时请求的块数，1为逐块请求
+    # retries:       每块失败后的重试次数
+    # retryWait:     第k次重试前等待 retryWait*k 秒
+    #
+    # fetch(load, securityIds, dates, sink=None)
+    #     load(securityIds, dates) 请求一块，返回长表 DataFrame ['dateTime','securityId', 指标...]；
+    #     dates为按时间排序的交易日列表
+    # getMetrics()  块数、重试次数、失败次数
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, securityChunk=500, dateChunk=20, maxWorkers=4, retries=2, retryWait=1.0):
+        if maxWorkers < 1:
+            raise BaseException("[ChunkedFetcher] maxWorkers must be at least 1.")
+        self.securityChunk = securityChunk
+        self.dateChunk = dateChunk
+        self.maxWorkers = maxWorkers
+        self.retries = retries
+        self.retryWait = retryWait
+        self.lock = threading.Lock()
+        self.metrics = {'requests': 0, 'chunks': 0, 'retries': 0, 'failures': 0}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.metrics[name] += n
+
+    def getMetrics(self):
+        with self.lock:
+            return dict(self.metrics)
+
+    def split(self, securityIds, dates):
+        #[(股票块, 日期块)]，日期在外层，股票在内层
+        return [(ids, ds) for ds in splitList(dates, self.dateChunk)
+                for ids in splitList(securityIds, self.securityChunk)]
+
+    def _load(self, load, task):
+        ids, dates = task
+        attempt = 0
+        while True:
+            try:
+                return load(ids, dates)
+            except Exception:
+                if attempt >= self.retries:
+                    self._count('failures')
+                    raise
+                attempt += 1
+                self._count('retries')
+                time.sleep(self.retryWait * attempt)
+
+    def fetch(self, load, securityIds, dates, sink=None):
+        """
+        #----------------------------------------------------------------------
+        # @param sink: type: 函数 sink(data)，每块取到后调用；None时返回拼接后的长表
+        # @return  DataFrame，给出sink时为None
+        """
+        securityIds = list(securityIds)
+        dates = list(dates)
+        tasks = self.split(securityIds, dates)
+        self._count('requests')
+        self._count('chunks', len(tasks))
+        if len(tasks) == 1:
+            data = self._load(load, tasks[0])
+            if sink is not None:
+                sink(data)
+                return None
+            return data
+
+        frames = [None] * len(tasks)
+        pool = ThreadPool(min(self.maxWorkers, len(tasks)))
+        try:
+            results = pool.imap_unordered(lambda i: (i, self._load(load, tasks[i])), range(len(tasks)))
+            for i, data in results:
+                if sink is not None:
+                    sink(data)
+                else:
+                    frames[i] = data
+        finally:
+            pool.terminate()
+            pool.join()
+        if sink is not None:
+            return None
+        return self.combine(frames, securityIds)
+
+    def combine(self, frames, securityIds):
+        #拼接各块，按 dateTime、请求中securityId的顺序 排列
+        nonEmpty = [frame for frame in frames if len(frame) > 0]
+        if len(nonEmpty) == 0:
+            return frames[0]
+        data = pd.concat(nonEmpty, ignore_index=True) if len(nonEmpty) > 1 else nonEmpty[0]
+        rank = pd.Series(np.arange(len(securityIds)), index=pd.Index(securityIds)).groupby(level=0).first()
+        order = np.lexsort((rank.reindex(data['securityId'].values).values, pd.DatetimeIndex(data['dateTime']).values))
+        return data.iloc[order].reset_index(drop=True)
+
+
+class FeedPool(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # factory: factory() 建立一个数据源（如DataFeeds），在第一次借用且没有空闲的数据源时调用
+    # size:    最多建立的数据源个数，都已借出时borrow等待归还
+    #
+    # borrow() / giveBack(feeds)  借用、归还一个数据源；也可以用 with pool.use() as feeds:
+    # resize(size)  改变上限（如换了并发数不同的ChunkedFetcher）
+    # close()       关闭并丢弃空闲的数据源（有close方法的调用close），借出的在归还时关闭
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, factory, size):
+        if size < 1:
+            raise BaseException("[FeedPool] size must be at least 1.")
+        self.factory = factory
+        self.size = size
+        self.idle = []
+        self.created = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def borrow(self):
+        with self.condition:
+            while len(self.idle) == 0 and self.created >= self.size:
+                self.condition.wait()
+            if len(self.idle) > 0:
+                return self.idle.pop()
+            self.created += 1
+        try:
+            return self.factory()
+        except Exception:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+
+    def giveBack(self, feeds):
+        with self.condition:
+            if not self.closed and self.created <= self.size:
+                self.idle.append(feeds)
+                self.condition.notify()
+                return
+            self.created -= 1
+            self.condition.notify()
+        self._closeFeeds(feeds)
+
+    @contextlib.contextmanager
+    def use(self):
+        feeds = self.borrow()
+        try:
+            yield feeds
+        finally:
+            self.giveBack(feeds)
+
+    def resize(self, size):
+        if size < 1:
+            raise BaseException("[FeedPool] size must be at least 1.")
+        with self.condition:
+            self.size = size
+            #多出的空闲数据源关闭，借出的在归还时关闭
+            surplus = []
+            while len(self.idle) > 0 and self.created > self.size:
+                surplus.append(self.idle.pop())
+                self.created -= 1
+            self.condition.notify_all()
+        for feeds in surplus:
+            self._closeFeeds(feeds)
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.created -= len(idle)
+            self.condition.notify_all()
+        for feeds in idle:
+            self._closeFeeds(feeds)
+
+    def _closeFeeds(self, feeds):
+        close = getattr(feeds, 'close', None)
+        if close is not None:
+            close()
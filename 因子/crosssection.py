@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 截面处理（缺失值、去极值、标准化）的向量化引擎。
+#
+# getStandardizedFactorValue 每个日期把因子值转成dict，依次交给missingvalue、
+# outliers、standardization处理。回测需要多年的标准化因子矩阵时，这里在
+# 日期×股票 的二维数组上一次完成全部日期的处理，每一行是一个截面：
+#     1) fillMissing:     缺失值保留（'delete'，结果中仍为nan）或按截面均值、中位数、0填充；
+#     2) winsorizeSigma:  均值±n倍标准差之外的值缩到边界；winsorizeMAD: 中位数±n倍MAD（已乘1.4826）；
+#     3) zScore:          减去截面均值再除以截面标准差，标准差为0或有效值少于2个的截面为nan。
+# 统计量都只用非缺失值，缺失值在结果中仍为nan。
+"""
+import numpy as np
+import pandas as pd
+
+MAD_SCALE = 1.4826
+
+
+def rowMeanStd(values, ddof=0):
+    """
+    #----------------------------------------------------------------------
+    # 二维数组按行求均值与标准差，跳过缺失值
+    # @return  (means, stds, counts)，有效值个数不大于ddof的行标准差为nan
+    """
+    valid = ~np.isnan(values)
+    counts = valid.sum(axis=1).astype(np.float64)
+    filled = np.where(valid, values, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = filled.sum(axis=1) / counts
+        dev = np.where(valid, values - means[:, None], 0.0)
+        stds = np.sqrt((dev * dev).sum(axis=1) / (counts - ddof))
+    stds[counts <= ddof] = np.nan
+    return means, stds, counts
+
+
+def rowMedian(values):
+    #按行求中位数，跳过缺失值，全缺失的行为nan
+    result = np.full(values.shape[0], np.nan)
+    rows = (~np.isnan(values)).any(axis=1)
+    if rows.any():
+        result[rows] = np.nanmedian(values[rows], axis=1)
+    return result
+
+
+def fillMissing(values, method='delete'):
+    """
+    #----------------------------------------------------------------------
+    # @param method: 'delete'（保留为nan，不参与后续统计）、'mean'、'median'、'zero'
+    """
+    if method == 'delete':
+        return values
+    if method == 'mean':
+        fill = rowMeanStd(values)[0]
+    elif method == 'median':
+        fill = rowMedian(values)
+    elif method == 'zero':
+        fill = np.zeros(values.shape[0])
+    else:
+        raise BaseException("[crosssection] Not support missing value method: %s" % method)
+    return np.where(np.isnan(values), fill[:, None], values)
+
+
+def _clipRows(values, lower, upper):
+    #按行缩到[lower, upper]，边界为nan（有效值太少）的行不处理
+    lower = np.where(np.isnan(lower), -np.inf, lower)
+    upper = np.where(np.isnan(upper), np.inf, upper)
+    return np.clip(values, lower[:, None], upper[:, None])
+
+
+def winsorizeSigma(values, n=3, ddof=0):
+    #均值±n倍标准差去极值
+    means, stds, _ = rowMeanStd(values, ddof)
+    return _clipRows(values, means - n * stds, means + n * stds)
+
+
+def winsorizeMAD(values, n=3):
+    #中位数±n倍MAD去极值
+    medians = rowMedian(values)
+    mads = rowMedian(np.abs(values - medians[:, None])) * MAD_SCALE
+    return _clipRows(values, medians - n * mads, medians + n * mads)
+
+
+def zScore(values, ddof=0):
+    means, stds, _ = rowMeanStd(values, ddof)
+    stds[stds == 0] = np.nan
+    return (values - means[:, None]) / stds[:, None]
+
+
+class CrossSectionPipeline(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # missing:     缺失值的处理，见fillMissing
+    # outliers:    'sigma'、'mad' 或 None（不去极值）
+    # n:           去极值的倍数
+    # standardize: 'zscore' 或 None（不标准化）
+    # ddof:        标准差的自由度
+    #
+    # process(values, direction)       二维数组（日期×股票）-> 二维数组
+    # processFrame(panel, direction)   DataFrame（索引为日期，列为股票）-> DataFrame
+    # 结果乘以direction（因子方向）。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, missing='delete', outliers='sigma', n=3, standardize='zscore', ddof=0):
+        if outliers not in ['sigma', 'mad', None]:
+            raise BaseException("[CrossSectionPipeline] Not support outliers method: %s" % outliers)
+        if standardize not in ['zscore', None]:
+            raise BaseException("[CrossSectionPipeline] Not support standardize method: %s" % standardize)
+        self.missing = missing
+        self.outliers = outliers
+        self.n = n
+        self.standardize = standardize
+        self.ddof = ddof
+
+    def process(self, values, direction=1):
+        values = np.array(values, dtype=np.float64, ndmin=2)
+        values = fillMissing(values, self.missing)
+        if self.outliers == 'sigma':
+            values = winsorizeSigma(values, self.n, self.ddof)
+        elif self.outliers == 'mad':
+            values = winsorizeMAD(values, self.n)
+        if self.standardize == 'zscore':
+            values = zScore(values, self.ddof)
+        return values * direction
+
+    def processFrame(self, panel, direction=1):
+        return pd.DataFrame(self.process(panel.values, direction), index=panel.index, columns=panel.columns)
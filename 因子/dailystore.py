@@ -0,0 +1,383 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 日度因子的本地存储。
+#
+# HTradeFactorDemo 通过 dailyFactorStore 读写日度因子（Series 或 DataFrame，
+# 索引一般为 'securityId', 'date'），可选两种后端：
+# 1) PickleDailyFactorStore: 原有方式，每天一个 pickle 文件 path\YYYY-MM-DD.pkl；
+# 2) ColumnarDailyFactorStore: 按年/月分区的列式存储 path/YYYY/MM/，
+#    每列一个 .npy 文件，读取时内存映射，可按日期区间一次取出；
+#    原有的 pickle 文件作为只读的旧数据来源。
+#
+# 列式存储的写入：每天先写成分区内的增量目录（_delta_YYYYMMDD），
+# 由 flush() 合并进分区主文件（只合并本实例写入过的分区和指定日期的分区）。
+# 增量目录先写临时目录再改名，
+# 因此多个进程同时计算同一个月的不同日期时不会相互覆盖。
+# .npy 和 .json 与 Python 版本无关，可在不同环境间共享。
+"""
+import os
+import json
+import shutil
+import datetime
+import collections
+import numpy as np
+import pandas as pd
+
+DAY_COLUMN = '__day__'
+DELTA_PREFIX = '_delta_'
+
+
+class BaseDailyFactorStore(object):
+    """
+    #--------------------------------------------------------------------------
+    # 日度因子存储的基类，子类实现 exists/read/write。
+    #--------------------------------------------------------------------------
+    """
+    def exists(self, dateTime):
+        raise NotImplementedError
+
+    def read(self, dateTime):
+        raise NotImplementedError
+
+    def write(self, dateTime, dailyfactor):
+        raise NotImplementedError
+
+    def readRange(self, beginDateTime, endDateTime, dateTimeList=None):
+        #默认逐日读取再拼接，子类可以改为一次读取
+        if dateTimeList is None:
+            raise BaseException("[BaseDailyFactorStore] 'dateTimeList' is needed to read a range from %s" % self.__class__.__name__)
+        frames = [self.read(dt) for dt in dateTimeList if beginDateTime <= dt <= endDateTime and self.exists(dt)]
+        if len(frames) == 0:
+            return None
+        return pd.concat(frames)
+
+    def flush(self, dateTimeList=None):
+        #把尚未合并的写入整理好，默认无需处理
+        #dateTimeList: 其他进程或实例写入的日期，一并整理
+        pass
+
+    def refresh(self, dateTimeList=None):
+        #其他进程或实例写入了新的日度因子时，清空已缓存的内容，默认无需处理
+        #dateTimeList: 只清空这些日期相关的内容，None为全部
+        pass
+
+
+class PickleDailyFactorStore(BaseDailyFactorStore):
+    #每天一个pickle文件：path\YYYY-MM-DD.pkl
+    def __init__(self, path):
+        self.path = path
+
+    def getFile(self, dateTime):
+        return self.path + '\\' + dateTime.strftime('%Y-%m-%d') + '.pkl'
+
+    def exists(self, dateTime):
+        return os.path.exists(self.getFile(dateTime))
+
+    def read(self, dateTime):
+        return pd.read_pickle(self.getFile(dateTime))
+
+    def write(self, dateTime, dailyfactor):
+        #先写临时文件再改名，中断或多进程同时写入时不会留下不完整的日度因子文件
+        file0 = self.getFile(dateTime)
+        tmpfile = file0 + '.%d.tmp' % os.getpid()
+        dailyfactor.to_pickle(tmpfile)
+        if os.path.exists(file0):
+            os.remove(tmpfile)
+            return
+        try:
+            os.rename(tmpfile, file0)
+        except OSError:
+            #检查后其他进程写入了同一天（Windows下目标存在时改名失败）
+            os.remove(tmpfile)
+            if not os.path.exists(file0):
+                raise
+
+
+def _toDay(dateTime):
+    return np.datetime64(pd.Timestamp(dateTime).strftime('%Y-%m-%d'), 'D')
+
+
+def _encodeLevel(values):
+    #索引的一层：日期类转为datetime64[D]，其余转为定长字符串
+    #'date'读出为DatetimeIndex，'pydate'（datetime.date）读出为datetime.date，与写入时一致
+    values = pd.Index(values)
+    if isinstance(values, pd.DatetimeIndex) or (len(values) > 0 and isinstance(values[0], datetime.datetime)):
+        return 'date', pd.to_datetime(values).values.astype('datetime64[D]')
+    if len(values) > 0 and isinstance(values[0], datetime.date):
+        return 'pydate', pd.to_datetime(values).values.astype('datetime64[D]')
+    return 'str', np.array([u'%s' % v for v in values], dtype='U')
+
+
+def _decodeLevel(kind, values):
+    if kind == 'date':
+        return pd.DatetimeIndex(np.asarray(values).astype('datetime64[ns]'))
+    if kind == 'pydate':
+        return pd.Index(np.asarray(values).astype('datetime64[D]').astype(object), dtype=object)
+    return pd.Index(np.asarray(values).astype(object))
+
+
+class ColumnarDailyFactorStore(BaseDailyFactorStore):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # 按年/月分区的列式日度因子存储：
+    #     path/YYYY/MM/main/meta.json           列名、索引名等结构信息
+    #     path/YYYY/MM/main/__day__.npy         每行所属的交易日（datetime64[D]，已排序）
+    #     path/YYYY/MM/main/i0.npy, i1.npy ...  索引的各层
+    #     path/YYYY/MM/main/c0.npy, c1.npy ...  因子值的各列（float64）
+    #     path/YYYY/MM/_delta_YYYYMMDD/         尚未合并的单日写入，结构同main
+    # 读取时对分区文件做内存映射，并缓存最近使用的cacheSize个分区。
+    # legacy: 列式存储中没有的日期，从这个存储（一般为PickleDailyFactorStore）读取。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, path, legacy=None, cacheSize=4):
+        self.path = path
+        self.legacy = legacy
+        self.cacheSize = cacheSize
+        self.__partitions = collections.OrderedDict()
+        self.__days = {}
+        self.__dirty = set()
+        self.__written = set()
+
+    def __getstate__(self):
+        #传给其他进程时不带已读取的分区
+        state = self.__dict__.copy()
+        state['_ColumnarDailyFactorStore__partitions'] = collections.OrderedDict()
+        state['_ColumnarDailyFactorStore__days'] = {}
+        state['_ColumnarDailyFactorStore__dirty'] = set()
+        state['_ColumnarDailyFactorStore__written'] = set()
+        return state
+
+    def refresh(self, dateTimeList=None):
+        #其他进程可能写入了新的日度因子，清空已读取的分区；给出dateTimeList时只清空这些日期所在的分区
+        if dateTimeList is None:
+            self.__partitions.clear()
+            self.__days.clear()
+            self.__dirty.clear()
+            return
+        for partition in set(self._getPartitionPath(dt) for dt in dateTimeList):
+            self.__partitions.pop(partition, None)
+            self.__days.pop(partition, None)
+            self.__dirty.discard(partition)
+
+    #----------------------------------------------------------------------
+    # 分区与单个数据块（主文件或增量目录）的读写
+    def _getPartitionPath(self, dateTime):
+        return os.path.join(self.path, dateTime.strftime('%Y'), dateTime.strftime('%m'))
+
+    def _writeChunk(self, chunkPath, days, dailyfactor):
+        if isinstance(dailyfactor, pd.Series):
+            kind, name, values = 'series', dailyfactor.name, dailyfactor.to_frame()
+        else:
+            kind, name, values = 'frame', None, dailyfactor
+        index = values.index
+        meta = {'kind': kind, 'name': name, 'columns': list(values.columns),
+                'index': list(index.names), 'indexKinds': []}
+        os.makedirs(chunkPath)
+        np.save(os.path.join(chunkPath, DAY_COLUMN + '.npy'), days)
+        for i in range(index.nlevels):
+            levelKind, level = _encodeLevel(index.get_level_values(i))
+            meta['indexKinds'].append(levelKind)
+            np.save(os.path.join(chunkPath, 'i%d.npy' % i), level)
+        for i, column in enumerate(values.columns):
+            np.save(os.path.join(chunkPath, 'c%d.npy' % i), values[column].values.astype(np.float64))
+        with open(os.path.join(chunkPath, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def _readChunk(self, chunkPath, mmap=True):
+        #mmap为False时读入内存，文件随后可以改名或删除（Windows下被映射的文件不能改名）
+        mode = 'r' if mmap else None
+        with open(os.path.join(chunkPath, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {DAY_COLUMN: np.load(os.path.join(chunkPath, DAY_COLUMN + '.npy'), mmap_mode=mode)}
+        for i in range(len(meta['index'])):
+            arrays['i%d' % i] = np.load(os.path.join(chunkPath, 'i%d.npy' % i), mmap_mode=mode)
+        for i in range(len(meta['columns'])):
+            arrays['c%d' % i] = np.load(os.path.join(chunkPath, 'c%d.npy' % i), mmap_mode=mode)
+        return meta, arrays
+
+    def _getMainPath(self, partition):
+        #合并时中断可能只留下main.old
+        for name in ['main', 'main.old']:
+            if os.path.exists(os.path.join(partition, name, 'meta.json')):
+                return os.path.join(partition, name)
+        return None
+
+    def _getDeltaDay(self, name):
+        return datetime.datetime.strptime(name[len(DELTA_PREFIX):], '%Y%m%d').date()
+
+    def _listDeltas(self, partition):
+        if not os.path.exists(partition):
+            return []
+        return sorted(name for name in os.listdir(partition)
+                      if name.startswith(DELTA_PREFIX) and not name.endswith('.tmp'))
+
+    def _loadPartition(self, partition, mmap=True):
+        #读取分区：主文件（内存映射）加上尚未合并的增量，按交易日排序
+        #mmap为False时不使用也不更新缓存，用于合并
+        if mmap and partition in self.__partitions and partition not in self.__dirty:
+            self.__partitions[partition] = self.__partitions.pop(partition)
+            return self.__partitions[partition]
+        chunks = []
+        mainDays = set()
+        mainPath = self._getMainPath(partition)
+        if mainPath is not None:
+            chunks.append(self._readChunk(mainPath, mmap))
+            mainDays = set(np.unique(chunks[0][1][DAY_COLUMN]).tolist())
+        for name in self._listDeltas(partition):
+            #合并时中断可能留下已并入主文件的增量，跳过
+            if self._getDeltaDay(name) not in mainDays:
+                chunks.append(self._readChunk(os.path.join(partition, name), mmap))
+        if len(chunks) == 0:
+            loaded = None
+        elif len(chunks) == 1:
+            loaded = chunks[0]
+        else:
+            meta = chunks[0][0]
+            for other, _ in chunks[1:]:
+                if other['columns'] != meta['columns'] or other['index'] != meta['index']:
+                    raise BaseException("[ColumnarDailyFactorStore] Daily factors in %s have different structures." % partition)
+            arrays = dict((key, np.concatenate([c[1][key] for c in chunks])) for key in chunks[0][1])
+            order = np.argsort(arrays[DAY_COLUMN], kind='mergesort')
+            loaded = (meta, dict((key, value[order]) for key, value in arrays.items()))
+        if not mmap:
+            return loaded
+        self.__partitions[partition] = loaded
+        self.__dirty.discard(partition)
+        while len(self.__partitions) > self.cacheSize:
+            self.__partitions.popitem(last=False)
+        return loaded
+
+    def _getPartitionDays(self, partition):
+        if partition not in self.__days:
+            loaded = self._loadPartition(partition)
+            days = set() if loaded is None else set(np.unique(loaded[1][DAY_COLUMN]).tolist())
+            self.__days[partition] = days
+        return self.__days[partition]
+
+    def _decode(self, meta, arrays, lo, hi):
+        levels = [_decodeLevel(kind, arrays['i%d' % i][lo:hi]) for i, kind in enumerate(meta['indexKinds'])]
+        if len(levels) == 1:
+            index = levels[0].rename(meta['index'][0])
+        else:
+            index = pd.MultiIndex.from_arrays(levels, names=meta['index'])
+        if meta['kind'] == 'series':
+            return pd.Series(np.array(arrays['c0'][lo:hi]), index=index, name=meta['name'])
+        data = collections.OrderedDict((column, np.array(arrays['c%d' % i][lo:hi]))
+                                       for i, column in enumerate(meta['columns']))
+        return pd.DataFrame(data, index=index, columns=meta['columns'])
+
+    #----------------------------------------------------------------------
+    # 对外接口
+    def exists(self, dateTime):
+        if _toDay(dateTime).astype(datetime.date) in self._getPartitionDays(self._getPartitionPath(dateTime)):
+            return True
+        return self.legacy is not None and self.legacy.exists(dateTime)
+
+    def read(self, dateTime):
+        partition = self._getPartitionPath(dateTime)
+        day = _toDay(dateTime)
+        if day.astype(datetime.date) in self._getPartitionDays(partition):
+            meta, arrays = self._loadPartition(partition)
+            lo = arrays[DAY_COLUMN].searchsorted(day, side='left')
+            hi = arrays[DAY_COLUMN].searchsorted(day, side='right')
+            return self._decode(meta, arrays, lo, hi)
+        if self.legacy is not None and self.legacy.exists(dateTime):
+            return self.legacy.read(dateTime)
+        raise BaseException("[ColumnarDailyFactorStore] No daily factor of %s." % dateTime)
+
+    def readRange(self, beginDateTime, endDateTime, dateTimeList=None):
+        """
+        #----------------------------------------------------------------------
+        # 一次取出[beginDateTime, endDateTime]内的全部日度因子，按分区读取后拼接
+        # dateTimeList: 不为None时，其中列式存储没有的日期从legacy读取
+        """
+        begin, end = _toDay(beginDateTime), _toDay(endDateTime)
+        frames = []
+        month = datetime.datetime(pd.Timestamp(beginDateTime).year, pd.Timestamp(beginDateTime).month, 1)
+        while month <= endDateTime:
+            loaded = self._loadPartition(self._getPartitionPath(month))
+            if loaded is not None:
+                meta, arrays = loaded
+                lo = arrays[DAY_COLUMN].searchsorted(begin, side='left')
+                hi = arrays[DAY_COLUMN].searchsorted(end, side='right')
+                if hi > lo:
+                    frames.append(self._decode(meta, arrays, lo, hi))
+            month = (month + datetime.timedelta(days=32)).replace(day=1)
+        if dateTimeList is not None and self.legacy is not None:
+            for dt in dateTimeList:
+                if beginDateTime <= dt <= endDateTime and self.legacy.exists(dt) and \
+                        _toDay(dt).astype(datetime.date) not in self._getPartitionDays(self._getPartitionPath(dt)):
+                    frames.append(self.legacy.read(dt))
+        if len(frames) == 0:
+            return None
+        return pd.concat(frames)
+
+    def write(self, dateTime, dailyfactor):
+        partition = self._getPartitionPath(dateTime)
+        chunkPath = os.path.join(partition, DELTA_PREFIX + dateTime.strftime('%Y%m%d'))
+        if os.path.exists(chunkPath):
+            return
+        if not os.path.exists(partition):
+            try:
+                os.makedirs(partition)
+            except OSError:
+                if not os.path.isdir(partition):
+                    raise
+        tmpPath = chunkPath + '.%d.tmp' % os.getpid()
+        days = np.repeat(_toDay(dateTime), len(dailyfactor))
+        self._writeChunk(tmpPath, days, dailyfactor)
+        try:
+            os.rename(tmpPath, chunkPath)
+        except OSError:
+            #其他进程已写入同一天
+            shutil.rmtree(tmpPath, ignore_errors=True)
+        self.__dirty.add(partition)
+        self.__written.add(partition)
+        if partition in self.__days:
+            self.__days[partition].add(_toDay(dateTime).astype(datetime.date))
+
+    def flush(self, dateTimeList=None):
+        #把本实例写入过的分区（及dateTimeList所在的分区）的增量目录合并进分区主文件
+        #只重新读取合并过的分区，其他分区的缓存保留
+        partitions = set(self.__written)
+        if dateTimeList is not None:
+            partitions.update(self._getPartitionPath(dt) for dt in dateTimeList)
+        for partition in sorted(partitions):
+            if len(self._listDeltas(partition)) > 0:
+                self._compact(partition)
+            elif partition not in self.__written:
+                #其他进程写入且已合并
+                self.__days.pop(partition, None)
+                self.__dirty.add(partition)
+        self.__written.clear()
+
+    def _compact(self, partition):
+        #先写新的主文件，再替换旧的主文件，最后删除已合并的增量
+        #合并前释放该分区的内存映射，合并时读入内存，否则Windows下不能改名
+        deltas = self._listDeltas(partition)
+        self.__partitions.pop(partition, None)
+        self.__days.pop(partition, None)
+        self.__dirty.add(partition)
+        meta, arrays = self._loadPartition(partition, mmap=False)
+        data = self._decode(meta, arrays, 0, len(arrays[DAY_COLUMN]))
+        days = arrays[DAY_COLUMN]
+        meta = arrays = None
+        mainPath = os.path.join(partition, 'main')
+        oldPath = os.path.join(partition, 'main.old')
+        tmpPath = os.path.join(partition, 'main.%d.tmp' % os.getpid())
+        self._writeChunk(tmpPath, days, data)
+        if os.path.exists(mainPath):
+            if os.path.exists(oldPath):
+                shutil.rmtree(oldPath)
+            os.rename(mainPath, oldPath)
+        os.rename(tmpPath, mainPath)
+        shutil.rmtree(oldPath, ignore_errors=True)
+        for name in deltas:
+            shutil.rmtree(os.path.join(partition, name), ignore_errors=True)
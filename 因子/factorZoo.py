@@ -7,23 +7,22 @@ import pickle
 import datetime
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
 from scipy.stats import kurtosis
 from scipy.stats import norm
 from portmgr_Q.factor import HTradeFactorDemo
+from portmgr_Q.factor.bvc import bvcProbability, bulkVolumeClassifyPanel
 
 
 path='D:\\Data'
 
 
    
-cdfdir={}     
 class H_RVdir3(HTradeFactorDemo):	 
     #成交量交易方向判定：批量方向判别法-将一段区间内的成交量按照一定比例（标准化）分配给买入和卖出
     #参数取值：1（买入成交量和与总成交量和的比值）2（买入卖出成交量和之差的绝对值与总成交量和的比值,即知情交易概率）
     #         3 (买入成交量波动率与买入卖出成交量波动率和的比值)4(买入卖出成交量波动率差与买入卖出成交量波动率和的比值)
     def __init__(self,parm=1,standard=False,how='mean',frequency=60,lagTradeDays=20,path=path, validTradingDayRatio=0.7,
-                 items=['close', 'preClose','volume'], factorSymbol=None,dailyFactorSymbol=None):
+                 items=['close', 'preClose','volume'], factorSymbol=None,dailyFactorSymbol=None,n_jobs=1):
         if factorSymbol is None:
             factorSymbol = self.__class__.__name__+'_'+str(parm)
         if dailyFactorSymbol is None:
@@ -33,31 +32,31 @@ class H_RVdir3(HTradeFactorDemo):
                                  frequency=frequency,
                                  validTradingDayRatio=validTradingDayRatio,
                                  items=items,
-                                 factorSymbol=factorSymbol,dailyFactorSymbol=dailyFactorSymbol) 
+                                 factorSymbol=factorSymbol,dailyFactorSymbol=dailyFactorSymbol,
+                                 n_jobs=n_jobs) 
         self.parm=parm
     
     def _getcdf(self,x):
-        if x>4:
-            return 1
-        if x<-4:
-            return 0
-        x = round(x, 2)
-        if x not in cdfdir.keys():
-            cdfdir[x]=norm.cdf(x)
-        return cdfdir[x]
+        return float(bvcProbability(x))
             
     def getFactor(self):
-        data=self.dailydata.reset_index()
-        data['date']=data['dateTime'].apply(lambda x:x.date())
-        data['ret']=data['close']/data['preClose']-1
-        mean,std=data['ret'].mean(),data['ret'].std()
-        data['ret_standard']=(data['ret']-mean)/std
-        data['upvol']=data['ret_standard'].apply(self._getcdf)*data['volume']
-        data['downvol']=data['volume']-data['upvol']
-        buy_sum=data.groupby(['securityId','date'])['upvol'].sum()
-        sale_sum=data.groupby(['securityId','date'])['downvol'].sum()
-        buy_std=data.groupby(['securityId','date'])['upvol'].std()
-        sale_std=data.groupby(['securityId','date'])['downvol'].std()
+        #在 股票×分钟 的面板上计算，按股票、按日汇总只需沿行归约
+        #面板为float32；BVC对标准化收益率保留两位小数，收益率及其标准化在float64上计算，
+        #只有价格本身的float32舍入会使恰在两位小数边界上的收益率落到相邻的一档
+        panel=self.getDailyPanel()
+        ret=panel.get('close').astype(np.float64)/panel.get('preClose')-1
+        with np.errstate(invalid='ignore'):
+            mean,std=np.nanmean(ret),np.nanstd(ret,ddof=1)
+        ret_standard=(ret-mean)/std
+        bvc=[]
+        for date,cols in panel.getDateSlices():
+            daily=bulkVolumeClassifyPanel(ret_standard[:,cols],panel.get('volume')[:,cols])
+            daily.index=pd.MultiIndex.from_arrays([panel.securityIds,[date]*len(panel.securityIds)],
+                                                  names=['securityId','date'])
+            bvc.append(daily[panel.mask[:,cols].any(axis=1)])
+        bvc=pd.concat(bvc).sort_index()
+        buy_sum,sale_sum=bvc['buy_sum'],bvc['sale_sum']
+        buy_std,sale_std=bvc['buy_std'],bvc['sale_std']
 
         self.dailyfactor=pd.DataFrame()
         self.dailyfactor[1]=buy_sum/(buy_sum+sale_sum)
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# getOrCalculateFactorValue 的两级缓存。
+#
+# 组合构建时同一个 (因子, 日期) 会被反复取用，每次都要查因子库或重新计算。
+# FactorValueCache 以 (factorSymbol, 因子参数, 代码版本, dateTime) 为键：
+#     1) 内存：最近使用的maxItems个结果（LRU）；
+#     2) 磁盘（path不为None时）：path/<factorSymbol>/<参数与版本的摘要>/YYYYMMDD-HHMMSS.npz，
+#        每列一个数组，不依赖pickle。
+# 代码版本默认取因子类源代码的摘要，因子的计算代码改动后旧的缓存自然失效。
+# 写入或删除因子库中的某日数据时，BaseFactorWithDB 调用 invalidate 清除该日的缓存。
+"""
+import os
+import hashlib
+import inspect
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+
+def _digest(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+def getCodeVersion(factor):
+    #因子类（含父类中的子类部分）源代码的摘要，取不到源代码时为类名
+    sources = []
+    for cls in type(factor).__mro__:
+        if cls is object or cls.__module__ == __name__:
+            continue
+        try:
+            sources.append(inspect.getsource(cls))
+        except (IOError, OSError, TypeError):
+            sources.append(cls.__module__ + '.' + cls.__name__)
+    return _digest('\n'.join(sources))
+
+
+class FactorValueCache(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # path: 磁盘缓存的目录，None为只用内存
+    # maxItems: 内存中最多保留的 (因子, 日期) 个数
+    # codeVersion: 代码版本，None时按因子类的源代码计算
+    #
+    # get(factor, dateTime)      返回缓存的DataFrame（副本）或None
+    # put(factor, dateTime, data)
+    # invalidate(factor, dateTimeList=None)  清除因子在这些日期（None为全部日期）的缓存
+    # getStats()                 命中与未命中的次数
+    # 一个实例可以被多个因子共用。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, path=None, maxItems=256, codeVersion=None):
+        self.path = path
+        self.maxItems = maxItems
+        self.codeVersion = codeVersion
+        self.lock = threading.RLock()
+        self.memory = collections.OrderedDict()
+        self.versions = {}
+        self.stats = {'memoryHits': 0, 'diskHits': 0, 'misses': 0, 'puts': 0, 'invalidations': 0}
+
+    def _getVersionKey(self, factor):
+        #因子参数和代码版本的摘要，同一个类只计算一次源代码摘要
+        codeVersion = self.codeVersion
+        if codeVersion is None:
+            cls = type(factor)
+            if cls not in self.versions:
+                self.versions[cls] = getCodeVersion(factor)
+            codeVersion = self.versions[cls]
+        parameters = factor.getFactorParameters()
+        parameters = sorted((str(k), repr(v)) for k, v in parameters.items()) if parameters else []
+        return _digest(repr(parameters) + '|' + str(codeVersion))
+
+    def _getKey(self, factor, dateTime):
+        return (factor.getFactorSymbol(), self._getVersionKey(factor), pd.Timestamp(dateTime).to_datetime64())
+
+    def _getFile(self, key):
+        symbol, versionKey, dateTime = key
+        return os.path.join(self.path, symbol, versionKey, pd.Timestamp(dateTime).strftime('%Y%m%d-%H%M%S') + '.npz')
+
+    def __getstate__(self):
+        #多进程时只传递磁盘缓存的设置，内存中的结果和锁不传递
+        state = self.__dict__.copy()
+        state['memory'] = collections.OrderedDict()
+        state.pop('lock')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def _remember(self, key, data):
+        self.memory.pop(key, None)
+        self.memory[key] = data
+        while len(self.memory) > self.maxItems:
+            self.memory.popitem(last=False)
+
+    def get(self, factor, dateTime):
+        key = self._getKey(factor, dateTime)
+        with self.lock:
+            data = self.memory.pop(key, None)
+            if data is not None:
+                self.memory[key] = data
+                self.stats['memoryHits'] += 1
+                return data.copy()
+        if self.path is not None:
+            data = self._read(self._getFile(key))
+            if data is not None:
+                with self.lock:
+                    self._remember(key, data)
+                    self.stats['diskHits'] += 1
+                return data.copy()
+        with self.lock:
+            self.stats['misses'] += 1
+        return None
+
+    def put(self, factor, dateTime, data):
+        if data is None or len(data) == 0:
+            return
+        key = self._getKey(factor, dateTime)
+        data = data.copy()
+        with self.lock:
+            self._remember(key, data)
+            self.stats['puts'] += 1
+        if self.path is not None:
+            self._write(self._getFile(key), data)
+
+    def invalidate(self, factor, dateTimeList=None):
+        symbol = factor.getFactorSymbol()
+        dateTimes = None if dateTimeList is None else set(pd.Timestamp(dt).to_datetime64() for dt in dateTimeList)
+        with self.lock:
+            for key in list(self.memory.keys()):
+                if key[0] == symbol and (dateTimes is None or key[2] in dateTimes):
+                    del self.memory[key]
+            self.stats['invalidations'] += 1
+        if self.path is None or not os.path.exists(os.path.join(self.path, symbol)):
+            return
+        #磁盘上该因子所有参数和版本的缓存都清除
+        names = None if dateTimes is None else set(pd.Timestamp(dt).strftime('%Y%m%d-%H%M%S') + '.npz' for dt in dateTimes)
+        for versionKey in os.listdir(os.path.join(self.path, symbol)):
+            folder = os.path.join(self.path, symbol, versionKey)
+            for name in os.listdir(folder):
+                if names is None or name in names:
+                    try:
+                        os.remove(os.path.join(folder, name))
+                    except OSError:
+                        pass
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memoryItems'] = len(self.memory)
+        return stats
+
+    def _write(self, file, data):
+        #每列一个数组；字符串列存为定长unicode，时间列存为datetime64
+        folder = os.path.dirname(file)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:
+                if not os.path.isdir(folder):
+                    raise
+        arrays = {'__columns__': np.array([u'%s' % c for c in data.columns])}
+        for i, column in enumerate(data.columns):
+            values = data[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                arrays['c%d' % i] = values.values.astype('datetime64[ns]')
+            elif pd.api.types.is_numeric_dtype(values):
+                arrays['c%d' % i] = values.values.astype(np.float64)
+            else:
+                arrays['c%d' % i] = np.array([u'%s' % v for v in values], dtype='U')
+        tmpFile = file + '.%d.tmp.npz' % os.getpid()
+        np.savez(tmpFile, **arrays)
+        try:
+            os.rename(tmpFile, file)
+        except OSError:
+            #其他进程已写入（Windows上目标存在时rename失败）
+            os.remove(tmpFile)
+
+    def _read(self, file):
+        if not os.path.exists(file):
+            return None
+        with np.load(file, allow_pickle=False) as arrays:
+            columns = [str(c) for c in arrays['__columns__']]
+            data = collections.OrderedDict()
+            for i, column in enumerate(columns):
+                values = arrays['c%d' % i]
+                data[column] = values.astype(object) if values.dtype.kind == 'U' else values
+        return pd.DataFrame(data, columns=columns)
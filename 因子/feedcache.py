@@ -0,0 +1,243 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# DataFeeds 的录制/回放缓存。
+#
+# TradeFactorDemo 和 指数择时/Download.py 的数据都来自 datafeeds.DataFeeds，每次运行都要
+# 重新访问数据源。CachedDataFeeds 包装一个 DataFeeds（或 SyntheticDataFeeds），
+# getDataFeed(name) 返回的数据源对象的每次调用：
+#     1) 以 (数据源名称, 方法名, 参数) 的md5为键，参数中的时间、列表、数组先转为统一的形式；
+#     2) 本地有该键的文件时直接读取（回放），否则调用数据源并写入本地（录制）；
+#     3) 文件为 path\<数据源名称>\<方法名>\<键>.npz，每列一个数组，保留原来的dtype，
+#        object列另存缺失值的位置；文件中同时保存调用的参数，便于查看。
+#        object列中的值都是字符串、整数、浮点数、布尔值或时间之一时按该类型保存，回放时仍为object列，
+#        值为同一类型（时间为pd.Timestamp）；混合类型或其他对象（包括category列）回放为字符串。
+# mode: 'auto' 有则回放、无则录制；'record' 总是访问数据源并覆盖；
+#       'replay' 只回放，没有录制过的调用抛出异常，用于没有网络的机器。
+# 参数按调用时的写法区分，同一请求用位置参数和关键字参数调用是不同的键。
+# 返回值不是DataFrame（或Series）的调用不缓存。
+"""
+import os
+import json
+import hashlib
+import numbers
+import datetime
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+CACHE_MODES = ['auto', 'record', 'replay']
+
+
+def _normalize(value):
+    #参数转为可以json序列化的统一形式
+    if isinstance(value, (datetime.datetime, datetime.date, np.datetime64, pd.Timestamp)):
+        return 'datetime:' + pd.Timestamp(value).isoformat()
+    if isinstance(value, (pd.Series, pd.Index, np.ndarray)):
+        return [_normalize(v) for v in list(value)]
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return [[_normalize(k), _normalize(value[k])] for k in sorted(value.keys(), key=str)]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float)) or isinstance(value, type(u'')):
+        return value
+    return repr(value) if not isinstance(value, str) else value
+
+
+#object列中可以按类型保存的值：类型 -> (数组的dtype, 缺失值位置的填充值)
+OBJECT_KINDS = {'int': (np.int64, 0), 'float': (np.float64, np.nan), 'bool': (bool, False),
+                'datetime': ('datetime64[ns]', np.datetime64('NaT'))}
+
+
+def _getObjectKind(values):
+    #object列中非缺失值的类型：都是同一种可保存的类型时为该类型，否则为'str'
+    if len(values) == 0:
+        return 'str'
+    if all(isinstance(v, (bool, np.bool_)) for v in values):
+        return 'bool'
+    if all(isinstance(v, numbers.Integral) and not isinstance(v, (bool, np.bool_)) for v in values):
+        return 'int'
+    if all(isinstance(v, (float, np.floating)) for v in values):
+        return 'float'
+    if all(isinstance(v, (datetime.datetime, np.datetime64)) for v in values):
+        return 'datetime'
+    return 'str'
+
+
+def getCallKey(feedName, method, args, kwargs):
+    #(调用的描述json, 键)
+    call = json.dumps([feedName, method, _normalize(list(args)), _normalize(dict(kwargs))], sort_keys=True)
+    return call, hashlib.md5(call.encode('utf-8')).hexdigest()
+
+
+def writeFrame(file, data, call=u''):
+    """
+    #----------------------------------------------------------------------
+    # 把DataFrame（或Series）按列写入npz，保留dtype和索引
+    """
+    folder = os.path.dirname(file)
+    if not os.path.exists(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+    isSeries = isinstance(data, pd.Series)
+    frame = data.to_frame() if isSeries else data
+    #非默认的索引作为列保存
+    indexNames = []
+    if not frame.index.equals(pd.RangeIndex(len(frame))):
+        indexNames = ['__index%d__' % i for i in range(frame.index.nlevels)]
+        frame = frame.copy()
+        frame.index.names = indexNames
+        frame = frame.reset_index()
+    meta = {'columns': [_normalize(c) for c in frame.columns], 'index': indexNames, 'series': isSeries,
+            'indexLabels': [_normalize(n) for n in data.index.names], 'call': call, 'objectKinds': {}}
+    arrays = {}
+    for i, column in enumerate(frame.columns):
+        values = frame.iloc[:, i]
+        if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'biufcmM':
+            arrays['c%d' % i] = values.values
+        else:
+            #object等其他类型
+            missing = np.asarray(pd.isnull(values), dtype=bool)
+            kind = _getObjectKind(values.values[~missing])
+            if kind == 'str':
+                arrays['c%d' % i] = np.array([u'' if m else u'%s' % v for v, m in zip(values, missing)], dtype='U')
+            else:
+                arrays['c%d' % i] = np.array([OBJECT_KINDS[kind][1] if m else v for v, m in zip(values, missing)],
+                                             dtype=OBJECT_KINDS[kind][0])
+            arrays['m%d' % i] = missing
+            meta['objectKinds'][str(i)] = kind
+    arrays['__meta__'] = np.array(json.dumps(meta))
+    tmpFile = file + '.%d.%d.tmp.npz' % (os.getpid(), threading.current_thread().ident)
+    np.savez(tmpFile, **arrays)
+    try:
+        if os.path.exists(file):
+            os.remove(file)
+        os.rename(tmpFile, file)
+    except OSError:
+        #其他线程或进程已写入
+        os.remove(tmpFile)
+
+
+def readFrame(file):
+    with np.load(file, allow_pickle=False) as arrays:
+        meta = json.loads(str(arrays['__meta__']))
+        data = collections.OrderedDict()
+        for i, column in enumerate(meta['columns']):
+            values = arrays['c%d' % i]
+            if 'm%d' % i in arrays.files:
+                kind = meta.get('objectKinds', {}).get(str(i), 'str')
+                if kind == 'datetime':
+                    values = np.array(list(pd.DatetimeIndex(values)), dtype=object)
+                else:
+                    values = values.astype(object)
+                values[arrays['m%d' % i]] = None
+                if kind != 'str':
+                    #不让pandas把整数、时间等的object列推断为其他dtype
+                    values = pd.Series(values, dtype=object)
+            data[i] = values
+    frame = pd.DataFrame(data)
+    frame.columns = meta['columns']
+    if len(meta['index']) > 0:
+        frame = frame.set_index(meta['index'])
+        frame.index.names = meta['indexLabels']
+    if meta['series']:
+        return frame.iloc[:, 0]
+    return frame
+
+
+class CachedDataFeed(object):
+    """
+    #--------------------------------------------------------------------------
+    # 单个数据源（如AShareQuotation）的代理，方法调用经过录制/回放
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, name, feed, owner):
+        self.name = name
+        self.feed = feed
+        self.owner = owner
+
+    def __getattr__(self, method):
+        if method.startswith('__'):
+            raise AttributeError(method)
+        if self.feed is not None:
+            target = getattr(self.feed, method)
+            if not callable(target):
+                return target
+        def call(*args, **kwargs):
+            return self.owner._call(self.name, self.feed, method, args, kwargs)
+        return call
+
+
+class CachedDataFeeds(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # source: DataFeeds 或 SyntheticDataFeeds；None时'replay'只用本地文件，
+    #         其他模式使用 datafeeds.DataFeeds()
+    # path:   本地文件的目录
+    # mode:   'auto'、'record'、'replay'
+    #
+    # getDataFeed(name)  与DataFeeds相同，返回经过缓存的数据源
+    # getStats()         回放、录制、未缓存的次数
+    #
+    # 用于TradeFactorDemo：
+    #     TradeFactorDemo.setDataFeedsFactory(lambda: CachedDataFeeds(DataFeeds(), path))
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, source=None, path='feedCache', mode='auto'):
+        if mode not in CACHE_MODES:
+            raise BaseException("[CachedDataFeeds] Not support mode: %s" % mode)
+        if source is None and mode != 'replay':
+            from datafeeds import DataFeeds
+            source = DataFeeds()
+        self.source = source
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.feeds = {}
+        self.stats = {'replays': 0, 'records': 0, 'uncached': 0}
+
+    def getDataFeed(self, name):
+        with self.lock:
+            if name not in self.feeds:
+                feed = self.source.getDataFeed(name) if self.source is not None else None
+                self.feeds[name] = CachedDataFeed(name, feed, self)
+            return self.feeds[name]
+
+    def getStats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def getFile(self, feedName, method, key):
+        return os.path.join(self.path, feedName, method, key + '.npz')
+
+    def _call(self, feedName, feed, method, args, kwargs):
+        call, key = getCallKey(feedName, method, args, kwargs)
+        file = self.getFile(feedName, method, key)
+        if self.mode != 'record' and os.path.exists(file):
+            self._count('replays')
+            return readFrame(file)
+        if self.mode == 'replay':
+            raise BaseException("[CachedDataFeeds] Not recorded: %s" % call)
+        result = getattr(feed, method)(*args, **kwargs)
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            writeFrame(file, result, call)
+            self._count('records')
+        else:
+            self._count('uncached')
+        return result
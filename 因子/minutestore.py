@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 本地分钟数据（dailyData）的读取。
+#
+# 原有的本地分钟数据为每天一个pickle：path\<part>\YYYY-MM-DD.pkl，
+# part为量价base、委托仓位position、衍生derived，索引为'dateTime','securityId'。
+# 读取时必须反序列化整个文件，即使因子只用到其中一两列。
+#
+# MinuteDataStore 增加按天的列式格式：path\<part>\YYYY-MM-DD\ 目录下
+#     meta.json           列名
+#     dateTime.npy        datetime64[ns]
+#     securityId.npy      定长字符串，按securityId排序（同一代码内按dateTime排序）
+#     <item>.npy          每列一个文件
+# 读取时对需要的列做内存映射，只读取用到的列；给定securityIds时按已排序的代码
+# 二分查找，只读取这些股票所在的行。没有列式文件的日期仍从原pickle读取。
+# convertFromPickle 可把已有的pickle转为列式格式。
+"""
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+
+class MinuteDataStore(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # 按天读写本地分钟数据，支持列投影和股票筛选。
+    # @param path: dailyData路径，即 path\_dailyData\<frequency>
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _getPicklePath(self, part, dateTime):
+        return self.path + '\\' + part + '\\' + dateTime.strftime('%Y-%m-%d') + '.pkl'
+
+    def _getColumnarPath(self, part, dateTime):
+        return self.path + '\\' + part + '\\' + dateTime.strftime('%Y-%m-%d')
+
+    def exists(self, part, dateTime):
+        return (os.path.exists(os.path.join(self._getColumnarPath(part, dateTime), 'meta.json'))
+                or os.path.exists(self._getPicklePath(part, dateTime)))
+
+    def read(self, part, dateTime, items, securityIds=None):
+        """
+        #----------------------------------------------------------------------
+        # @param part: type: Str; 'base'、'position'或'derived'
+        # @param items: type: List; 需要的列
+        # @param securityIds: type: List or None; 只读取这些股票，None为全部
+        # @return  DataFrame，索引为'dateTime','securityId'，列为items
+        """
+        columnarPath = self._getColumnarPath(part, dateTime)
+        if os.path.exists(os.path.join(columnarPath, 'meta.json')):
+            return self._readColumnar(columnarPath, items, securityIds)
+        data = pd.read_pickle(self._getPicklePath(part, dateTime))
+        data = data[items]
+        if securityIds is not None:
+            data = data[data.index.get_level_values('securityId').isin(securityIds)]
+        return data
+
+    def _readColumnar(self, columnarPath, items, securityIds=None):
+        with open(os.path.join(columnarPath, 'meta.json')) as f:
+            meta = json.load(f)
+        missing = [item for item in items if item not in meta['columns']]
+        if len(missing) > 0:
+            raise BaseException("[MinuteDataStore] %s has no items: %s" % (columnarPath, missing))
+        codes = np.load(os.path.join(columnarPath, 'securityId.npy'), mmap_mode='r')
+        if securityIds is None:
+            rows = slice(None)
+        else:
+            #代码已排序，每只股票的行是连续的一段
+            wanted = np.unique(np.array([u'%s' % s for s in securityIds], dtype='U'))
+            lo = codes.searchsorted(wanted, side='left')
+            hi = codes.searchsorted(wanted, side='right')
+            lengths = hi - lo
+            rows = np.repeat(lo - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        dateTimes = np.load(os.path.join(columnarPath, 'dateTime.npy'), mmap_mode='r')[rows]
+        index = pd.MultiIndex.from_arrays([pd.DatetimeIndex(np.asarray(dateTimes)),
+                                           pd.Index(np.asarray(codes[rows]).astype(object))],
+                                          names=['dateTime', 'securityId'])
+        values = dict((item, np.asarray(np.load(os.path.join(columnarPath, item + '.npy'), mmap_mode='r')[rows]))
+                      for item in items)
+        return pd.DataFrame(values, index=index, columns=items)
+
+    def write(self, part, dateTime, data):
+        """
+        #----------------------------------------------------------------------
+        # 把一天的分钟数据写为列式格式
+        # @param data: type: DataFrame，索引为'dateTime','securityId'
+        """
+        columnarPath = self._getColumnarPath(part, dateTime)
+        if os.path.exists(os.path.join(columnarPath, 'meta.json')):
+            return
+        data = data.reset_index()
+        codes = np.array([u'%s' % s for s in data['securityId']], dtype='U')
+        dateTimes = pd.to_datetime(data['dateTime']).values.astype('datetime64[ns]')
+        order = np.lexsort((dateTimes, codes))
+        columns = [c for c in data.columns if c not in ['dateTime', 'securityId']]
+        tmpPath = columnarPath + '.%d.tmp' % os.getpid()
+        os.makedirs(tmpPath)
+        np.save(os.path.join(tmpPath, 'securityId.npy'), codes[order])
+        np.save(os.path.join(tmpPath, 'dateTime.npy'), dateTimes[order])
+        for column in columns:
+            values = data[column].values[order]
+            if values.dtype == object:
+                values = values.astype(np.float64)
+            np.save(os.path.join(tmpPath, '%s.npy' % column), values)
+        with open(os.path.join(tmpPath, 'meta.json'), 'w') as f:
+            json.dump({'columns': columns}, f)
+        try:
+            os.rename(tmpPath, columnarPath)
+        except OSError:
+            shutil.rmtree(tmpPath, ignore_errors=True)
+
+    def convertFromPickle(self, part, dateTime):
+        #把已有的pickle转为列式格式，原pickle保留
+        self.write(part, dateTime, pd.read_pickle(self._getPicklePath(part, dateTime)))
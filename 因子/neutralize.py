@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 截面中性化（对行业哑变量、对数市值等暴露做回归取残差）的批量引擎。
+#
+# 逐日逐因子做OLS时，同一天的暴露矩阵被重复分解。Neutralizer 把暴露和因子都
+# 对齐为 日期×股票 的面板，按blockSize个日期一块：
+#     1) 每天暴露矩阵X（暴露缺失的股票所在行置0）的 X'X 一次批量特征分解，得到伪逆，
+#        行业哑变量与截距共线等秩亏的情况按特征值舍去；
+#     2) 当天所有因子的残差一次算出：y - X(X'X)^+ X'y；
+#     3) 某个因子当天的缺失股票与暴露的有效股票不同时，从 X'X 中减去这些股票的部分
+#        再求伪逆，有效股票相同的因子共用这个分解。
+# 残差在因子或暴露缺失的位置为nan。
+"""
+import collections
+import numpy as np
+import pandas as pd
+
+
+def industryDummies(industry, prefix='industry_'):
+    """
+    #----------------------------------------------------------------------
+    # 行业面板 -> 行业哑变量面板
+    # @param industry: type: DataFrame，索引为dateTime，列为securityId，值为行业代码，缺失为nan
+    # @return  OrderedDict{prefix+行业代码: DataFrame(0/1，行业缺失的位置为nan)}
+    """
+    values = industry.values
+    missing = pd.isnull(values)
+    result = collections.OrderedDict()
+    for code in sorted(pd.unique(values[~missing])):
+        dummy = (values == code).astype(np.float64)
+        dummy[missing] = np.nan
+        result[prefix + str(code)] = pd.DataFrame(dummy, index=industry.index, columns=industry.columns)
+    return result
+
+
+def gramPinv(gram, n):
+    """
+    #----------------------------------------------------------------------
+    # 批量求 X'X 的伪逆
+    # @param gram: type: numpy.ndarray(..., k, k)，X'X
+    # @param n: type: Int，X的行数，用于确定舍去的阈值
+    # @return  numpy.ndarray(..., k, k)，秩亏时舍去相对最大特征值过小的方向
+    """
+    w, v = np.linalg.eigh(gram)
+    tol = w[..., -1:] * max(n, gram.shape[-1]) * np.finfo(np.float64).eps
+    with np.errstate(divide='ignore'):
+        inv = np.where(w > tol, 1.0 / w, 0.0)
+    return np.matmul(v * inv[..., None, :], np.swapaxes(v, -1, -2))
+
+
+def regressOut(x, pinv, y):
+    #回归残差 y - X(X'X)^+ X'y，x: (..., n, k)，pinv: (..., k, k)，y: (..., n, m)
+    #y在回归中不使用的行须为0，这些行的残差没有意义
+    return y - np.matmul(x, np.matmul(pinv, np.matmul(np.swapaxes(x, -1, -2), y)))
+
+
+class Neutralizer(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # exposures:    Dict{暴露名称: DataFrame}，索引为dateTime，列为securityId，
+    #               如 industryDummies(行业面板) 加上 {'logCap': np.log(市值面板)}
+    # addIntercept: 是否加入截距
+    # blockSize:    每次一起分解的日期数，控制内存
+    #
+    # neutralize(factors, dtype)
+    #     factors为一个因子面板或 Dict{因子名称: 因子面板}，返回相同结构的残差面板，
+    #     日期和股票为全部因子面板的并集
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, exposures, addIntercept=True, blockSize=20):
+        if len(exposures) == 0:
+            raise BaseException("[Neutralizer] Need at least one exposure.")
+        self.exposures = collections.OrderedDict(exposures)
+        self.addIntercept = addIntercept
+        self.blockSize = blockSize
+
+    def getExposureNames(self):
+        return list(self.exposures.keys())
+
+    def _getExposureBlock(self, dates, securityIds):
+        #(日期, 股票, 暴露)的数组，以及暴露全部有效的位置
+        x = np.stack([exposure.reindex(index=dates, columns=securityIds).values.astype(np.float64)
+                      for exposure in self.exposures.values()], axis=-1)
+        valid = np.isfinite(x).all(axis=-1)
+        if self.addIntercept:
+            x = np.concatenate([x, np.ones(x.shape[:-1] + (1,))], axis=-1)
+        x[~valid] = 0.0
+        return x, valid
+
+    def _align(self, panel, dates, securityIds):
+        #已对齐的面板直接取数组，不复制
+        if panel.index.equals(dates) and panel.columns.equals(securityIds):
+            return panel.values
+        return panel.reindex(index=dates, columns=securityIds).values
+
+    def neutralize(self, factors, dtype=np.float64):
+        single = isinstance(factors, pd.DataFrame)
+        if single:
+            factors = collections.OrderedDict([(None, factors)])
+        names = list(factors.keys())
+        dates = pd.DatetimeIndex(sorted(set().union(*[panel.index for panel in factors.values()])), name='dateTime')
+        securityIds = pd.Index(sorted(set().union(*[panel.columns for panel in factors.values()])), name='securityId')
+        arrays = [self._align(factors[name], dates, securityIds) for name in names]
+        results = [np.full((len(dates), len(securityIds)), np.nan, dtype=dtype) for name in names]
+
+        for start in range(0, len(dates), self.blockSize):
+            block = slice(start, min(start + self.blockSize, len(dates)))
+            x, validX = self._getExposureBlock(dates[block], securityIds)
+            y = np.stack([array[block] for array in arrays], axis=-1).astype(np.float64)
+            mask = validX[..., None] & np.isfinite(y)
+            y[~mask] = 0.0
+            # step1 当天所有因子共用暴露的分解
+            gram = np.matmul(np.swapaxes(x, -1, -2), x)
+            residual = regressOut(x, gramPinv(gram, x.shape[1]), y)
+            # step2 缺失股票不同的因子，按有效股票相同的分组重新分解
+            deviated = (mask != validX[..., None]).any(axis=1)
+            groups = []
+            for d in np.nonzero(deviated.any(axis=1))[0]:
+                columns = np.nonzero(deviated[d])[0]
+                packed = np.packbits(mask[d][:, columns], axis=0).T
+                keys = collections.OrderedDict()
+                for i, key in enumerate(packed):
+                    keys.setdefault(key.tobytes(), []).append(columns[i])
+                for cols in keys.values():
+                    groups.append((d, cols))
+            if len(groups) > 0:
+                grams = []
+                for d, cols in groups:
+                    dropped = x[d][validX[d] & ~mask[d][:, cols[0]]]
+                    grams.append(gram[d] - np.dot(dropped.T, dropped))
+                pinvs = gramPinv(np.stack(grams), x.shape[1])
+                for (d, cols), pinv in zip(groups, pinvs):
+                    residual[d][:, cols] = regressOut(x[d], pinv, y[d][:, cols])
+            residual[~mask] = np.nan
+            for i in range(len(names)):
+                results[i][block] = residual[..., i]
+
+        panels = [pd.DataFrame(result, index=dates, columns=securityIds) for result in results]
+        if single:
+            return panels[0]
+        return collections.OrderedDict(zip(names, panels))
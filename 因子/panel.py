@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 日内数据的稠密面板表示。
+#
+# dailydata 是以 'dateTime','securityId' 为索引的长表，按股票、按日统计时
+# 需要 reset_index 和 groupby。MinutePanel 把每个指标存为一个
+# 股票×分钟 的二维数组（默认float32，缺失为nan），行对应 securityIds，
+# 列对应分钟网格 dateTimes，按股票统计只需沿 axis=1 做归约。
+"""
+import numpy as np
+import pandas as pd
+
+
+class MinutePanel(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # securityIds: pd.Index，行对应的股票代码（已排序）
+    # dateTimes:   pd.DatetimeIndex，列对应的分钟网格（已排序）
+    # values:      Dict{item: numpy.ndarray(len(securityIds), len(dateTimes))}
+    # mask:        numpy.ndarray(bool)，长表中存在的(股票,分钟)为True
+    # dtype:       数组的类型
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, securityIds, dateTimes, values, mask, dtype=np.float32):
+        self.securityIds = securityIds
+        self.dateTimes = dateTimes
+        self.values = values
+        self.mask = mask
+        self.dtype = np.dtype(dtype)
+
+    @classmethod
+    def fromFrame(cls, data, items=None, dtype=np.float32, grid=None):
+        """
+        #----------------------------------------------------------------------
+        # 由长表生成面板
+        # @param data: type: DataFrame，索引为'dateTime','securityId'
+        # @param grid: type: 分钟网格，None时取数据中出现的全部时间点；
+        #              给定时不在网格上的数据被丢弃
+        """
+        if items is None:
+            items = list(data.columns)
+        secCodes, securityIds = pd.factorize(data.index.get_level_values('securityId'), sort=True)
+        dateTimeLevel = data.index.get_level_values('dateTime')
+        if grid is None:
+            timeCodes, dateTimes = pd.factorize(dateTimeLevel, sort=True)
+        else:
+            dateTimes = pd.DatetimeIndex(grid).sort_values()
+            timeCodes = dateTimes.get_indexer(dateTimeLevel)
+        keep = timeCodes >= 0
+        secCodes, timeCodes = secCodes[keep], timeCodes[keep]
+        mask = np.zeros((len(securityIds), len(dateTimes)), dtype=bool)
+        mask[secCodes, timeCodes] = True
+        values = {}
+        for item in items:
+            array = np.full((len(securityIds), len(dateTimes)), np.nan, dtype=dtype)
+            array[secCodes, timeCodes] = data[item].values[keep]
+            values[item] = array
+        return cls(pd.Index(securityIds, name='securityId'), pd.DatetimeIndex(dateTimes, name='dateTime'), values, mask, dtype)
+
+    def get(self, item):
+        return self.values[item]
+
+    def getDates(self):
+        #每一列所属的日期
+        return self.dateTimes.normalize()
+
+    def getDateSlices(self):
+        #按日期切分列：[(datetime.date, slice), ...]，分钟网格已排序，每个日期是连续的一段
+        dates = self.getDates()
+        result = []
+        start = 0
+        for i in range(1, len(dates) + 1):
+            if i == len(dates) or dates[i] != dates[start]:
+                result.append((dates[start].date(), slice(start, i)))
+                start = i
+        return result
+
+    def toFrame(self, dropna=True):
+        #还原为以'dateTime','securityId'为索引的长表，dropna时只保留原长表中存在的行
+        index = pd.MultiIndex.from_product([self.securityIds, self.dateTimes], names=['securityId', 'dateTime'])
+        data = pd.DataFrame(dict((item, array.ravel()) for item, array in self.values.items()), index=index)
+        if dropna:
+            data = data[self.mask.ravel()]
+        return data.swaplevel(0, 1).sort_index()
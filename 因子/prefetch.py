@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 按顺序预取数据的后台线程。
+#
+# 逐日计算日度因子时，导入数据（读盘或访问数据源）和计算（getFactor）交替进行，
+# 导入时CPU空闲、计算时I/O空闲。Prefetcher 在后台线程中按顺序导入后面的日期，
+# 主线程计算第t天时，第t+1..t+depth天已在导入；队列长度为depth，内存中最多有
+# depth+1天的数据（队列中depth天和正在导入的一天）。
+# 导入时的异常在主线程取到该日期时抛出。
+"""
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+_DONE = object()
+
+
+class Prefetcher(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # load:  函数 load(key)，在后台线程中调用
+    # keys:  按顺序导入的键（如交易日）
+    # depth: 已导入、等待取用的最多个数
+    #
+    # get(key)     取key的结果，key须按keys的顺序取，跳过的键的结果被丢弃
+    # for key, value in prefetcher: 按顺序取全部结果
+    # close()      停止后台线程；with语句结束时自动调用
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, load, keys, depth=2):
+        if depth < 1:
+            raise BaseException("[Prefetcher] depth must be at least 1.")
+        self.load = load
+        self.keys = list(keys)
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        #队列满时等待，close后放弃
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        for key in self.keys:
+            if self.stopped.is_set():
+                return
+            try:
+                item = (key, self.load(key), None)
+            except Exception as err:
+                item = (key, None, err)
+            if not self._put(item):
+                return
+        self._put((_DONE, None, None))
+
+    def _next(self):
+        key, value, err = self.queue.get()
+        if key is _DONE:
+            raise StopIteration
+        if err is not None:
+            self.close()
+            raise err
+        return key, value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self._next()
+
+    next = __next__
+
+    def get(self, key):
+        while True:
+            try:
+                k, value = self._next()
+            except StopIteration:
+                raise BaseException("[Prefetcher] %s is not in keys or has been skipped." % (key,))
+            if k == key:
+                return value
+
+    def close(self):
+        self.stopped.set()
+        #取出队列中的数据，使等待的后台线程结束
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
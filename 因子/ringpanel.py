@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# getData、getVars 中 fetchDataOnOld 的滑动窗口。
+#
+# 原来每次调用都在 MultiIndex 的长表上 drop 旧日期和调出的股票、append 新数据，再
+# sort_index，窗口很长时大部分时间花在重建索引上。RingPanel 为每个指标预先分配
+# 时间点×股票 的二维数组：
+#     1) 行是环形的槽位，窗口滑动时清空过期时间点的槽位并写入新时间点，每个时间点O(股票数)；
+#     2) 列按股票第一次出现的顺序分配，容量不够时加倍；调出的股票只清除其列并标记为不在池中，
+#        再次调入时重用原来的列；不在池中的列过多时压缩；
+#     3) presence 记录每个格子是否有数据，toFrame 只还原有数据的格子，
+#        结果与原来的长表（以'dateTime','securityId'为索引并排序）一致；
+#        各指标的dtype取写入过的dtype的公共类型（如先写入int、后写入带nan的float时为float），
+#        与原来append之后的长表相同。
+# TradeFactorDemo 的 stockdata、stockvars 只在被访问时由 toFrame 生成；按数组计算的因子可以用
+# getPanel 取 时间点×股票 的稠密数组，不经过长表和MultiIndex。
+"""
+import numpy as np
+import pandas as pd
+
+
+class RingPanel(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # capacity: 窗口的时间点数（槽位数）
+    #
+    # retainDates(dateTimes)     清空不在dateTimes中的时间点
+    # setUniverse(securityIds)   设置当前的股票池：调出的股票清除，调入的股票分配列
+    # insert(data)               写入长表 DataFrame ['dateTime','securityId', 指标...]
+    # getDates() / getSecurityIds()   窗口中的时间点（排序）/ 池中的股票
+    # toFrame()                  以'dateTime','securityId'为索引的长表
+    # getPanel(item)             (时间点, 股票, 时间点×股票的数组)，没有数据的格子为nan（object指标为None）
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, capacity, columnCapacity=1024):
+        self.capacity = capacity
+        self.slotDates = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.slotOf = {}
+        self.securityIds = []
+        self.columnOf = {}
+        self.active = np.zeros(columnCapacity, dtype=bool)
+        self.presence = np.zeros((capacity, columnCapacity), dtype=bool)
+        self.items = []
+        self.dtypes = {}
+        self.values = {}
+
+    def __len__(self):
+        return len(self.slotOf)
+
+    def _getColumnCapacity(self):
+        return self.presence.shape[1]
+
+    def _growColumns(self, need):
+        size = self._getColumnCapacity()
+        if need <= size:
+            return
+        while size < need:
+            size *= 2
+        extra = size - self._getColumnCapacity()
+        self.active = np.concatenate([self.active, np.zeros(extra, dtype=bool)])
+        self.presence = np.concatenate([self.presence, np.zeros((self.capacity, extra), dtype=bool)], axis=1)
+        for item in self.items:
+            self.values[item] = np.concatenate([self.values[item], self._empty(item, extra)], axis=1)
+
+    def _empty(self, item, columns):
+        if self.values[item].dtype == object:
+            return np.full((self.capacity, columns), None, dtype=object)
+        return np.full((self.capacity, columns), np.nan)
+
+    def _addItem(self, item, dtype):
+        self.items.append(item)
+        self.dtypes[item] = dtype
+        internal = np.float64 if pd.api.types.is_numeric_dtype(dtype) else object
+        self.values[item] = np.full((self.capacity, self._getColumnCapacity()), np.nan if internal is np.float64 else None, dtype=internal)
+
+    def _widen(self, item, dtype):
+        #toFrame还原的dtype放宽到能容纳新写入的数据
+        old = self.dtypes[item]
+        if old == dtype or old == object:
+            return
+        if pd.api.types.is_numeric_dtype(old) and pd.api.types.is_numeric_dtype(dtype):
+            self.dtypes[item] = np.promote_types(old, dtype)
+        else:
+            self.dtypes[item] = np.dtype(object)
+
+    def _clearSlot(self, slot):
+        self.presence[slot, :] = False
+        for item in self.items:
+            self.values[item][slot, :] = np.nan if self.values[item].dtype != object else None
+
+    def _clearColumns(self, columns):
+        self.presence[:, columns] = False
+        for item in self.items:
+            self.values[item][:, columns] = np.nan if self.values[item].dtype != object else None
+
+    def _compact(self):
+        #去掉不在池中的列，编号重新分配
+        columns = np.nonzero(self.active[:len(self.securityIds)])[0]
+        size = self._getColumnCapacity()
+        self.securityIds = [self.securityIds[c] for c in columns]
+        self.columnOf = dict((securityId, i) for i, securityId in enumerate(self.securityIds))
+        self.active = np.zeros(size, dtype=bool)
+        self.active[:len(columns)] = True
+        presence = np.zeros_like(self.presence)
+        presence[:, :len(columns)] = self.presence[:, columns]
+        self.presence = presence
+        for item in self.items:
+            values = self._empty(item, size)
+            values[:, :len(columns)] = self.values[item][:, columns]
+            self.values[item] = values
+
+    #----------------------------------------------------------------------
+    def retainDates(self, dateTimes):
+        keep = set(pd.DatetimeIndex(dateTimes).values)
+        for date, slot in list(self.slotOf.items()):
+            if date not in keep:
+                self._clearSlot(slot)
+                self.slotDates[slot] = np.datetime64('NaT')
+                del self.slotOf[date]
+
+    def setUniverse(self, securityIds):
+        securityIds = list(securityIds)
+        leaving = [c for securityId, c in self.columnOf.items() if self.active[c]]
+        inUniverse = set(securityIds)
+        leaving = [c for c in leaving if self.securityIds[c] not in inUniverse]
+        if len(leaving) > 0:
+            self._clearColumns(leaving)
+            self.active[leaving] = False
+        new = [securityId for securityId in securityIds if securityId not in self.columnOf]
+        self._growColumns(len(self.securityIds) + len(new))
+        for securityId in new:
+            self.columnOf[securityId] = len(self.securityIds)
+            self.securityIds.append(securityId)
+        self.active[[self.columnOf[securityId] for securityId in securityIds]] = True
+        if len(self.securityIds) - len(securityIds) > max(len(securityIds), 64):
+            self._compact()
+
+    def insert(self, data):
+        if len(data) == 0:
+            return
+        # 时间点 -> 槽位，新的时间点占用空的槽位
+        dates, dateCodes = np.unique(pd.DatetimeIndex(data['dateTime']).values, return_inverse=True)
+        slots = np.empty(len(dates), dtype=np.int64)
+        free = list(np.nonzero(np.isnat(self.slotDates))[0])
+        for i, date in enumerate(dates):
+            slot = self.slotOf.get(date)
+            if slot is None:
+                if len(free) == 0:
+                    raise BaseException("[RingPanel] No free slot for %s, call retainDates first." % date)
+                slot = free.pop(0)
+                self.slotOf[date] = slot
+                self.slotDates[slot] = date
+            slots[i] = slot
+        rows = slots[dateCodes]
+        columns = np.array([self.columnOf.get(securityId, -1) for securityId in data['securityId']], dtype=np.int64)
+        keep = columns >= 0
+        keep[keep] = self.active[columns[keep]]
+        rows, columns = rows[keep], columns[keep]
+        for item in data.columns:
+            if item in ['dateTime', 'securityId']:
+                continue
+            if item not in self.values:
+                self._addItem(item, data[item].dtype)
+            else:
+                self._widen(item, data[item].dtype)
+            self.values[item][rows, columns] = data[item].values[keep]
+        #这次没有写入的指标在这些格子上为缺失
+        for item in self.items:
+            if item not in data.columns:
+                self._widen(item, np.dtype(np.float64))
+        self.presence[rows, columns] = True
+
+    def getDates(self):
+        return pd.DatetimeIndex(np.sort(self.slotDates[~np.isnat(self.slotDates)]))
+
+    def getSecurityIds(self):
+        return [securityId for securityId, c in self.columnOf.items() if self.active[c]]
+
+    def _getLayout(self):
+        #按时间排序的槽位，按代码排序的(股票, 列)
+        slots = np.array([self.slotOf[date] for date in self.getDates().values], dtype=np.int64)
+        columns = np.array(sorted((securityId, c) for securityId, c in self.columnOf.items() if self.active[c]), dtype=object)
+        return slots, columns
+
+    def getPanel(self, item):
+        slots, columns = self._getLayout()
+        dates = pd.DatetimeIndex(self.slotDates[slots], name='dateTime')
+        if len(columns) == 0:
+            return dates, pd.Index([], name='securityId'), np.full((len(slots), 0), np.nan)
+        ids, columns = columns[:, 0], columns[:, 1].astype(np.int64)
+        return dates, pd.Index(ids, name='securityId'), self.values[item][np.ix_(slots, columns)]
+
+    def toFrame(self):
+        slots, columns = self._getLayout()
+        if len(slots) == 0 or len(columns) == 0:
+            return pd.DataFrame(columns=self.items, index=pd.MultiIndex.from_arrays([[], []], names=['dateTime', 'securityId']))
+        ids, columns = columns[:, 0], columns[:, 1].astype(np.int64)
+        rows, cols = np.nonzero(self.presence[np.ix_(slots, columns)])
+        #时间点和股票都已排序，直接用编号建立索引
+        index = pd.MultiIndex(levels=[pd.DatetimeIndex(self.slotDates[slots]), pd.Index(ids)], codes=[rows, cols],
+                              names=['dateTime', 'securityId'], verify_integrity=False)
+        data = pd.DataFrame(dict((item, self.values[item][slots[rows], columns[cols]]) for item in self.items),
+                            index=index, columns=self.items)
+        for item in self.items:
+            if data[item].dtype != object and self.dtypes[item] != data[item].dtype:
+                data[item] = data[item].astype(self.dtypes[item])
+        return data
@@ -0,0 +1,372 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 日度因子的增量滚动统计。
+#
+# HTradeFactorDemo.transformToId 每个调仓日都在整个窗口上重新统计一遍；
+# 连续按日调仓时，相邻窗口只差进出的两天。本模块为每只股票维护一个状态，
+# 新的一天进入、最早的一天离开时 O(1) 更新（中位数为 O(log n)），
+# 统计口径与 transformToId 的各 how 选项一致：
+#     mean、wmean、ewmean、median、std、cv、prod
+# 缺失值（nan）和 pandas 的处理一致：计入窗口长度和权重，但不计入分子。
+"""
+import heapq
+import collections
+import numpy as np
+import pandas as pd
+
+
+class BaseRollingAggregator(object):
+    """
+    #--------------------------------------------------------------------------
+    # 单只股票的滚动统计基类，窗口为先进先出：
+    # push(x) 在最新端加入一个值，pop() 从最早端移除一个值，value() 返回当前统计量。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self):
+        self.window = collections.deque()
+
+    def __len__(self):
+        return len(self.window)
+
+    def push(self, x):
+        x = float(x)
+        self.window.append(x)
+        self._add(x)
+
+    def pop(self):
+        x = self.window.popleft()
+        self._remove(x)
+        return x
+
+    def _add(self, x):
+        raise NotImplementedError
+
+    def _remove(self, x):
+        raise NotImplementedError
+
+    def value(self):
+        raise NotImplementedError
+
+
+class RollingMean(BaseRollingAggregator):
+    def __init__(self):
+        BaseRollingAggregator.__init__(self)
+        self.n = 0
+        self.s = 0.0
+
+    def _add(self, x):
+        if x == x:
+            self.n += 1
+            self.s += x
+
+    def _remove(self, x):
+        if x == x:
+            self.n -= 1
+            self.s -= x
+            if self.n == 0:
+                self.s = 0.0
+
+    def value(self):
+        if self.n == 0:
+            return np.nan
+        return self.s / self.n
+
+
+class RollingStd(BaseRollingAggregator):
+    #样本标准差(ddof=1)，以进入窗口的第一个有效值为平移量，减小大数相减的误差
+    def __init__(self):
+        BaseRollingAggregator.__init__(self)
+        self.n = 0
+        self.k = None
+        self.s = 0.0
+        self.ss = 0.0
+
+    def _add(self, x):
+        if x == x:
+            if self.n == 0:
+                self.k = x
+                self.s = 0.0
+                self.ss = 0.0
+            d = x - self.k
+            self.n += 1
+            self.s += d
+            self.ss += d * d
+
+    def _remove(self, x):
+        if x == x:
+            d = x - self.k
+            self.n -= 1
+            self.s -= d
+            self.ss -= d * d
+
+    def mean(self):
+        if self.n == 0:
+            return np.nan
+        return self.k + self.s / self.n
+
+    def value(self):
+        if self.n < 2:
+            return np.nan
+        var = (self.ss - self.s * self.s / self.n) / (self.n - 1)
+        #窗口内各值相同时，增减累积的舍入误差不应表现为非零的标准差
+        if var <= 1e-12 * self.ss / self.n:
+            return 0.0
+        return np.sqrt(var)
+
+
+class RollingCV(RollingStd):
+    #平均值/标准差，与transformToId一致，inf记为nan
+    def value(self):
+        std = RollingStd.value(self)
+        if std != std or std == 0:
+            return np.nan
+        return self.mean() / std
+
+
+class RollingWeightedMean(BaseRollingAggregator):
+    """
+    #--------------------------------------------------------------------------
+    # 线性加权平均：窗口内越早的权重越小，权重依次为 1,2,...,n。
+    # 记每个值的绝对序号为 p，窗口起点为 p0，则权重为 p-p0+1，
+    # 分子 = sum(p*x) - (p0-1)*sum(x)，分母 = n(n+1)/2。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self):
+        BaseRollingAggregator.__init__(self)
+        self.p0 = 0
+        self.p1 = 0
+        self.s = 0.0
+        self.t = 0.0
+
+    def _add(self, x):
+        if x == x:
+            self.s += x
+            self.t += self.p1 * x
+        self.p1 += 1
+
+    def _remove(self, x):
+        if x == x:
+            self.s -= x
+            self.t -= self.p0 * x
+        self.p0 += 1
+        if self.p0 == self.p1:
+            self.p0 = self.p1 = 0
+            self.s = self.t = 0.0
+
+    def value(self):
+        n = self.p1 - self.p0
+        if n == 0:
+            return np.nan
+        return (self.t - (self.p0 - 1) * self.s) / (n * (n + 1) / 2.0)
+
+
+class RollingExpWeightedMean(BaseRollingAggregator):
+    """
+    #--------------------------------------------------------------------------
+    # 指数加权平均：最新值权重为1，往前依次乘以 r=1-a。
+    # 分子 e 在加入新值时整体乘 r 再加 x，移除最早值时减去 x*r^(n-1)。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, a):
+        BaseRollingAggregator.__init__(self)
+        self.r = 1.0 - a
+        self.e = 0.0
+
+    def _add(self, x):
+        self.e *= self.r
+        if x == x:
+            self.e += x
+
+    def _remove(self, x):
+        if x == x:
+            self.e -= x * self.r ** len(self.window)
+        if len(self.window) == 0:
+            self.e = 0.0
+
+    def value(self):
+        n = len(self.window)
+        if n == 0:
+            return np.nan
+        if self.r == 1.0:
+            return self.e / n
+        return self.e * (1.0 - self.r) / (1.0 - self.r ** n)
+
+
+class RollingProd(BaseRollingAggregator):
+    #乘积：单独记录0的个数，非零值的乘积在移除时相除
+    def __init__(self):
+        BaseRollingAggregator.__init__(self)
+        self.n = 0
+        self.zeros = 0
+        self.p = 1.0
+
+    def _add(self, x):
+        if x != x:
+            return
+        self.n += 1
+        if x == 0:
+            self.zeros += 1
+        else:
+            self.p *= x
+
+    def _remove(self, x):
+        if x != x:
+            return
+        self.n -= 1
+        if x == 0:
+            self.zeros -= 1
+        else:
+            self.p /= x
+        if self.n == 0:
+            self.p = 1.0
+
+    def value(self):
+        if self.zeros > 0:
+            return 0.0
+        return self.p
+
+
+class RollingMedian(BaseRollingAggregator):
+    """
+    #--------------------------------------------------------------------------
+    # 中位数：大小两个堆加延迟删除，加入与移除均为 O(log n)。
+    # low 为大顶堆（存相反数），high 为小顶堆，保持 len(low) == len(high) 或多一个。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self):
+        BaseRollingAggregator.__init__(self)
+        self.low = []
+        self.high = []
+        self.lowSize = 0
+        self.highSize = 0
+        self.delayed = collections.defaultdict(int)
+
+    def _prune(self, heap, sign):
+        while heap and self.delayed[sign * heap[0]] > 0:
+            self.delayed[sign * heap[0]] -= 1
+            heapq.heappop(heap)
+
+    def _balance(self):
+        if self.lowSize > self.highSize + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.lowSize -= 1
+            self.highSize += 1
+            self._prune(self.low, -1)
+        elif self.lowSize < self.highSize:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.lowSize += 1
+            self.highSize -= 1
+            self._prune(self.high, 1)
+
+    def _add(self, x):
+        if x != x:
+            return
+        if self.lowSize == 0 or x <= -self.low[0]:
+            heapq.heappush(self.low, -x)
+            self.lowSize += 1
+        else:
+            heapq.heappush(self.high, x)
+            self.highSize += 1
+        self._balance()
+
+    def _remove(self, x):
+        if x != x:
+            return
+        self.delayed[x] += 1
+        if x <= -self.low[0]:
+            self.lowSize -= 1
+            if x == -self.low[0]:
+                self._prune(self.low, -1)
+        else:
+            self.highSize -= 1
+            if self.high and x == self.high[0]:
+                self._prune(self.high, 1)
+        self._balance()
+
+    def value(self):
+        if self.lowSize == 0:
+            return np.nan
+        if self.lowSize > self.highSize:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2.0
+
+
+def getRollingAggregator(how, lagTradeDays):
+    """
+    #----------------------------------------------------------------------
+    # 按 transformToId 的 how 选项生成单只股票的滚动统计实例
+    """
+    if how == 'mean':
+        return RollingMean()
+    elif how == 'wmean':
+        return RollingWeightedMean()
+    elif how == 'ewmean':
+        return RollingExpWeightedMean(2.0 / (1 + lagTradeDays))
+    elif how == 'median':
+        return RollingMedian()
+    elif how == 'std':
+        return RollingStd()
+    elif how == 'cv':
+        return RollingCV()
+    elif how == 'prod':
+        return RollingProd()
+    else:
+        raise BaseException("[rolling] Not support how:%s" % how)
+
+
+class RollingFactorWindow(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # 按股票维护日度因子的滚动窗口：
+    #     push(date, dailyfactor) 加入一天的日度因子（以securityId为索引的Series）
+    #     pop()                   移除窗口中最早的一天
+    #     getValue()              返回每只股票的统计量（Series，索引为securityId）
+    #     getCount()              返回每只股票在窗口中的天数，用于有效交易日的筛选
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, how, lagTradeDays):
+        self.how = how
+        self.lagTradeDays = lagTradeDays
+        self.dates = collections.deque()
+        self.days = collections.deque()
+        self.aggregators = {}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def push(self, date, dailyfactor):
+        self.dates.append(date)
+        self.days.append(dailyfactor.index)
+        aggregators = self.aggregators
+        for securityId, x in zip(dailyfactor.index, dailyfactor.values):
+            agg = aggregators.get(securityId)
+            if agg is None:
+                agg = aggregators[securityId] = getRollingAggregator(self.how, self.lagTradeDays)
+            agg.push(x)
+
+    def pop(self):
+        date = self.dates.popleft()
+        aggregators = self.aggregators
+        for securityId in self.days.popleft():
+            agg = aggregators[securityId]
+            agg.pop()
+            if len(agg) == 0:
+                del aggregators[securityId]
+        return date
+
+    def getValue(self):
+        securityIds = list(self.aggregators.keys())
+        values = [self.aggregators[s].value() for s in securityIds]
+        return pd.Series(values, index=pd.Index(securityIds, name='securityId'), dtype=np.float64)
+
+    def getCount(self):
+        securityIds = list(self.aggregators.keys())
+        counts = [len(self.aggregators[s]) for s in securityIds]
+        return pd.Series(counts, index=pd.Index(securityIds, name='securityId'))
@@ -0,0 +1,284 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 没有网络时代替 DataFeeds 的合成数据源。
+#
+# SyntheticDataFeeds 实现因子和 指数择时/Download.py 用到的接口：
+#     AShareCalendar     getAShareCalendar(beginDateTime, endDateTime)
+#     AShareCodes        getAShareCodes(beginDateTime, endDateTime)
+#     AShareQuotation    getAShareQuotation(securityIds, items, frequency, beginDateTime, endDateTime, ...)
+#                        日线和分钟线的量价（close、preClose、open、high、low、volume、amount）、
+#                        五档委托（buy1..5、sale1..5、bc1..5、sc1..5）和spread
+#     AShareVars         getAShareDayVars(dateTimeList, securityIds, items)，市值marketValue等
+#     AIndexConstituent  getAIndexConstituent、getBatchAIndexConstituent
+# 每个数值都是 (seed, 股票, 日期, 分钟bar) 的哈希，与请求的范围和分块无关：同一个时间点
+# 无论怎样请求都得到相同的值，分钟线最后一根bar的close等于日线close。
+# 交易日为工作日去掉元旦、五一、国庆；部分股票在区间中上市或退市，约1%的股票日停牌（没有数据）。
+"""
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+
+#指数代码，行情中作为价格序列，成分股按比例抽取
+INDEX_WEIGHTS = {'000001.SH': 1.0, '000016.SH': 0.1, '000300.SH': 0.3, '000905.SH': 0.5, '000906.SH': 0.8}
+FEED_NAMES = ['AShareCalendar', 'AShareCodes', 'AShareQuotation', 'AShareVars', 'AIndexConstituent']
+ORDER_BOOK_LEVELS = 5
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(x):
+    #splitmix64
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+def hashUniform(*keys):
+    #各键（可广播的整数数组）的哈希 -> [0, 1) 的均匀数
+    with np.errstate(over='ignore'):
+        h = np.uint64(0)
+        for key in keys:
+            h = _mix(h ^ (np.asarray(key).astype(np.uint64) + _GOLDEN))
+    return (h >> np.uint64(11)).astype(np.float64) * (2.0 ** -53)
+
+
+def hashNormal(*keys):
+    #Box-Muller
+    u1 = hashUniform(*(keys + (1,)))
+    u2 = hashUniform(*(keys + (2,)))
+    return np.sqrt(-2.0 * np.log(1.0 - u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def _toDay(dateTime):
+    return np.datetime64(pd.Timestamp(dateTime).normalize().to_datetime64(), 'D')
+
+
+class SyntheticDataFeeds(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # securityCount: 股票数，一半深市、一半沪市
+    # beginDate, endDate: 交易日历的范围
+    # seed: 不同的seed得到不同的数据
+    #
+    # getDataFeed(name)  与DataFeeds相同，name见FEED_NAMES
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, securityCount=300, beginDate=datetime.datetime(2012, 1, 1),
+                 endDate=datetime.datetime(2026, 12, 31), seed=0):
+        self.seed = seed
+        self.lock = threading.Lock()
+        #交易日
+        days = pd.bdate_range(beginDate, endDate)
+        holiday = ((days.month == 1) & (days.day == 1)) | ((days.month == 5) & (days.day <= 3)) | \
+                  ((days.month == 10) & (days.day <= 7))
+        self.days = days[~holiday].values.astype('datetime64[D]')
+        #股票和指数，编号为在securityIds中的位置
+        half = securityCount // 2
+        self.securityIds = ['%06d.SZ' % (i + 1) for i in range(half)] + \
+                           ['%06d.SH' % (600000 + i) for i in range(securityCount - half)]
+        self.indexIds = sorted(INDEX_WEIGHTS.keys())
+        self.codeOf = dict((securityId, i) for i, securityId in enumerate(self.securityIds + self.indexIds))
+        #上市、退市的日期序号：70%在日历开始前上市，5%在区间中退市
+        codes = np.arange(securityCount)
+        n = len(self.days)
+        self.listIdx = np.where(hashUniform(seed, codes, 11) < 0.7, 0,
+                                (hashUniform(seed, codes, 12) * n).astype(np.int64))
+        delist = self.listIdx + ((n - self.listIdx) * hashUniform(seed, codes, 14)).astype(np.int64)
+        self.delistIdx = np.where(hashUniform(seed, codes, 13) < 0.05, delist, n)
+        self.listIdx = np.concatenate([self.listIdx, np.zeros(len(self.indexIds), dtype=np.int64)])
+        self.delistIdx = np.concatenate([self.delistIdx, np.full(len(self.indexIds), n, dtype=np.int64)])
+        self.shares = np.round(10 ** (8 + 2 * hashUniform(seed, np.arange(len(self.codeOf)), 15)), -4)
+        self.__logClose = None
+
+    def getDataFeed(self, name):
+        if name not in FEED_NAMES:
+            raise BaseException("[SyntheticDataFeeds] Not support data feed: %s" % name)
+        return self
+
+    #----------------------------------------------------------------------
+    # 日历和股票池
+    def _getDayRange(self, beginDateTime, endDateTime):
+        #[beginDateTime, endDateTime] 覆盖的交易日序号
+        low = np.searchsorted(self.days, _toDay(beginDateTime), 'left')
+        high = np.searchsorted(self.days, _toDay(endDateTime), 'right')
+        return np.arange(low, high)
+
+    def _isListed(self, codes, dayIdx):
+        #(股票, 日期) 是否上市且未停牌
+        codes = np.asarray(codes)[:, None]
+        dayIdx = np.asarray(dayIdx)[None, :]
+        listed = (self.listIdx[codes] <= dayIdx) & (dayIdx < self.delistIdx[codes])
+        isIndex = codes >= len(self.securityIds)
+        return listed & (isIndex | (hashUniform(self.seed, codes, dayIdx, 21) >= 0.01))
+
+    def _getCodes(self, securityIds):
+        ids = [securityId for securityId in securityIds if securityId in self.codeOf]
+        return ids, np.array([self.codeOf[securityId] for securityId in ids], dtype=np.int64)
+
+    def getAShareCalendar(self, beginDateTime, endDateTime):
+        days = self.days[self._getDayRange(beginDateTime, endDateTime)]
+        return pd.DataFrame({'dateTime': days.astype('datetime64[ns]')})
+
+    def getAShareCodes(self, beginDateTime=None, endDateTime=None):
+        #区间内上市过的股票
+        low = 0 if beginDateTime is None else np.searchsorted(self.days, _toDay(beginDateTime), 'left')
+        high = len(self.days) if endDateTime is None else np.searchsorted(self.days, _toDay(endDateTime), 'right')
+        n = len(self.securityIds)
+        inRange = (self.listIdx[:n] < high) & (self.delistIdx[:n] > low)
+        return pd.DataFrame({'securityId': [self.securityIds[i] for i in np.nonzero(inRange)[0]]})
+
+    #----------------------------------------------------------------------
+    # 价格
+    def _getLogClose(self):
+        #全部日期的日收盘价（对数），按需计算一次
+        with self.lock:
+            if self.__logClose is None:
+                codes = np.arange(len(self.codeOf))[:, None]
+                dayIdx = np.arange(len(self.days))[None, :]
+                vol = 0.01 + 0.02 * hashUniform(self.seed, codes, 31)
+                returns = vol * hashNormal(self.seed, codes, dayIdx, 32)
+                base = np.log(5.0 + 45.0 * hashUniform(self.seed, codes, 33))
+                self.__logClose = base + np.cumsum(returns, axis=1)
+        return self.__logClose
+
+    def _getBarTimes(self, frequency):
+        #每天的bar结束时间（相对当天0点），日线为0点
+        if frequency >= 86400:
+            return np.array([0], dtype='timedelta64[s]')
+        perSession = max(7200 // frequency, 1)
+        step = np.arange(1, perSession + 1) * frequency
+        return np.concatenate([9 * 3600 + 1800 + step, 13 * 3600 + step]).astype('timedelta64[s]')
+
+    def _getCloses(self, codes, dayIdx, frequency):
+        """
+        #----------------------------------------------------------------------
+        # (股票, 日期, bar) 的收盘价，分钟线为前收盘到当天收盘的布朗桥
+        # @return  (closes, preCloses)，preClose为上一根bar的close
+        """
+        logClose = self._getLogClose()[codes]
+        last = logClose[:, dayIdx]
+        prev = np.where(dayIdx > 0, logClose[:, np.maximum(dayIdx - 1, 0)], last)
+        nBars = len(self._getBarTimes(frequency))
+        if nBars == 1:
+            logs = last[:, :, None]
+            preLogs = prev[:, :, None]
+        else:
+            k = np.arange(1, nBars + 1)[None, None, :]
+            steps = hashNormal(self.seed, codes[:, None, None], dayIdx[None, :, None], k, 41) * 0.002
+            walk = np.cumsum(steps, axis=2)
+            bridge = walk - walk[:, :, -1:] * k / float(nBars)
+            logs = prev[:, :, None] + (last - prev)[:, :, None] * k / float(nBars) + bridge
+            preLogs = np.concatenate([prev[:, :, None], logs[:, :, :-1]], axis=2)
+        return np.round(np.exp(logs), 2), np.round(np.exp(preLogs), 2)
+
+    def _getItem(self, item, codes, dayIdx, bars, closes, preCloses):
+        key = (self.seed, codes[:, None, None], dayIdx[None, :, None], bars[None, None, :])
+        if item == 'close':
+            return closes
+        if item in ['preClose', 'open']:
+            return preCloses
+        if item == 'high':
+            return np.round(np.maximum(closes, preCloses) * (1 + 0.005 * hashUniform(*(key + (51,)))), 2)
+        if item == 'low':
+            return np.round(np.minimum(closes, preCloses) * (1 - 0.005 * hashUniform(*(key + (52,)))), 2)
+        if item == 'volume':
+            return np.round(np.exp(8 + hashNormal(*(key + (53,)))), -2) + 100
+        if item == 'amount':
+            return self._getItem('volume', codes, dayIdx, bars, closes, preCloses) * closes
+        if item == 'spread':
+            return np.full(closes.shape, 0.01 * (1 + (hashUniform(*(key + (54,))) < 0.2)))
+        for j in range(1, ORDER_BOOK_LEVELS + 1):
+            if item == 'buy%d' % j:
+                return np.round(closes - 0.01 * j, 2)
+            if item == 'sale%d' % j:
+                return np.round(closes + 0.01 * j, 2)
+            if item in ['bc%d' % j, 'sc%d' % j]:
+                return np.round(np.exp(7 + hashNormal(*(key + (60 + j, len(item))))), -2) + 100
+        return hashNormal(*(key + (sum(ord(c) for c in item),)))
+
+    def getAShareQuotation(self, securityIds, items, frequency=86400, beginDateTime=None, endDateTime=None,
+                           adjusted=1, adjustedDate=None):
+        #合成数据没有除权，adjusted、adjustedDate不起作用
+        ids, codes = self._getCodes(securityIds)
+        dayIdx = self._getDayRange(beginDateTime, endDateTime)
+        barTimes = self._getBarTimes(frequency)
+        bars = np.arange(len(barTimes))
+        closes, preCloses = self._getCloses(codes, dayIdx, frequency)
+        #(日期, bar, 股票) 的顺序展开，即按dateTime、请求中的股票排列
+        stamps = (self.days[dayIdx].astype('datetime64[s]')[:, None] + barTimes[None, :]).astype('datetime64[ns]')
+        keep = np.broadcast_to(self._isListed(codes, dayIdx)[:, :, None], closes.shape).transpose(1, 2, 0)
+        inRange = (stamps >= np.datetime64(pd.Timestamp(beginDateTime))) & (stamps <= np.datetime64(pd.Timestamp(endDateTime)))
+        keep = keep & inRange[:, :, None]
+        data = {'dateTime': np.broadcast_to(stamps[:, :, None], keep.shape)[keep],
+                'securityId': np.broadcast_to(np.array(ids, dtype=object)[None, None, :], keep.shape)[keep]}
+        for item in items:
+            values = self._getItem(item, codes, dayIdx, bars, closes, preCloses)
+            data[item] = np.broadcast_to(values, closes.shape).transpose(1, 2, 0)[keep]
+        return pd.DataFrame(data, columns=['dateTime', 'securityId'] + list(items))
+
+    #----------------------------------------------------------------------
+    # 日度指标
+    def getAShareDayVars(self, dateTimeList, securityIds, items):
+        ids, codes = self._getCodes(securityIds)
+        days = np.array([_toDay(dt) for dt in dateTimeList], dtype='datetime64[D]')
+        dayIdx = np.searchsorted(self.days, days)
+        valid = (dayIdx < len(self.days)) & (self.days[np.minimum(dayIdx, len(self.days) - 1)] == days)
+        dayIdx = dayIdx[valid]
+        closes = np.round(np.exp(self._getLogClose()[codes][:, dayIdx]), 2)
+        keep = self._isListed(codes, dayIdx).T
+        data = {'dateTime': np.broadcast_to(days[valid].astype('datetime64[ns]')[:, None], keep.shape)[keep],
+                'securityId': np.broadcast_to(np.array(ids, dtype=object)[None, :], keep.shape)[keep]}
+        for item in items:
+            if item == 'marketValue':
+                values = closes * self.shares[codes][:, None]
+            elif item == 'totalMarketValue':
+                values = closes * self.shares[codes][:, None] * (1 + hashUniform(self.seed, codes, 71)[:, None])
+            elif item == 'turnover':
+                values = 0.005 + 0.05 * hashUniform(self.seed, codes[:, None], dayIdx[None, :], 72)
+            else:
+                values = 20 * np.exp(0.5 * hashNormal(self.seed, codes[:, None], dayIdx[None, :], sum(ord(c) for c in item)))
+            data[item] = values.T[keep]
+        return pd.DataFrame(data, columns=['dateTime', 'securityId'] + list(items))
+
+    #----------------------------------------------------------------------
+    # 指数成分
+    def _getConstituentMask(self, indexId):
+        n = len(self.securityIds)
+        weight = INDEX_WEIGHTS.get(indexId, 0.3)
+        return hashUniform(self.seed, np.arange(n), self.codeOf.get(indexId, 0), 81) < weight
+
+    def getAIndexConstituent(self, indexIds, beginDateTime=None, endDateTime=None):
+        #区间内出现过的成分股
+        inRange = set(self.getAShareCodes(beginDateTime, endDateTime)['securityId'])
+        frames = []
+        for indexId in indexIds:
+            ids = [self.securityIds[i] for i in np.nonzero(self._getConstituentMask(indexId))[0]
+                   if self.securityIds[i] in inRange]
+            frames.append(pd.DataFrame({'indexId': indexId, 'securityId': ids}, columns=['indexId', 'securityId']))
+        return pd.concat(frames, ignore_index=True)
+
+    def getBatchAIndexConstituent(self, dateTimeList, indexIds):
+        n = len(self.securityIds)
+        frames = []
+        for dateTime in dateTimeList:
+            dayIdx = self._getDayRange(dateTime, dateTime)
+            if len(dayIdx) == 0:
+                continue
+            listed = self._isListed(np.arange(n), dayIdx)[:, 0]
+            for indexId in indexIds:
+                ids = [self.securityIds[i] for i in np.nonzero(self._getConstituentMask(indexId) & listed)[0]]
+                frames.append(pd.DataFrame({'dateTime': pd.Timestamp(_toDay(dateTime)), 'indexId': indexId, 'securityId': ids},
+                                           columns=['dateTime', 'indexId', 'securityId']))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=['dateTime', 'indexId', 'securityId'])
+        return pd.concat(frames, ignore_index=True)
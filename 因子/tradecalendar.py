@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 本地缓存的交易日历。
+#
+# TradeFactorDemo 原来每次计算都从行情中取 000001.SH 的收盘价，只为得到交易时间点。
+# TradingCalendar 按频率缓存已取得的时间点（排序的datetime64数组）和已覆盖的区间：
+#     1) 查询的区间超出已覆盖的部分时，只向数据源取缺少的两端（多取readAhead天，
+#        逐日向后或向前计算时不必每天都取），结果合并；
+#     2) 查询都是在数组上二分（numpy.searchsorted）；
+#     3) 覆盖到今天及以后的区间，末端只记到已取得的最后一个时间点，之后的查询会补取，
+#        所以实盘中新的交易日会被取到；回测的历史区间取一次之后不再访问数据源。
+"""
+import datetime
+import threading
+import numpy as np
+import pandas as pd
+
+#A股第一个交易日，向前扩展时间点不超过此日期
+CALENDAR_BEGIN = datetime.datetime(1990, 12, 19)
+
+
+def _toDatetime64(dateTime):
+    return np.datetime64(pd.Timestamp(dateTime).to_datetime64(), 'ns')
+
+
+class TradingCalendar(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # loader: 函数 loader(frequency, beginDateTime, endDateTime)，返回区间内（含两端）
+    #         该频率的全部时间点，如 TradeFactorDemo._loadTradeBars
+    # readAhead: 每次向数据源多取的天数
+    #
+    # getBars(beginDateTime, endDateTime, frequency)   区间内（含两端）的时间点
+    # getLastBars(dateTime, n, frequency)               不晚于dateTime的最后n个时间点
+    # getOffsetBar(dateTime, n, frequency)              不晚于dateTime的最后一个时间点之前第n个
+    # refresh(frequency=None)                           清空缓存，下次查询时重新取
+    # 时间点都为numpy.datetime64[ns]的数组；可以在多个线程和多个因子间共用。
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, loader, readAhead=366):
+        self.loader = loader
+        self.readAhead = np.timedelta64(readAhead, 'D')
+        self.lock = threading.RLock()
+        self.bars = {}
+        self.coverage = {}
+        self.loads = 0
+
+    def _load(self, frequency, begin, end):
+        values = self.loader(frequency, pd.Timestamp(begin).to_pydatetime(), pd.Timestamp(end).to_pydatetime())
+        self.loads += 1
+        return pd.DatetimeIndex(values).values.astype('datetime64[ns]')
+
+    def ensure(self, beginDateTime, endDateTime, frequency):
+        #保证[beginDateTime, endDateTime]内该频率的时间点都已取得
+        begin, end = _toDatetime64(beginDateTime), _toDatetime64(endDateTime)
+        with self.lock:
+            floor = _toDatetime64(CALENDAR_BEGIN)
+            if frequency not in self.coverage:
+                low, high = max(begin - self.readAhead, floor), end + self.readAhead
+                parts = [self._load(frequency, low, high)]
+            else:
+                low, high = self.coverage[frequency]
+                if begin >= low and end <= high:
+                    return
+                parts = [self.bars[frequency]]
+                if begin < low:
+                    begin = max(begin - self.readAhead, floor)
+                    parts.append(self._load(frequency, begin, low))
+                    low = begin
+                if end > high:
+                    end = end + self.readAhead
+                    parts.append(self._load(frequency, high, end))
+                    high = end
+            bars = np.unique(np.concatenate(parts))
+            #今天及以后的时间点可能还没有，末端只记到已取得的部分
+            today = _toDatetime64(datetime.date.today())
+            if high >= today:
+                known = bars[bars < today]
+                high = max(known[-1], low) if len(known) > 0 else low
+            self.bars[frequency] = bars
+            self.coverage[frequency] = (low, high)
+
+    def getBars(self, beginDateTime, endDateTime, frequency):
+        #ensure之后在同一把锁内取数组，其他线程的refresh不会在两步之间清空缓存
+        with self.lock:
+            self.ensure(beginDateTime, endDateTime, frequency)
+            bars = self.bars[frequency]
+        lo = bars.searchsorted(_toDatetime64(beginDateTime), side='left')
+        hi = bars.searchsorted(_toDatetime64(endDateTime), side='right')
+        return bars[lo:hi]
+
+    def getLastBars(self, dateTime, n, frequency):
+        #先按每天的时间点数估计需要的区间，不够时向前加倍扩展
+        barsPerDay = max(14400 // frequency, 1)
+        days = int(n // barsPerDay) * 2 + 20
+        while True:
+            begin = max(pd.Timestamp(dateTime) - pd.Timedelta(days=days), pd.Timestamp(CALENDAR_BEGIN))
+            bars = self.getBars(begin, dateTime, frequency)
+            if len(bars) >= n:
+                return bars[len(bars) - n:]
+            if begin <= pd.Timestamp(CALENDAR_BEGIN):
+                raise BaseException("[TradingCalendar] Only %d bars before %s, less than %d." % (len(bars), dateTime, n))
+            days *= 2
+
+    def getOffsetBar(self, dateTime, n, frequency):
+        return self.getLastBars(dateTime, n + 1, frequency)[0]
+
+    def refresh(self, frequency=None):
+        with self.lock:
+            for key in (list(self.coverage.keys()) if frequency is None else [frequency]):
+                self.coverage.pop(key, None)
+                self.bars.pop(key, None)
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+#coding=utf-8
+"""
+#------------------------------------------------------------------------------
+#----Python File Instruction---------------------------------------------------
+#------------------------------------------------------------------------------
+# 时点股票池（point-in-time universe）的本地缓存。
+#
+# TradeFactorDemo 每次计算都从数据源取当天的股票列表。UniverseStore 在内存中保存
+# 每只股票在池中的区间 [start, end]（按日，含两端），查询某日的股票池只是数组比较，
+# 结果再按日缓存：
+#     1) build(dateTimeList): 对一段历史的交易日各取一次股票列表，按相邻交易日是否都在池中
+#        合并为区间（即上市、退市或调出调入）；之后这段历史内的查询不再访问数据源；
+#        多次build的区间和覆盖范围累加；
+#     2) fromIntervals(frame): 数据源直接提供上市、退市日期时，由区间建立；
+#     3) 区间以外的日期，取一次数据源并缓存该日的股票列表；
+#     4) setSuspended(frame): 停牌标记，查询时可以去掉停牌的股票；
+#     5) 股票代码与整数编号一一对应（getCodes、getSecurityIds），编号只增不变，
+#        供按数组计算的引擎使用；save、load 把股票池保存到本地文件；
+#     6) loader返回的securityId以外的列（如股票简称）按股票保存最近一次取得的值，
+#        getUniverse的结果带这些列，与直接从数据源取的列相同；这些列不保存到本地文件。
+"""
+import threading
+import numpy as np
+import pandas as pd
+
+
+def _toDay(dateTime):
+    return np.datetime64(pd.Timestamp(dateTime).normalize().to_datetime64(), 'D')
+
+
+class UniverseStore(object):
+    """
+    #--------------------------------------------------------------------------
+    #----Class Instruction----------------------------------------------------
+    #--------------------------------------------------------------------------
+    # loader: 函数 loader(dateTime)，返回当天的股票列表 DataFrame ['securityId', ...]，
+    #         如 TradeFactorDemo._loadStockCode；None时只能查询已有的数据
+    #
+    # getUniverse(dateTime, excludeSuspended=False)  DataFrame ['securityId', loader的其他列]，按代码排序
+    # getUniverseCodes(dateTime, excludeSuspended=False)  整数编号的数组
+    # getCodes(securityIds) / getSecurityIds(codes)  代码与编号的转换，未知代码为-1
+    #--------------------------------------------------------------------------
+    """
+    def __init__(self, loader=None):
+        self.loader = loader
+        self.lock = threading.RLock()
+        self.securityIds = []
+        self.codeOf = {}
+        self.intervalCodes = np.zeros(0, dtype=np.int64)
+        self.starts = np.zeros(0, dtype='datetime64[D]')
+        self.ends = np.zeros(0, dtype='datetime64[D]')
+        self.coverage = []
+        self.snapshots = {}
+        self.suspended = {}
+        self.details = None
+        self.cache = {}
+        self.loads = 0
+
+    #----------------------------------------------------------------------
+    # 代码与整数编号
+    def _register(self, securityIds):
+        codes = np.empty(len(securityIds), dtype=np.int64)
+        for i, securityId in enumerate(securityIds):
+            code = self.codeOf.get(securityId)
+            if code is None:
+                code = len(self.securityIds)
+                self.codeOf[securityId] = code
+                self.securityIds.append(securityId)
+            codes[i] = code
+        return codes
+
+    def getCodes(self, securityIds):
+        return np.array([self.codeOf.get(securityId, -1) for securityId in securityIds], dtype=np.int64)
+
+    def getSecurityIds(self, codes):
+        return np.array(self.securityIds, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+    def getSecurityCount(self):
+        return len(self.securityIds)
+
+    #----------------------------------------------------------------------
+    # 建立区间
+    def _loadSnapshot(self, dateTime):
+        data = self.loader(dateTime)
+        self.loads += 1
+        self._addDetails(data)
+        return np.unique(self._register(list(data['securityId'])))
+
+    def _addDetails(self, data):
+        #securityId以外的列，以securityId为索引，新取得的行覆盖原有的行
+        columns = [column for column in data.columns if column != 'securityId']
+        if len(columns) == 0:
+            return
+        details = data.drop_duplicates('securityId', keep='last').set_index('securityId')[columns]
+        if self.details is not None:
+            details = pd.concat([self.details[~self.details.index.isin(details.index)], details])
+        self.details = details
+
+    def build(self, dateTimeList):
+        """
+        #----------------------------------------------------------------------
+        # 由一段历史每个交易日的股票列表建立区间，已取过的日期不再取
+        # @param dateTimeList: type: List，这段历史的全部交易日
+        """
+        days = sorted(set(_toDay(dt) for dt in dateTimeList))
+        if len(days) == 0:
+            return
+        with self.lock:
+            dateTimes = dict((_toDay(dt), dt) for dt in dateTimeList)
+            snapshots = []
+            for day in days:
+                if day not in self.snapshots:
+                    self.snapshots[day] = self._loadSnapshot(dateTimes[day])
+                snapshots.append(self.snapshots[day])
+            # 股票×交易日 的在池矩阵，按行找连续为True的段
+            member = np.zeros((len(self.securityIds), len(days) + 2), dtype=np.int8)
+            for j, codes in enumerate(snapshots):
+                member[codes, j + 1] = 1
+            change = np.diff(member, axis=1)
+            startCodes, startIdx = np.nonzero(change == 1)
+            endCodes, endIdx = np.nonzero(change == -1)
+            days = np.array(days, dtype='datetime64[D]')
+            self._addIntervals(startCodes, days[startIdx], days[endIdx - 1], (days[0], days[-1]))
+
+    def fromIntervals(self, frame, coverage=None):
+        """
+        #----------------------------------------------------------------------
+        # 由上市、退市日期建立区间
+        # @param frame: type: DataFrame ['securityId','listDate','delistDate']，未退市的delistDate为空；
+        #               一只股票可以有多行（多次调入调出）
+        # @param coverage: type: (beginDateTime, endDateTime)，区间可信的范围，默认为最早的上市日到今天
+        """
+        with self.lock:
+            codes = self._register(list(frame['securityId']))
+            starts = pd.DatetimeIndex(frame['listDate']).values.astype('datetime64[D]')
+            ends = pd.DatetimeIndex(frame['delistDate']).values.astype('datetime64[D]')
+            ends = np.where(np.isnat(ends), np.datetime64('2200-01-01', 'D'), ends)
+            if coverage is None:
+                coverage = (starts.min(), _toDay(pd.Timestamp.today()))
+            self._addIntervals(codes, starts, ends, (_toDay(coverage[0]), _toDay(coverage[1])))
+
+    def _addIntervals(self, codes, starts, ends, coverage):
+        #区间可以重复（多次build的范围重叠），查询时按编号去重
+        self.intervalCodes = np.concatenate([self.intervalCodes, np.asarray(codes, dtype=np.int64)])
+        self.starts = np.concatenate([self.starts, np.asarray(starts, dtype='datetime64[D]')])
+        self.ends = np.concatenate([self.ends, np.asarray(ends, dtype='datetime64[D]')])
+        self.coverage.append(coverage)
+        self.cache = {}
+
+    def isCovered(self, dateTime):
+        day = _toDay(dateTime)
+        return day in self.snapshots or any(low <= day <= high for low, high in self.coverage)
+
+    def getIntervals(self):
+        #DataFrame ['securityId','start','end']
+        return pd.DataFrame({'securityId':self.getSecurityIds(self.intervalCodes),
+                             'start':self.starts.astype('datetime64[ns]'),
+                             'end':self.ends.astype('datetime64[ns]')}, columns=['securityId', 'start', 'end'])
+
+    #----------------------------------------------------------------------
+    # 停牌
+    def setSuspended(self, frame):
+        #frame: DataFrame ['dateTime','securityId']，停牌的股票
+        with self.lock:
+            codes = self._register(list(frame['securityId']))
+            days = pd.DatetimeIndex(frame['dateTime']).normalize().values.astype('datetime64[D]')
+            for day, group in pd.Series(codes).groupby(days):
+                self.suspended[np.datetime64(day, 'D')] = np.unique(group.values)
+            self.cache = {}
+
+    def isSuspended(self, dateTime, securityId):
+        codes = self.suspended.get(_toDay(dateTime))
+        return codes is not None and self.codeOf.get(securityId, -1) in codes
+
+    #----------------------------------------------------------------------
+    # 查询
+    def getUniverseCodes(self, dateTime, excludeSuspended=False):
+        day = _toDay(dateTime)
+        key = (day, excludeSuspended)
+        codes = self.cache.get(key)
+        if codes is not None:
+            return codes
+        with self.lock:
+            if day in self.snapshots:
+                codes = self.snapshots[day]
+            elif any(low <= day <= high for low, high in self.coverage):
+                inside = (self.starts <= day) & (day <= self.ends)
+                codes = np.unique(self.intervalCodes[inside])
+            elif self.loader is not None:
+                codes = self.snapshots[day] = self._loadSnapshot(dateTime)
+            else:
+                raise BaseException("[UniverseStore] No universe on %s." % dateTime)
+            if excludeSuspended and day in self.suspended:
+                codes = np.setdiff1d(codes, self.suspended[day])
+            #按代码排序
+            codes = codes[np.argsort(self.getSecurityIds(codes), kind='mergesort')] if len(codes) > 0 else codes
+            self.cache[key] = codes
+        return codes
+
+    def getUniverse(self, dateTime, excludeSuspended=False):
+        universe = pd.DataFrame({'securityId':self.getSecurityIds(self.getUniverseCodes(dateTime, excludeSuspended))})
+        details = self.details
+        if details is not None:
+            universe = universe.join(details, on='securityId')
+        return universe
+
+    #----------------------------------------------------------------------
+    # 保存到本地文件
+    def save(self, path):
+        with self.lock:
+            snapshotDays = sorted(self.snapshots.keys())
+            suspendedDays = sorted(self.suspended.keys())
+            np.savez(path,
+                     securityIds=np.array([u'%s' % s for s in self.securityIds]),
+                     intervalCodes=self.intervalCodes, starts=self.starts, ends=self.ends,
+                     coverage=np.array(self.coverage, dtype='datetime64[D]').reshape(-1, 2),
+                     snapshotDays=np.array(snapshotDays, dtype='datetime64[D]'),
+                     snapshotSizes=np.array([len(self.snapshots[d]) for d in snapshotDays], dtype=np.int64),
+                     snapshotCodes=np.concatenate([self.snapshots[d] for d in snapshotDays] + [np.zeros(0, dtype=np.int64)]),
+                     suspendedDays=np.array(suspendedDays, dtype='datetime64[D]'),
+                     suspendedSizes=np.array([len(self.suspended[d]) for d in suspendedDays], dtype=np.int64),
+                     suspendedCodes=np.concatenate([self.suspended[d] for d in suspendedDays] + [np.zeros(0, dtype=np.int64)]))
+
+    @classmethod
+    def load(cls, path, loader=None):
+        store = cls(loader)
+        with np.load(path, allow_pickle=False) as data:
+            store.securityIds = [str(s) for s in data['securityIds']]
+            store.codeOf = dict((s, i) for i, s in enumerate(store.securityIds))
+            store.intervalCodes = data['intervalCodes']
+            store.starts = data['starts']
+            store.ends = data['ends']
+            store.coverage = [(low, high) for low, high in data['coverage']]
+            for name, target in [('snapshot', store.snapshots), ('suspended', store.suspended)]:
+                offsets = np.concatenate([[0], np.cumsum(data[name + 'Sizes'])])
+                codes = data[name + 'Codes']
+                for i, day in enumerate(data[name + 'Days']):
+                    target[day] = codes[offsets[i]:offsets[i + 1]]
+        return store
@@ -4,15 +4,17 @@ import pickle
 import datetime
 import pandas as pd
 from datafeeds import DataFeeds
-dataSource = DataFeeds()
-AIndexConstituent= dataSource.getDataFeed('AIndexConstituent')
-AShareQuotation = dataSource.getDataFeed('AShareQuotation')
-AShareVars = dataSource.getDataFeed("AShareVars")
+from portmgr_Q.factor.feedcache import CachedDataFeeds
 
 indexIds=['000016.SH','000300.SH','000905.SH','000906.SH']#上证50、沪深300、中证500、中证800:
 begindate=datetime.datetime(2003,1,1)
 enddate=datetime.datetime(2019,11,30)
 down_path='E:\\MarketTiming\\data\\'
+#数据源的返回值录制在本地，再次运行时相同的请求直接回放；mode='replay'时不访问数据源
+dataSource = CachedDataFeeds(DataFeeds(), path=down_path + 'feedCache', mode='auto')
+AIndexConstituent= dataSource.getDataFeed('AIndexConstituent')
+AShareQuotation = dataSource.getDataFeed('AShareQuotation')
+AShareVars = dataSource.getDataFeed("AShareVars")
 
 
 datelist = AShareQuotation.getAShareQuotation(securityIds=['000001.SH'],